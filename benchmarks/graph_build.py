@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the construction of a call graph description via the
+pygraphviz interface, node by node, and via the native DOT format
+writer, for traces with 10^3, 10^4, and 10^5 distinct calling and
+called function pairs. The Graphviz layout program is not run. Run
+from the root directory of the package by
+
+    python benchmarks/graph_build.py
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+import pygraphviz as pgv
+
+from trace_store import make_workload
+
+
+def agraph(ct):
+    """Construct a call graph node by node via the pygraphviz interface,
+    as was done by CallTracer.graph prior to the introduction of the
+    native DOT writer."""
+
+    clrlst = ct._clrgen(len(ct.group), 0.330, 0.825)
+    g = pgv.AGraph(strict=False, directed=True, landscape=False,
+                   rankdir='LR', newrank=True, ratio='compress',
+                   color='black', bgcolor='#ffffff00')
+    g.node_attr.update(penwidth=0.25, shape='box', style='rounded,filled')
+    fncts = ct.fncts
+    for k in fncts:
+        g.add_node(k)
+        if fncts[k][1] == 0:
+            g.get_node(k).attr.update(rank='source')
+    fngrpnm = {}
+    for k in zip(range(len(ct.group)), sorted(ct.group)):
+        g.add_subgraph(ct.group[k[1]], name='cluster_' + k[1],
+                       label=k[1], penwidth=2, style='dotted',
+                       pencolor=clrlst[k[0]])
+        for l in ct.group[k[1]]:
+            fngrpnm[l] = k[0]
+            g.get_node(l).attr.update(fillcolor=clrlst[k[0]])
+    for k in ct.calls:
+        g.add_edge(k[0], k[1], penwidth=2, color=clrlst[fngrpnm[k[0]]])
+    return g
+
+
+
+def timed(fn, *args):
+    """Return the minimum run time of a function over three runs."""
+
+    tmin = None
+    for n in range(3):
+        t0 = time.perf_counter()
+        fn(*args)
+        t = time.perf_counter() - t0
+        tmin = t if tmin is None else min(t, tmin)
+    return tmin
+
+
+
+if __name__ == "__main__":
+
+    print('%8s  %12s  %12s  %12s' % ('edges', 'AGraph (s)', 'dot (s)',
+                                     'dot+parse (s)'))
+    for nsrc in (10, 100, 1000):
+        mod = make_workload(nsrc, 100)
+        ct = jonga.CallTracer(srcmodflt='^bmkstore',
+                              grpflt=r'^bmkstore\.\w')
+        ct.start()
+        mod.driver()
+        ct.stop()
+        t0 = timed(agraph, ct)
+        t1 = timed(ct.dot)
+        t2 = timed(lambda: pgv.AGraph(string=ct.dot()))
+        print('%8d  %12.3e  %12.3e  %12.3e' % (len(ct.calls), t0, t1, t2))
+        del sys.modules['bmkstore']
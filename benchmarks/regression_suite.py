@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for tracking performance across commits, measuring the
+per-event overhead of call tracing for a selection of filter
+configurations and backends, the per-event cost of function resolution
+by ``current_function``, the memory used per recorded call, and the
+time to build, lay out, and draw call graphs of different sizes.
+
+The workload is a generated module containing a class hierarchy like
+that of ``examples/xmpl.py``, replicated to give thousands of classes.
+The results of each run are appended, together with the commit id and
+platform, to a file of results (one JSON record per line), and are
+compared with those of the most recent previous run on the same
+platform, with ratios exceeding the threshold marked as regressions.
+The stored results of a metric for all runs can be displayed via
+option ``--history``. With the default workload sizes, which can be
+selected via options ``--ncls`` and ``--sizes``, a run takes several
+minutes, most of which is spent on the first resolution of each of the
+functions of the workload. Run from the root directory of the package by
+
+    python benchmarks/regression_suite.py
+"""
+
+import sys
+import os
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+
+from trace_resolution import call_frames, import_source
+from trace_store import store_size
+
+
+hierarchy = '''
+class A{k}(object):
+
+    def __init__(self):
+        self.a = 0
+
+    def run(self):
+        self.step1()
+        self.step2()
+
+    def step1(self):
+        self.sb1()
+
+    def step2(self):
+        self.sb2()
+
+
+class B1_{k}(A{k}):
+
+    def __init__(self):
+        super(B1_{k}, self).__init__()
+        self.b1 = 1
+
+    def step1(self):
+        super(B1_{k}, self).step1()
+
+    def sb1(self):
+        self.b1 += 1
+
+
+class B2_{k}(A{k}):
+
+    def __init__(self):
+        super(B2_{k}, self).__init__()
+        self.b2 = 2
+
+    def step2(self):
+        super(B2_{k}, self).step2()
+
+    def sb2(self):
+        self.b2 += 1
+
+
+class C{k}(B1_{k}, B2_{k}):
+
+    def __init__(self):
+        super(C{k}, self).__init__()
+        self.c = 3
+
+    def step1(self):
+        super(C{k}, self).step1()
+
+    def step2(self):
+        super(C{k}, self).step2()
+
+'''
+
+
+def make_hierarchy(ncls):
+    """Construct a module containing `ncls` classes, consisting of
+    copies of the four class hierarchy of ``examples/xmpl.py``, and a
+    driver function that constructs an instance of the most derived
+    class of each copy and calls its ``run`` method."""
+
+    nh = max(ncls // 4, 1)
+    src = ''.join([hierarchy.format(k=k) for k in range(nh)])
+    src += 'def driver():\n'
+    src += '    for cls in (%s, ):\n' % ', '.join(['C%d' % k for k in
+                                                   range(nh)])
+    src += '        cls().run()\n'
+    return import_source('bmkhier%d' % ncls, src)
+
+
+def timed(fn, repeat=3):
+    """Return the minimum run time of a function over `repeat` runs."""
+
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def trace_configs(mod):
+    """Get the filter configurations for the tracing overhead
+    benchmark."""
+
+    name = mod.__name__
+    return {
+        'no filter': {},
+        'module filter': {'srcmodflt': '^' + name},
+        'qname filter': {'srcmodflt': '^' + name, 'dstqnmflt': r'\.step'},
+        'fnmsub and grpflt': {'srcmodflt': '^' + name,
+                              'fnmsub': ('^' + name + '.', ''),
+                              'grpflt': r'^%s\.[A-Z]+' % name},
+        'irrelevant': {'srcmodflt': '^xmpl'},
+    }
+
+
+def bench_trace(mod, res):
+    """Measure the per-event overhead of tracing the workload for each
+    filter configuration and backend."""
+
+    nevt = len(call_frames(mod))
+    t0 = timed(mod.driver, repeat=5)
+    res['trace untraced (s/event)'] = t0 / nevt
+    backends = ['settrace', ]
+    if hasattr(sys, 'monitoring'):
+        backends.append('monitoring')
+    for backend in backends:
+        for name, kwargs in trace_configs(mod).items():
+            ct = jonga.CallTracer(backend=backend, **kwargs)
+            ct.start()
+            # The first pass populates the filter caches
+            t = timed(mod.driver, repeat=5)
+            ct.stop()
+            res['trace %s %s (s/event)' % (backend, name)] = \
+                (t - t0) / nevt
+
+
+def bench_resolve(mod, res, nsample=500):
+    """Measure the per-event cost of resolution of the caller and
+    called functions of each call by ``current_function``."""
+
+    frames = call_frames(mod)
+
+    def resolve(frames, cache):
+        for frame in frames:
+            jonga.current_function(frame.f_back, cache)
+            jonga.current_function(frame, cache)
+
+    # Uncached resolution requires a search of the heap for each event,
+    # so it is only measured for a sample of the events
+    smpl = frames[0:nsample]
+    res['resolve uncached (s/event)'] = timed(
+        lambda: resolve(smpl, None), repeat=1) / len(smpl)
+    cache = {}
+    res['resolve cache miss (s/event)'] = timed(
+        lambda: resolve(frames, cache), repeat=1) / len(frames)
+    res['resolve cache hit (s/event)'] = timed(
+        lambda: resolve(frames, cache)) / len(frames)
+
+
+def bench_memory(mod, res):
+    """Measure the memory used by the record of calls per distinct
+    recorded calling and called function pair."""
+
+    ct = jonga.CallTracer(srcmodflt='^' + mod.__name__)
+    ct.start()
+    mod.driver()
+    ct.stop()
+    # Ensure that the function count arrays are included
+    ct.fncts
+    res['memory (bytes/edge)'] = store_size(ct) / len(ct.calls)
+
+
+def bench_graph(sizes, res, prog):
+    """Measure the time to build call graph descriptions of different
+    sizes, and, if the Graphviz layout program is available, to lay
+    out and draw them."""
+
+    try:
+        import pygraphviz
+    except ImportError:
+        pygraphviz = None
+    for ncls in sizes:
+        mod = make_hierarchy(ncls)
+        name = mod.__name__
+        ct = jonga.CallTracer(srcmodflt='^' + name,
+                              fnmsub=('^' + name + '.', ''),
+                              grpflt=r'^%s\.[A-Z]+' % name)
+        ct.start()
+        mod.driver()
+        ct.stop()
+        res['graph %d classes build dot (s)' % ncls] = timed(ct.dot)
+        if pygraphviz is not None:
+            res['graph %d classes build pygraphviz (s)' % ncls] = \
+                timed(ct.graph)
+        if prog is not None:
+            src = ct.dot()
+            res['graph %d classes layout (s)' % ncls] = timed(
+                lambda: jonga._run_layout(prog, 'dot', src), repeat=1)
+            with tempfile.TemporaryDirectory() as tmp:
+                pth = os.path.join(tmp, 'graph.svg')
+                res['graph %d classes draw (s)' % ncls] = timed(
+                    lambda: ct.dot(pth, prog=prog), repeat=1)
+
+
+def commit_id():
+    """Get the id of the current commit, and whether there are
+    uncommitted changes, if the package is in a git repository."""
+
+    root = os.path.join(os.path.dirname(__file__), '..')
+    try:
+        cid = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             cwd=root, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL,
+                             check=True).stdout.decode().strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain',
+                                '--untracked-files=no'], cwd=root,
+                               stdout=subprocess.PIPE,
+                               check=True).stdout.strip() != b''
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cid + ('+' if dirty else '')
+
+
+def platform_id():
+    """Get a description of the platform, which determines which stored
+    results are comparable."""
+
+    return '%s %s %s' % (platform.python_implementation(),
+                         platform.python_version(), platform.machine())
+
+
+def load_results(pth):
+    """Load the stored results of previous runs."""
+
+    if not os.path.exists(pth):
+        return []
+    with open(pth) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def report(res, prev, threshold):
+    """Print results, with the ratio of each to that of the previous
+    run if there is one, marking ratios exceeding the threshold."""
+
+    if prev is not None:
+        print('Compared with commit %s (%s)\n' % (prev['commit'],
+                                                  prev['date']))
+    for key, val in res.items():
+        line = '%-48s %10.3e' % (key, val)
+        if prev is not None and prev['results'].get(key):
+            ratio = val / prev['results'][key]
+            line += '  %6.2fx' % ratio
+            if ratio > threshold:
+                line += '  REGRESSION'
+        print(line)
+
+
+def history(runs, pattern):
+    """Print the stored results of all runs for metrics containing the
+    pattern string."""
+
+    keys = []
+    for run in runs:
+        keys.extend([k for k in run['results'] if pattern in k and
+                     k not in keys])
+    for key in keys:
+        print(key)
+        for run in runs:
+            if key in run['results']:
+                print('  %-10s %-20s %-28s %10.3e' % (
+                    run['commit'], run['date'], run['platform'],
+                    run['results'][key]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Run the jonga '
+                                     'benchmark suite.')
+    parser.add_argument('--ncls', type=int, default=2000,
+                        help='number of classes in the tracing workload')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[40, 400, 2000],
+                        help='numbers of classes in the graph workloads')
+    parser.add_argument('--only', nargs='+',
+                        choices=('trace', 'resolve', 'memory', 'graph'),
+                        default=('trace', 'resolve', 'memory', 'graph'),
+                        help='benchmarks to run')
+    parser.add_argument('--prog', default='dot',
+                        help='Graphviz layout program')
+    parser.add_argument('--results', default=os.path.join(
+        os.path.dirname(__file__), 'results.jsonl'),
+                        help='file of stored results')
+    parser.add_argument('--no-save', action='store_true',
+                        help='do not store the results of this run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio to previous result marked as a '
+                        'regression')
+    parser.add_argument('--history', metavar='PATTERN',
+                        help='display stored results of metrics with '
+                        'names containing PATTERN instead of running')
+    args = parser.parse_args()
+
+    runs = load_results(args.results)
+    if args.history is not None:
+        history(runs, args.history)
+        sys.exit(0)
+
+    res = {}
+    mod = make_hierarchy(args.ncls)
+    if 'trace' in args.only:
+        bench_trace(mod, res)
+    if 'resolve' in args.only:
+        bench_resolve(mod, res)
+    if 'memory' in args.only:
+        bench_memory(mod, res)
+    if 'graph' in args.only:
+        prog = args.prog if shutil.which(args.prog) else None
+        bench_graph(args.sizes, res, prog)
+
+    run = {'commit': commit_id(), 'date': time.strftime('%Y-%m-%d %H:%M'),
+           'platform': platform_id(), 'results': res}
+    prev = None
+    for r in reversed(runs):
+        if r['platform'] == run['platform']:
+            prev = r
+            break
+    report(res, prev, args.threshold)
+    if not args.no_save:
+        with open(args.results, 'a') as fd:
+            fd.write(json.dumps(run) + '\n')
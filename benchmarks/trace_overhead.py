@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the per-event overhead of call tracing for a tight loop
+of calls of a small number of hot functions, for a selection of filter
+configurations. Run from the root directory of the package by
+
+    python benchmarks/trace_overhead.py
+"""
+
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+
+
+def inner(x):
+    return x + 1
+
+
+def outer(x):
+    return inner(x) + inner(x)
+
+
+def loop(n):
+    for k in range(n):
+        outer(k)
+
+
+
+configs = {
+    'no filter': {},
+    'module filter': {'srcmodflt': '^__main__'},
+    'qname filter': {'srcmodflt': '^__main__', 'dstqnmflt': '^inner'},
+    'fnmsub and grpflt': {'srcmodflt': '^__main__',
+                          'fnmsub': ('^__main__.', ''),
+                          'grpflt': r'^[^\.]*'},
+}
+
+
+
+if __name__ == "__main__":
+
+    n = 100000
+    # Three function calls per loop iteration
+    nevt = 3 * n
+    t0 = min(timeit.repeat(lambda: loop(n), number=1, repeat=5))
+    print('%-20s %.2e s/event' % ('untraced', t0 / nevt))
+    for name, kwargs in configs.items():
+        ct = jonga.CallTracer(**kwargs)
+        ct.start()
+        t = min(timeit.repeat(lambda: loop(n), number=1, repeat=5))
+        ct.stop()
+        print('%-20s %.2e s/event  (overhead %.2e s/event)' %
+              (name, t / nevt, (t - t0) / nevt))
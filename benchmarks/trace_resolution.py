@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the per-event cost of function resolution during call
+tracing, with and without the code object resolution cache.
+
+The workload consists of a generated module containing several thousand
+distinct functions, each of which is called from a common driver
+function. The first pass with the cache populates it, so that its cost
+is that of uncached resolution, while the second pass measures the cost
+once all code objects have been seen. Run from the root directory of the
+package by
+
+    python benchmarks/trace_resolution.py
+"""
+
+import sys
+import os
+import importlib
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+
+
+def import_source(name, src):
+    """Import a module with name `name` and source `src`. The module is
+    written to a file and imported so that module name lookup by source
+    file name works as for an ordinary module. The file is removed once
+    it has been imported."""
+
+    with tempfile.TemporaryDirectory() as pth:
+        with open(os.path.join(pth, name + '.py'), 'w') as fd:
+            fd.write(src)
+        sys.path.insert(0, pth)
+        try:
+            return importlib.import_module(name)
+        finally:
+            sys.path.remove(pth)
+
+
+
+def make_workload(nfnc):
+    """Construct a module containing `nfnc` distinct functions and a
+    driver function that calls each of them."""
+
+    src = ''.join(['def f%d(x):\n    return x + %d\n\n' % (n, n)
+                   for n in range(nfnc)])
+    src += 'def driver():\n'
+    src += ''.join(['    f%d(0)\n' % n for n in range(nfnc)])
+    return import_source('bmkmod%d' % nfnc, src)
+
+
+
+def call_frames(mod):
+    """Get the stack frames of all function calls made by the workload
+    driver function."""
+
+    frames = []
+    def trace(frame, event, arg):
+        if event == 'call':
+            frames.append(frame)
+    sys.settrace(trace)
+    mod.driver()
+    sys.settrace(None)
+    return frames
+
+
+
+def resolve_time(frames, cache):
+    """Time resolution of the caller and called functions of each of
+    the call frames in `frames`."""
+
+    t0 = timeit.default_timer()
+    for frame in frames:
+        jonga.current_function(frame.f_back, cache)
+        jonga.current_function(frame, cache)
+    return timeit.default_timer() - t0
+
+
+
+if __name__ == "__main__":
+
+    for nfnc in (1000, 4000):
+        mod = make_workload(nfnc)
+        frames = call_frames(mod)
+        nevt = len(frames)
+        t = resolve_time(frames, None)
+        print('%5d events: uncached  %.2e s/event' % (nevt, t / nevt))
+        cache = {}
+        t = resolve_time(frames, cache)
+        print('%5d events: cache miss %.2e s/event' % (nevt, t / nevt))
+        t = resolve_time(frames, cache)
+        print('%5d events: cache hit  %.2e s/event' % (nevt, t / nevt))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the slowdown due to call tracing of the regex compilation
+workload used in the tests, for filter configurations under which most
+calls are relevant and under which none are. Run from the root
+directory of the package by
+
+    python benchmarks/trace_slowdown.py
+"""
+
+import sys
+import os
+import re
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+
+
+def workload():
+    for n in range(100):
+        re.purge()
+        re.compile(r'^[^\.]*.[^\.]*')
+
+
+
+configs = {
+    'relevant': {'dstmodflt': '^(re.|sre_)'},
+    'irrelevant': {'srcmodflt': '^xmpl'},
+}
+
+
+
+if __name__ == "__main__":
+
+    t0 = min(timeit.repeat(workload, number=1, repeat=20))
+    print('%-20s %.2e s' % ('untraced', t0))
+    for backend in ('settrace', 'monitoring'):
+        for name, kwargs in configs.items():
+            ct = jonga.CallTracer(backend=backend, **kwargs)
+            ct.start()
+            t = min(timeit.repeat(workload, number=1, repeat=20))
+            ct.stop()
+            print('%-20s %.2e s  (slowdown %.1fx)' %
+                  ('%s %s' % (ct.backend, name), t, t / t0))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the memory used by the record of calls and of the
+per-event cost of tracing for a trace with 10^5 distinct calling and
+called function pairs. Run from the root directory of the package by
+
+    python benchmarks/trace_store.py
+"""
+
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import jonga
+
+from trace_resolution import import_source
+
+
+def make_workload(nsrc, ndst):
+    """Construct a module containing `nsrc` functions, each of which
+    calls all of `ndst` other functions, and a driver function that
+    calls each of the former."""
+
+    src = ''.join(['def f%d():\n    pass\n\n' % n for n in range(ndst)])
+    for m in range(nsrc):
+        src += 'def g%d():\n' % m
+        src += ''.join(['    f%d()\n' % n for n in range(ndst)])
+        src += '\n'
+    src += 'def driver():\n'
+    src += ''.join(['    g%d()\n' % m for m in range(nsrc)])
+    return import_source('bmkstore', src)
+
+
+
+def deep_size(obj, seen):
+    """Estimate the memory used by a container and its contents,
+    excluding strings, which are shared with the rest of the program."""
+
+    if id(obj) in seen or isinstance(obj, str):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            size += deep_size(v, seen)
+    return size
+
+
+
+def store_size(ct):
+    """Estimate the memory used by the record of calls of a call
+    tracer."""
+
+    seen = set()
+    if hasattr(ct, '_edges'):
+        objs = (ct._names, ct._nodeid, ct._edges, ct._nsrc, ct._ndst)
+    else:
+        objs = (ct.fncts, ct.calls)
+    return sum([deep_size(obj, seen) for obj in objs])
+
+
+
+if __name__ == "__main__":
+
+    nsrc, ndst = 1000, 100
+    mod = make_workload(nsrc, ndst)
+    ct = jonga.CallTracer(srcmodflt='^bmkstore')
+    ct.start()
+    # The first pass populates the filter caches
+    t = min(timeit.repeat(mod.driver, number=1, repeat=5))
+    ct.stop()
+    nevt = nsrc * (ndst + 1)
+    print('%d distinct calls' % len(ct.calls))
+    print('record memory  %.1f MB (%.0f bytes/call)' %
+          (store_size(ct) / 2**20, store_size(ct) / len(ct.calls)))
+    print('tracing cost   %.2e s/event' % (t / nevt))
@@ -6,14 +6,28 @@
 
 import os
 import gc
+import hashlib
+import heapq
 import inspect
+import itertools
 import re
+import struct
 import sys
+import atexit
+import json
+import mmap
+import opcode
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from glob import glob
 if sys.version_info < (3, 3):
     raise RuntimeError('Module jonga requires Python version 3.3 or greater')
 
-import pygraphviz as pgv
-
 
 __version__ = '0.0.5b1'
 __author__ = """Brendt Wohlberg <brendt@ieee.org>"""
@@ -21,8 +35,48 @@ __author__ = """Brendt Wohlberg <brendt@ieee.org>"""
 
 __modulename__ = sys.modules[__name__].__name__
 
+# Name of environment variable used to pass call tracer configuration
+# to child processes
+_SHARD_ENV = 'JONGA_SHARD_CONFIG'
+# Call tracer inherited by forked child processes, if any
+_shard_tracer = None
+# Flag indicating whether the fork handler has been registered
+_fork_handler = False
+# Original multiprocessing.spawn.get_preparation_data function while
+# it is replaced so that the call tracer configuration is passed to
+# processes spawned by multiprocessing, otherwise None
+_spawn_handler = None
+# Call tracer started in this process on the basis of a configuration
+# passed by its parent process, if any
+_child_tracer = None
+# Set of sys.monitoring tool identifiers used by call tracers in this
+# process, for which events may have been disabled
+_mon_used = set()
+# Free variables of code objects that are shared only by functions
+# that are indistinguishable by name: the implicit __class__ closure
+# variable of methods that call super has the same value for all
+# functions created from one execution of a class body
+_UNSHARED_FREEVARS = ((), ('__class__',))
+# Code flags identifying coroutines and asynchronous generators
+_CO_ASYNC = inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | \
+    inspect.CO_ASYNC_GENERATOR
+# Opcode of the instruction at which a function starts or resumes
+_RESUME = opcode.opmap.get('RESUME')
+# Number of bits of a packed calling and called function pair key used
+# for the called function node id, and corresponding mask
+_IDBITS = 32
+_IDMASK = (1 << _IDBITS) - 1
+# Identifier at the start of a trace file written by CallTracer.save,
+# trace file format version, and structure of the header of each block
+# of a trace file, consisting of the block type, flags, and length
+_TRACE_MAGIC = b'JONGATRC'
+_TRACE_VERSION = 1
+_BLOCK = struct.Struct('<cBQ')
+# Trace file block flag indicating zlib compression
+_BLOCK_ZLIB = 1
+
 
-def current_function(frame):
+def current_function(frame, cache=None):
     """
     Get reference to currently running function from inspect/trace stack frame.
 
@@ -30,6 +84,13 @@ def current_function(frame):
     ----------
     frame : stack frame
       Stack frame obtained via trace or inspect
+    cache : None or dict, optional (default None)
+      A dict, keyed by code object id, of tuples consisting of a weak
+      reference to the code object and a list of weak references to the
+      functions sharing that code object. If provided, it is used to
+      avoid the (very expensive) search of all objects referring to the
+      code object of the frame, and is updated when such a search is
+      required.
 
     Returns
     -------
@@ -48,11 +109,33 @@ def current_function(frame):
         return None
 
     try:
+        # Check the cache of previously resolved functions for this code
+        # object. A cache entry is only used if one of the functions it
+        # refers to is still alive and its closure is consistent with the
+        # frame, otherwise it is replaced below.
+        if cache is not None:
+            entry = cache.get(id(code))
+            if entry is not None and entry[0]() is code:
+                for ref in entry[1]:
+                    fnc = ref()
+                    if fnc is not None and _closure_matches(fnc, frame):
+                        return fnc
         # Solution follows suggestion at http://stackoverflow.com/a/37099372
         lst = [referer for referer in gc.get_referrers(code)
-               if getattr(referer, "__code__", None) is code and
-               inspect.getclosurevars(referer).nonlocals.items() <=
-               frame.f_locals.items()]
+               if getattr(referer, "__code__", None) is code]
+        if cache is not None and lst:
+            key = id(code)
+            # The entry is removed when the code object is deleted so
+            # that its id cannot be reused while the entry remains.
+            # Function-like objects that do not support weak references
+            # are not cached.
+            try:
+                cache[key] = (weakref.ref(code,
+                                          lambda r: cache.pop(key, None)),
+                              [weakref.ref(fnc) for fnc in lst])
+            except TypeError:
+                pass
+        lst = [fnc for fnc in lst if _closure_matches(fnc, frame)]
         if lst:
             return lst[0]
         else:
@@ -63,6 +146,89 @@ def current_function(frame):
 
 
 
+def _closure_matches(fnc, frame):
+    """
+    Determine whether the closure variables of a function are consistent
+    with the local variables of a stack frame.
+
+    Parameters
+    ----------
+    fnc : function reference
+      A function reference
+    frame : stack frame
+      Stack frame obtained via trace or inspect
+
+    Returns
+    -------
+    match : bool
+      True if the nonlocal variables of the function are a subset of
+      the local variables of the frame
+    """
+
+    # Functions without free variables share no state with their
+    # defining scope, so any function with the frame code object matches
+    if not fnc.__code__.co_freevars:
+        return True
+    # The frame locals are copied to a dict since, from Python 3.13,
+    # f_locals is a proxy whose items method returns a list
+    return inspect.getclosurevars(fnc).nonlocals.items() <= \
+        dict(frame.f_locals).items()
+
+
+
+def _resumed(frame):
+    """
+    Determine whether a call event for the stack frame of a generator or
+    coroutine corresponds to its resumption rather than its first start.
+
+    Parameters
+    ----------
+    frame : stack frame
+      Stack frame obtained via trace
+
+    Returns
+    -------
+    resumed : bool
+      True if the frame has been resumed
+    """
+
+    if frame.f_lasti < 0:
+        return False
+    if _RESUME is None:
+        return True
+    # The RESUME instruction at which execution starts or continues has
+    # an argument with low bits 0 at the start of the function
+    code = frame.f_code.co_code
+    return code[frame.f_lasti] != _RESUME or \
+        code[frame.f_lasti + 1] & 3 != 0
+
+
+
+def _asyncio_internal(frame):
+    """
+    Determine whether a stack frame belongs to a function in
+    :mod:`asyncio`.
+    """
+
+    return frame.f_globals.get('__name__', '').startswith('asyncio.')
+
+
+
+def _asyncio_hooks():
+    """
+    Get the code object of the :mod:`asyncio` event loop method that
+    creates tasks, and the function that returns the current task.
+    Module :mod:`asyncio` is only imported when required since it is
+    relatively slow to import.
+    """
+
+    import asyncio
+
+    return (asyncio.base_events.BaseEventLoop.create_task.__code__,
+            asyncio.current_task)
+
+
+
 def function_qname(fnc):
     """
     Get qualified name of a function (the fully qualified name without
@@ -103,6 +269,10 @@ def function_fqname(fnc):
 
     if fnc is None:
         return ''
+    elif fnc.__module__ is None:
+        # Functions defined by code executed in a namespace without a
+        # __name__ entry have no module
+        return fnc.__qualname__
     else:
         return fnc.__module__ + '.' + fnc.__qualname__
 
@@ -127,7 +297,7 @@ def current_module_name(frame):
     if frame is None:
         return None
 
-    if hasattr(frame.f_globals, '__name__'):
+    if '__name__' in frame.f_globals:
         return frame.f_globals['__name__']
     else:
         mod = inspect.getmodule(frame)
@@ -138,13 +308,139 @@ def current_module_name(frame):
 
 
 
+def _dot_id(s):
+    """
+    Quote a string for use as an identifier or attribute value in a
+    DOT format graph description. Backslashes are escaped first, since
+    a backslash preceding the closing quote would otherwise escape it.
+    """
+
+    return '"' + str(s).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+
+def _dot_attr(attr):
+    """
+    Construct a DOT format attribute list from a dict of attribute
+    names and values, omitting attributes with a value of None.
+    """
+
+    return '[' + ', '.join(['%s=%s' % (k, _dot_id(v)) for k, v in
+                            attr.items() if v is not None]) + ']'
+
+
+
+def _run_layout(prog, fmt, src):
+    """
+    Run a Graphviz layout program executable on a DOT format graph
+    description, returning the output in the specified format.
+    """
+
+    import subprocess
+    return subprocess.run([prog, '-T' + fmt], input=src.encode('utf-8'),
+                          stdout=subprocess.PIPE, check=True).stdout
+
+
+
+def _write_block(fd, kind, data, compress):
+    """
+    Write a block of a trace file, optionally compressing its content.
+    """
+
+    flags = 0
+    if compress:
+        data = zlib.compress(data)
+        flags |= _BLOCK_ZLIB
+    fd.write(_BLOCK.pack(kind, flags, len(data)))
+    fd.write(data)
+
+
+
+def _read_blocks(pth):
+    """
+    Generate the type and (decompressed) content of each block of a
+    trace file, ignoring an incomplete block at the end of the file.
+    """
+
+    with open(pth, 'rb') as fd, \
+         mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[0:len(_TRACE_MAGIC)] != _TRACE_MAGIC:
+            raise ValueError('File %s is not a jonga trace file' % pth)
+        ver = struct.unpack_from('<I', mm, len(_TRACE_MAGIC))[0]
+        if ver > _TRACE_VERSION:
+            raise ValueError('Unsupported trace file version %d' % ver)
+        off = len(_TRACE_MAGIC) + 4
+        while off + _BLOCK.size <= len(mm):
+            kind, flags, n = _BLOCK.unpack_from(mm, off)
+            off += _BLOCK.size
+            if off + n > len(mm):
+                break
+            data = mm[off:off + n]
+            off += n
+            if flags & _BLOCK_ZLIB:
+                data = zlib.decompress(data)
+            yield kind, data
+
+
+
+def _uint64(data):
+    """
+    Construct an array of 64 bit unsigned integers from the content of
+    a trace file block.
+    """
+
+    a = array('Q')
+    a.frombytes(data)
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a
+
+
+
+def _write_json_array(fd, items, encoded=False):
+    """
+    Write a JSON array to a file in batches of elements, so that the
+    array does not have to be constructed in memory. If `encoded` is
+    True, the elements are strings that are already JSON encoded.
+    """
+
+    if not encoded:
+        items = (json.dumps(item, separators=(',', ':')) for item in items)
+    fd.write('[')
+    sep = ''
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == 4096:
+            fd.write(sep + ',\n'.join(batch))
+            sep = ',\n'
+            batch = []
+    if batch:
+        fd.write(sep + ',\n'.join(batch))
+    fd.write(']')
+
+
+
+def _svg_rmsize(img):
+    """
+    Remove the width and height specifications from an SVG image.
+    """
+
+    cp = re.compile(r'\n<svg width=\"[^\"]*\" height=\"[^\"]*\"')
+    return cp.sub(r'\n<svg', img, count=1)
+
+
+
 class CallTracer(object):
     """
     Manage construction of a call graph for methods within a class hierarchy.
     """
 
     def __init__(self, srcmodflt=None, dstmodflt=None, srcqnmflt=None,
-                 dstqnmflt=None, fnmsub=None, grpflt=None, lnksub=None):
+                 dstqnmflt=None, fnmsub=None, grpflt=None, lnksub=None,
+                 backend='settrace', threads=False, grpthr=False,
+                 shrdir=None, aio=False, grptsk=False, timing=False,
+                 evlog=None, evbuf=16384, cct=False, cctdepth=128):
         """
         Parameters
         ----------
@@ -173,8 +469,131 @@ class CallTracer(object):
         lnksub : None or tuple of two regex strings, optional (default None)
           A tuple of match and replace regex strings for computing node href
           attributes from node names. If None, href attributes are not defined.
+        backend : string, optional (default 'settrace')
+          Name of the mechanism used for tracing, either 'settrace' for
+          :func:`sys.settrace` or 'monitoring' for :mod:`sys.monitoring`
+          (PEP 669). The latter has much lower overhead, but is only
+          available in Python 3.12 or later; the former is used instead
+          when it is selected under an earlier version. Note that the
+          'monitoring' backend does not count resumption of a generator
+          or coroutine as a call, and that it disables events for
+          functions that are not recorded. Since these events remain
+          disabled for the tool identifier after tracing is stopped, a
+          new tracing session uses an identifier that has not been used
+          before if one is free, and otherwise re-enables them via
+          :func:`sys.monitoring.restart_events`, which also re-enables
+          events disabled by other :mod:`sys.monitoring` tools.
+        threads : bool, optional (default False)
+          If True, trace calls in all threads rather than only in the
+          thread from which tracing is started. With the 'settrace'
+          backend, threads that are already running when tracing is
+          started are only traced under Python 3.12 or later.
+        grpthr : bool, optional (default False)
+          If True, and `threads` is True, groups are defined by the name
+          of the thread in which each function is most frequently
+          called or calls other functions, instead of by `grpflt`.
+        shrdir : None or string, optional (default None)
+          If not None, child processes started while tracing is active
+          via :func:`os.fork`, or by :mod:`multiprocessing` with any
+          start method, are traced with the same configuration, and
+          their records are written on exit to a shard file in the
+          directory with this path. These records can be combined via
+          :meth:`merge`. Processes started by :mod:`multiprocessing`
+          with the 'spawn' or 'forkserver' start methods are only traced
+          if this module can be imported via their initial module
+          search path. Other child processes, such as Python processes
+          started via :mod:`subprocess`, are only traced if they call
+          :func:`process_startup`.
+        aio : bool, optional (default False)
+          If True, trace calls in :mod:`asyncio` code so that the first
+          start of a coroutine is attributed to the awaiting coroutine,
+          or, for the coroutine of a task, to the coroutine that created
+          the task, rather than to the event loop. Resumptions of
+          coroutines are not recorded as calls, but are counted
+          separately. This option can not be combined with `threads`.
+        grptsk : bool, optional (default False)
+          If True, and `aio` is True, groups are defined by the name of
+          the :class:`asyncio.Task` in which each function is most
+          frequently called or calls other functions, instead of by
+          `grpflt`.
+        timing : bool, optional (default False)
+          If True, also record the time spent in each recorded call, from
+          which the inclusive and exclusive times of each function and
+          the total time of the calls of each calling and called function
+          pair are available via :attr:`ftime` and :attr:`ctime`. The
+          time of calls that have not returned when tracing is stopped
+          is not recorded. Timing requires the 'settrace' backend, which
+          is used irrespective of `backend` when this option is selected,
+          and can not be combined with `aio`.
+        evlog : None or string, optional (default None)
+          If not None, recorded calls are not counted while tracing, but
+          are instead written as a log of events, each consisting of the
+          calling and called function pair, the time in ns (as given by
+          :func:`time.perf_counter_ns`), and a serial number identifying
+          the thread, to the trace file with this path, which is kept
+          open while tracing. Events are accumulated in a
+          fixed size buffer for each thread that is written to the file
+          when it is full, so that memory usage does not depend on the
+          length of the trace. The counts of calls are constructed from
+          the file by :meth:`load`. This option can not be combined with
+          `aio` or `timing`, and does not apply to child processes
+          traced via `shrdir`.
+        evbuf : int, optional (default 16384)
+          Number of events in the event log buffer of each thread.
+        cct : bool, optional (default False)
+          If True, also record a calling context tree, consisting of the
+          distinct paths of recorded calls from the first recorded
+          calling function, with counts of calls for each path, so that
+          recursion depth and the paths by which functions are reached
+          can be determined. It is available via :meth:`contexts` and
+          :meth:`collapsed`. This option requires the 'settrace'
+          backend, which is used irrespective of `backend` when it is
+          selected, and can not be combined with `aio`, `timing`, or
+          `evlog`.
+        cctdepth : int, optional (default 128)
+          Maximum depth of the calling context tree. Calls at a greater
+          depth are not recorded in the tree, which bounds its size.
         """
 
+        if backend not in ('settrace', 'monitoring'):
+            raise ValueError('Unrecognized backend %s' % backend)
+        if backend == 'monitoring' and not hasattr(sys, 'monitoring'):
+            backend = 'settrace'
+        if threads and aio:
+            raise ValueError('Options threads and aio can not be combined')
+        if timing and aio:
+            raise ValueError('Options timing and aio can not be combined')
+        if evlog is not None and (aio or timing):
+            raise ValueError('Option evlog can not be combined with aio or '
+                             'timing')
+        if cct and (aio or timing or evlog is not None):
+            raise ValueError('Option cct can not be combined with aio, '
+                             'timing, or evlog')
+        if timing or cct:
+            backend = 'settrace'
+        # Tracing mechanism
+        self.backend = backend
+        # Flag indicating whether all threads should be traced
+        self.threads = threads
+        # Flag indicating whether groups are defined by thread names
+        self.grpthr = grpthr
+        # Directory for child process shard files
+        self.shrdir = shrdir
+        # Flag indicating whether asyncio mode is enabled
+        self.aio = aio
+        # Flag indicating whether groups are defined by task names
+        self.grptsk = grptsk
+        # Flag indicating whether call times are recorded
+        self.timing = timing
+        # Path of event log file
+        self.evlog = evlog
+        # Number of events in each event log buffer
+        self.evbuf = evbuf
+        # Flag indicating whether a calling context tree is recorded
+        self.cct = cct
+        # Maximum depth of calling context tree
+        self.cctdepth = cctdepth
+
         # Regex for caller function module filtering
         if srcmodflt is None:
             srcmodflt = '.*'
@@ -207,6 +626,18 @@ class CallTracer(object):
         # Regex for link target construction
         self.lnksub = lnksub
 
+        # Cache associating code objects with the functions that they
+        # belong to. This is not cleared by the reset method since the
+        # association remains valid across tracing sessions.
+        self._fnccache = {}
+        # Lock for assignment of node ids, which is only required when
+        # a function is first encountered
+        self._lock = threading.Lock()
+        # Flag indicating whether tracing is active
+        self._tracing = False
+        # Lock for writing event log buffers to the event log file
+        self._evlock = threading.Lock()
+
         # Initialise dicts for recording call information
         self.reset()
 
@@ -217,323 +648,4099 @@ class CallTracer(object):
         information.
         """
 
-        # Dict associating function name with list containing counts
-        # of occurrences in caller and called roles
-        self.fncts = {}
-        # Dict associating tuple of (caller,called) function names
-        # with counts of such calls
-        self.calls = {}
+        # List of function names indexed by node id, with id 0 reserved
+        # for called functions that could not be determined, and dict
+        # associating function names with node ids
+        self._names = [None, ]
+        self._nodeid = {}
+        # Dict associating calling and called function node id pairs,
+        # packed into a single integer, with counts of such calls
+        self._edges = {}
+        # Arrays of counts of occurrences of each function, indexed by
+        # node id, in caller and called roles, computed from the edge
+        # table when required, and flag indicating whether they are up
+        # to date
+        self._nsrc = array('Q')
+        self._ndst = array('Q')
+        self._counted = True
+        # Dict associating edge table keys with the total time, in ns,
+        # of the corresponding calls, and dicts associating node ids with
+        # the total inclusive and exclusive times, in ns, of calls of
+        # the corresponding functions (only constructed in timing mode)
+        self._etime = {}
+        self._tincl = {}
+        self._texcl = {}
+        # Call stack state (call timing state in timing mode, or calling
+        # context state in calling context tree mode) for the thread
+        # from which tracing is started, and list of call stack states
+        # for all threads when all threads are traced. If tracing is
+        # active, as when the call tracer inherited by a forked child
+        # process is reset, the state for the thread from which tracing
+        # was started is constructed again since the trace function
+        # requires it.
+        self._stack = None
+        self._stacks = []
+        if self._tracing and not self.threads and (self.timing or self.cct):
+            self._stack = self._new_stack()
+        # Calling context tree merged from those of all threads (only
+        # constructed in calling context tree mode)
+        self._cctree = _CallStack(self.cctdepth)
         # Dict associating group match string with corresponding functions
         self.group = {}
+        # Dict associating node names with href attributes, overriding
+        # those computed via lnksub
+        self.href = {}
+        # Dict associating coroutine function name with count of
+        # resumptions (only constructed in asyncio mode)
+        self.resume = {}
+        # Dict associating tuple of (caller,called) function names
+        # with a list of the names of the threads (or asyncio tasks) in
+        # which such calls occurred (only constructed when all threads
+        # are traced, or in asyncio mode with grouping by task)
+        self.thread = {}
+        # List of per-thread records of called functions, each a tuple
+        # of an edge table dict and the thread name, and thread local
+        # storage referencing the record for the current thread
+        self._records = []
+        self._local = threading.local()
+        # Dict associating asyncio tasks with per-task records, which
+        # are merged into the main record when the task is done
+        self._tskrecs = weakref.WeakKeyDictionary()
+        # Dict associating ids of the frames of not yet started task
+        # coroutines with a tuple of the coroutine frame and the frame
+        # of the function that created the task
+        self._creator = {}
+        # Dict associating coroutine code object ids with a tuple of the
+        # code object, a flag indicating whether it can be recorded, and
+        # the corresponding function name, if any
+        self._rsmcache = {}
+        # Dict associating thread (or task) names with the edge table
+        # dict of the merged records of all threads with that name
+        self._thrcts = {}
+        # Record of the most recent call of the save method, consisting
+        # of the absolute path of the trace file, the number of node
+        # names written, and copies of the edge table and time dicts
+        self._ckpt = None
+        # Event log buffer for the thread from which tracing is started,
+        # list of event log buffers for all threads when all threads are
+        # traced, event log file object while tracing, flag indicating
+        # whether the event log file header has been written, the
+        # number of node names written to the event log file, counter
+        # of thread serial numbers, dict associating thread serial
+        # numbers with the names of threads with event log buffers, and
+        # the set of serial numbers of threads for which names have been
+        # written. Serial numbers are used rather than thread
+        # identifiers since the latter may be reused for a new thread
+        # once a thread has terminated.
+        self._evbuf = None
+        self._evbufs = []
+        self._evfd = None
+        self._evhdr = False
+        self._evnames = 1
+        self._evserial = itertools.count(1)
+        self._evthrnm = {}
+        self._evthr = set()
+        # Dict associating called function code object ids with a flag
+        # indicating whether it can be recorded and a dict associating
+        # calling function code object ids with the corresponding
+        # filtering outcome
+        self._fltcache = {}
+        # Dict associating code object ids with code objects of calling
+        # and called functions of recorded calls that are not cached in
+        # the filter cache since they have free variables
+        self._fltcode = {}
 
 
-    def _trace(self, frame, event, arg):
+    @property
+    def fncts(self):
         """
-        Build a record of called functions using the trace mechanism.
+        Read-only dict associating function name with a tuple containing
+        counts of occurrences in caller and called roles.
         """
 
-        # Return if this is not a function call
-        if event != 'call':
-            return
-
-        # Filter calling and called functions by module names
-        src_mod = current_module_name(frame.f_back)
-        dst_mod = current_module_name(frame)
-
-        # Avoid tracing the tracer (specifically, call from
-        # ContextCallTracer.__exit__ to CallTracer.stop)
-        if src_mod == __modulename__ or dst_mod == __modulename__:
-            return
-
-        # Apply source and destination module filters
-        if not self.srcmodflt.match(src_mod):
-            return
-        if not self.dstmodflt.match(dst_mod):
-            return
-
-        # Get calling and called functions
-        src_func = current_function(frame.f_back)
-        dst_func = current_function(frame)
-
-        # Filter calling and called functions by qnames
-        if not self.srcqnmflt.match(function_qname(src_func)):
-            return
-        if not self.dstqnmflt.match(function_qname(dst_func)):
-            return
-
-        # Get calling and called function full names
-        src_name = function_fqname(src_func)
-        dst_name = function_fqname(dst_func)
-
-        # Modify full function names if necessary
-        if self.fnmsub is not None:
-            src_name = re.sub(self.fnmsub[0], self.fnmsub[1], src_name)
-            dst_name = re.sub(self.fnmsub[0], self.fnmsub[1], dst_name)
+        return _FunctionCounts(self)
 
-        # Update calling function count
-        if src_func is not None:
-            if src_name in self.fncts:
-                self.fncts[src_name][0] += 1
-            else:
-                self.fncts[src_name] = [1, 0]
 
-        # Update called function count
-        if dst_func is not None and src_func is not None:
-            if dst_name in self.fncts:
-                self.fncts[dst_name][1] += 1
-            else:
-                self.fncts[dst_name] = [0, 1]
+    @property
+    def calls(self):
+        """
+        Read-only dict associating tuple of (caller,called) function
+        names with counts of such calls.
+        """
 
-        # Update caller/calling pair count
-        if dst_func is not None and src_func is not None:
-            key = (src_name, dst_name)
-            if key in self.calls:
-                self.calls[key] += 1
-            else:
-                self.calls[key] = 1
+        return _CallCounts(self)
 
 
-    def start(self):
-        """Start tracing."""
+    @property
+    def ftime(self):
+        """
+        Dict associating function name with a tuple containing the
+        total inclusive and exclusive times, in seconds, of recorded
+        calls of that function (only constructed in timing mode).
+        Inclusive times include the time of all nested calls, but each
+        call of a recursive function is counted only once. Exclusive
+        times exclude the time of nested calls that are recorded.
+        """
 
-        sys.settrace(self._trace)
+        names = self._names
+        return {names[i]: (self._tincl.get(i, 0) / 1e9, t / 1e9)
+                for i, t in self._texcl.items()}
 
 
-    def stop(self):
-        """Stop tracing."""
+    @property
+    def ctime(self):
+        """
+        Dict associating tuple of (caller,called) function names with
+        the total time, in seconds, of such calls (only constructed in
+        timing mode).
+        """
 
-        # Stop tracing
-        sys.settrace(None)
+        names = self._names
+        return {(names[k >> _IDBITS], names[k & _IDMASK]): t / 1e9
+                for k, t in self._etime.items()}
 
-        # Build group structure if group filter is defined
-        if self.grpflt is not None:
-            # Iterate over graph nodes (functions)
-            for k in self.fncts:
-                # Construct group identity string
-                m = self.grpflt.search(k)
-                # If group identity string found, append current node
-                # to that group
-                if m is not None:
-                    ms = m.group(0)
-                    if ms in self.group:
-                        self.group[ms].append(k)
-                    else:
-                        self.group[ms] = [k, ]
 
+    def contexts(self):
+        """
+        Get the calling context tree (only constructed in calling
+        context tree mode).
 
+        Returns
+        -------
+        cct : dict
+          Dict associating tuples of function names, each the path of
+          recorded calls from a first calling function, with the
+          number of calls of the last function via that path
+        """
 
-    @staticmethod
-    def _clrgen(n, h0, hr):
-        """Default colour generating function.
+        return {tuple(path): n for path, n in self._paths()}
 
-        Parameters
-        ----------
 
-        n : int
-          Number of colours to generate
-        h0 : float
-          Initial H value in HSV colour specification
-        hr : float
-          Size of H value range to use for colour generation
-          (final H value is h0 + hr)
+    def sources(self):
+        """
+        Get the source files of the calling and called functions of the
+        calls recorded by tracing. Calls added by :meth:`load` or
+        :meth:`merge` are not included since their code objects are not
+        available.
 
         Returns
         -------
-        clst : list of strings
-          List of HSV format colour specification strings
+        pths : list of strings
+          Sorted list of the paths of the source files
         """
 
-        n0 = n if n == 1 else n-1
-        clst = ['%f,%f,%f' % (h0 + hr*hi/n0, 0.35, 0.85) for
-                hi in range(n)]
-        return clst
+        pths = set(code.co_filename for code in self._fltcode.values())
+        for dst_code, relevant, srcs in list(self._fltcache.values()):
+            if relevant:
+                for src_code, key in list(srcs.values()):
+                    if key is not None:
+                        pths.add(dst_code.co_filename)
+                        if src_code is not None:
+                            pths.add(src_code.co_filename)
+        return sorted(pths)
 
 
-    def graph(self, fnm=None, size=None, fntsz=None, fntfm=None, clrgen=None,
-              rmsz=False, prog='dot'):
+    def collapsed(self, fnm=None):
         """
-        Construct call graph.
+        Get the calling context tree (only constructed in calling
+        context tree mode) in the collapsed stack format used by flame
+        graph tools such as ``flamegraph.pl`` and speedscope, with one
+        line for each path of calls, consisting of the semicolon
+        separated function names and the number of calls of the last
+        function via that path.
 
         Parameters
         ----------
         fnm : None or string, optional (default None)
-          Filename of graph file to be written. File type is determined
-          by the file extensions (e.g. dot for 'graph.dot' and SVG for
-          'graph.svg'). If None, a file is not written.
-        size : string or None, optional (default None)
-          Graph image size specification string.
-        fntsz : int or None, optional (default None)
-          Font size for text.
-        fntnm : string or None, optional (default None)
-          Font family specification string.
-        clrgen : function or None, optional (default None)
-          Function to call to generate the group colours. This function
-          should take an integer specifying the number of groups as an
-          argument and return a list of graphviz-compatible colour
-          specification strings.
-        rmsz : bool, optional (default False)
-          If True, remove the width and height specifications from an
-          SVG format output file so that the size scales properly when
-          viewed in a web browser
-        prog : string, optional (default 'dot')
-          Name of graphviz layout program to use.
+          Filename of the file to be written. If None, a string is
+          returned instead.
 
         Returns
         -------
-        pgr : pygraphviz.AGraph
-          Call graph of traced function calls
+        src : string or None
+          Collapsed stack format description of the calling context
+          tree, or None if a file is written
         """
 
-        # Default colour generation function
-        if clrgen is None:
-            clrgen = lambda n: self._clrgen(n, 0.330, 0.825)
+        lines = ('%s %d\n' % (';'.join(path), n) for path, n in
+                 self._paths())
+        if fnm is None:
+            return ''.join(lines)
+        with open(fnm, 'w') as fd:
+            fd.writelines(lines)
 
-        # Generate color list
-        clrlst = clrgen(len(self.group))
 
-        # Initialise a pygraphviz graph
-        g = pgv.AGraph(strict=False, directed=True, landscape=False,
-                       rankdir='LR', newrank=True, fontsize=fntsz,
-                       fontname=fntfm, size=size, ratio='compress',
-                       color='black', bgcolor='#ffffff00')
-        # Set graph attributes
-        g.node_attr.update(penwidth=0.25, shape='box', style='rounded,filled')
+    def _paths(self):
+        """
+        Generate the paths of the calling context tree, in depth first
+        order, as a list of function names and the corresponding count
+        of calls. The same list is modified and yielded for each path.
+        """
 
-        # Iterate over functions adding them as graph nodes
-        for k in self.fncts:
-            g.add_node(k, fontsize=fntsz, fontname=fntfm)
-            # If lnksub regex pair is provided, compute an href link
-            # target from the node name and add it as an attribute to
-            # the node
-            if self.lnksub is not None:
-                lnktgt = re.sub(self.lnksub[0], self.lnksub[1], k)
-                g.get_node(k).attr.update(href=lnktgt, target="_top")
-            # If function has no calls to it, set its rank to "source"
-            if self.fncts[k][1] == 0:
-                g.get_node(k).attr.update(rank='source')
-
-        # If groups defined, construct a subgraph for each and add the
-        # nodes in each group to the corresponding subgraph
-        if self.group:
-            fngrpnm = {}
-            # Iterate over group number/group name pairs
-            for k in zip(range(len(self.group)), sorted(self.group)):
-                g.add_subgraph(self.group[k[1]], name='cluster_' + k[1],
-                               label=k[1], penwidth=2, style='dotted',
-                               pencolor=clrlst[k[0]])
-                # Iterate over nodes in current group
-                for l in self.group[k[1]]:
-                    # Create record of function group number
-                    fngrpnm[l] = k[0]
-                    # Set common group colour for current node
-                    g.get_node(l).attr.update(fillcolor=clrlst[k[0]])
+        tree = self._cctree
+        names = self._names
+        children = [[] for n in tree.fid]
+        for n in range(len(tree.fid) - 1, 0, -1):
+            children[tree.parent[n]].append(n)
+        path = []
+        # Stack of node ids to be visited, with negated ids marking the
+        # point at which the node is removed from the path
+        todo = children[0][:]
+        while todo:
+            n = todo.pop()
+            if n < 0:
+                path.pop()
+                continue
+            path.append(names[tree.fid[n]])
+            if tree.count[n]:
+                yield path, tree.count[n]
+            todo.append(-n)
+            todo.extend(children[n])
 
-        # Iterate over function calls, adding each as an edge
-        for k in self.calls:
-            # If groups defined, set edge colour according to group of
-            # calling function, otherwise set a standard colour
-            if self.group:
-                g.add_edge(k[0], k[1], penwidth=2, color=clrlst[fngrpnm[k[0]]])
-            else:
-                g.add_edge(k[0], k[1], color='grey')
 
-        # Call layout program
-        g.layout(prog=prog)
+    def _weighted_paths(self):
+        """
+        Generate paths of calls, as lists of function names, with the
+        corresponding weights, in depth first order. If a calling
+        context tree was recorded, the paths are those of the tree,
+        weighted by count of calls, otherwise they are the calling and
+        called function pairs, weighted by total time in ns if call
+        times were recorded, or otherwise by count of calls.
+        """
 
-        # Write graph file if filename provided
-        if fnm is not None:
-            ext = os.path.splitext(fnm)[1]
-            if ext == '.dot':
-                g.write(fnm)
-            else:
-                if ext == '.svg' and rmsz:
-                    img = g.draw(format='svg').decode('utf-8')
-                    cp = re.compile(r'\n<svg width=\"[^\"]*\" '
-                                    'height=\"[^\"]*\"')
-                    img = cp.sub(r'\n<svg', img, count=1)
-                    with open(fnm, 'w') as fd:
-                        fd.write(img)
-                else:
-                    g.draw(fnm)
+        if len(self._cctree.fid) > 1:
+            yield from self._paths()
+            return
+        names = self._names
+        wgts = self._etime if self.timing else self._edges
+        for k in sorted(self._edges):
+            if k & _IDMASK and wgts.get(k):
+                yield [names[k >> _IDBITS], names[k & _IDMASK]], wgts[k]
 
-        # Return graph object
-        return g
 
+    def speedscope(self, fnm, name='jonga'):
+        """
+        Write the record of called functions to a file in the
+        speedscope JSON format, as a sampled profile in which each path
+        of calls (see :meth:`chrome`) is a sample. The file is written
+        incrementally, so that the profile does not have to be
+        constructed in memory.
 
-    def __str__(self):
-        """Get string representation."""
+        Parameters
+        ----------
+        fnm : string
+          Filename of the file to be written
+        name : string, optional (default 'jonga')
+          Name of the profile
+        """
 
-        s = ''
-        for k in self.fncts:
-            s += '%-40s   %2d  %2d\n' % (k, self.fncts[k][0], self.fncts[k][1])
-        for k in self.calls:
-            s += '%-35s  ->  %-35s  %2d\n' % (k[0], k[1], self.calls[k])
-        for k in self.group:
-            s += '%s\n    ' % k
-            for l in self.group[k]:
-                s += '%s  ' % l
-            s += '\n'
-        return s
+        frames = {}
 
+        def samples():
+            for path, w in self._weighted_paths():
+                yield [frames.setdefault(nm, len(frames)) for nm in path]
 
+        total = [0]
 
+        def weights():
+            for path, w in self._weighted_paths():
+                total[0] += w
+                yield w
 
-class ContextCallTracer(object):
-    """
-    A wrapper class for :class:`CallTracer` that enables its use as a
-    context manager. At the end of the context a call graph image is
-    generated and written to a path specified in the initialiser.
-    """
+        unit = 'nanoseconds' if self.timing and not self.cct else 'none'
+        with open(fnm, 'w') as fd:
+            fd.write('{"$schema":"https://www.speedscope.app/file-format-'
+                     'schema.json","exporter":%s,"name":%s,"profiles":'
+                     '[{"type":"sampled","name":%s,"unit":"%s",'
+                     '"startValue":0,"samples":' % (
+                         json.dumps('jonga ' + __version__),
+                         json.dumps(name), json.dumps(name), unit))
+            _write_json_array(fd, samples())
+            fd.write(',"weights":')
+            _write_json_array(fd, weights())
+            fd.write(',"endValue":%d}],"shared":{"frames":' % total[0])
+            _write_json_array(fd, ({'name': nm} for nm in frames))
+            fd.write('}}\n')
 
-    def __init__(self, ct, pth=None, **kwargs):
+
+    def chrome(self, fnm, evlog=None):
         """
+        Write the record of called functions to a file in the Chrome
+        Trace Event JSON format, as used by ``about:tracing`` and
+        Perfetto. If an event log is available (see the `evlog`
+        parameter of :class:`CallTracer`), each call is an instant
+        event at the time of the call in the thread in which it
+        occurred. Otherwise, a flame chart is constructed from the
+        paths of calls, consisting of the paths of the calling context
+        tree if one was recorded (see the `cct` parameter of
+        :class:`CallTracer`), or otherwise of the calling and called
+        function pairs. The duration of each function in the chart is
+        the total count of calls, in µs, or the total time of calls if
+        call times were recorded and there is no calling context tree.
+        The file is written incrementally, so that a large event log
+        does not have to be read into memory.
+
         Parameters
         ----------
-        ct : class:`CallTracer` object
-          Specify the call tracer object to be used as a context manager.
-        pth : string or None, optional (default None)
-          Specify the path of the graph image file to be written by
-          :meth:`CallTracer.graph` at the end of the context. A graph is
-          not generated if it is ``None``.
-        **kwargs
-          Keyword arguments for :meth:`CallTracer.graph`
+        fnm : string
+          Filename of the file to be written
+        evlog : None or string, optional (default None)
+          Path of the event log file. If None, the event log file of
+          this call tracer, if any, is used.
         """
 
-        self.ct = ct
-        self.pth = pth
-        self.kwargs = kwargs
+        if evlog is None:
+            evlog = self.evlog
+        with open(fnm, 'w') as fd:
+            fd.write('{"displayTimeUnit":"ns","otherData":{"exporter":%s},'
+                     '"traceEvents":' % json.dumps('jonga ' + __version__))
+            if evlog is not None:
+                _write_json_array(fd, self._chrome_events(evlog),
+                                  encoded=True)
+            else:
+                _write_json_array(fd, self._chrome_chart())
+            fd.write('}\n')
 
 
-    def __enter__(self):
+    @staticmethod
+    def _chrome_events(pth):
         """
-        Reset and start call tracer and return this ContextCallTracer
-        instance.
+        Generate JSON encoded Chrome Trace Event format instant events
+        from an event log file, one block at a time.
         """
 
-        self.ct.reset()
-        self.ct.start()
-        return self
+        # JSON encoded function names, indexed by node id, and JSON
+        # encoded calling and called function names for each edge table
+        # key, which are encoded once since encoding of each event is
+        # the dominant cost for a large event log
+        names = ['"?"', ]
+        pairs = {}
+        # Event buffers of different threads are written when they are
+        # full, so the blocks are not in time order, and times are
+        # relative to the earliest event of all blocks, which requires
+        # a preliminary pass over the file
+        t0 = None
+        for kind, data in _read_blocks(pth):
+            if kind == b'V':
+                a = _uint64(data)
+                if a:
+                    t = min(a[1::3])
+                    if t0 is None or t < t0:
+                        t0 = t
+        for kind, data in _read_blocks(pth):
+            if kind == b'S':
+                names.extend([json.dumps(nm) for nm in
+                              data.decode('utf-8').split('\0')])
+            elif kind == b'H':
+                for tid, thrnm in json.loads(data.decode('utf-8')).items():
+                    yield json.dumps({'name': 'thread_name', 'ph': 'M',
+                                      'pid': 0, 'tid': int(tid),
+                                      'args': {'name': thrnm}})
+            elif kind == b'V':
+                a = _uint64(data)
+                for k, t, tid in zip(a[0::3], a[1::3], a[2::3]):
+                    try:
+                        pair = pairs[k]
+                    except KeyError:
+                        pair = (names[k & _IDMASK], names[k >> _IDBITS])
+                        pairs[k] = pair
+                    yield '{"name":%s,"ph":"i","s":"t","pid":0,"tid":%d,' \
+                        '"ts":%.3f,"args":{"caller":%s}}' % (
+                            pair[0], tid, (t - t0) / 1e3, pair[1])
 
 
-    def __exit__(self, extype, value, traceback):
+    def _chrome_chart(self):
         """
-        Stop the call tracer and return True if no exception was raised
-        within the 'with' block, otherwise return False.
+        Generate Chrome Trace Event format complete events of a flame
+        chart of the paths of calls.
         """
 
-        self.ct.stop()
-        if self.pth is not None:
-            self.ct.graph(self.pth, **self.kwargs)
-        if extype:
-            return False
+        scale = 1e-3 if self.timing and not self.cct else 1.0
+        # Stack of names and start times of the functions of the current
+        # path. The paths are in depth first order, so an entry is
+        # complete when a path no longer extends it.
+        stack = []
+        t = 0
+
+        def close(n):
+            while len(stack) > n:
+                nm, t0 = stack.pop()
+                yield {'name': nm, 'ph': 'X', 'pid': 0, 'tid': 0,
+                       'ts': t0 * scale, 'dur': (t - t0) * scale}
+
+        for path, w in self._weighted_paths():
+            n = 0
+            while n < len(stack) and n < len(path) and \
+                  stack[n][0] == path[n]:
+                n += 1
+            yield from close(n)
+            stack.extend([[nm, t] for nm in path[n:]])
+            t += w
+        yield from close(0)
+
+
+    def _counts(self):
+        """
+        Get arrays of counts of occurrences of each function, indexed by
+        node id, in caller and called roles, computing them from the
+        edge table if necessary.
+        """
+
+        if not self._counted:
+            n = len(self._names)
+            nsrc = array('Q', bytes(8 * n))
+            ndst = array('Q', bytes(8 * n))
+            for k, c in list(self._edges.items()):
+                nsrc[k >> _IDBITS] += c
+                ndst[k & _IDMASK] += c
+            # Calls of functions that could not be determined are
+            # counted for the calling function only
+            ndst[0] = 0
+            self._nsrc = nsrc
+            self._ndst = ndst
+            # The counts can not be relied on while tracing is active
+            self._counted = not self._tracing
+        return self._nsrc, self._ndst
+
+
+    def _intern(self, name):
+        """
+        Get the node id of the function with the specified name,
+        assigning a new one if necessary.
+        """
+
+        with self._lock:
+            i = self._nodeid.get(name)
+            if i is None:
+                i = len(self._names)
+                self._names.append(name)
+                self._nodeid[name] = i
+        return i
+
+
+    def _addcall(self, src, dst, n, edges=None):
+        """
+        Add a count of calls of a function by another function to the
+        edge table.
+
+        Parameters
+        ----------
+        src : string
+          Calling function name
+        dst : string or None
+          Called function name, or None if it could not be determined
+        n : int
+          Number of calls
+        edges : dict or None, optional (default None)
+          Edge table to be updated. If None, the main edge table is
+          updated.
+        """
+
+        if edges is None:
+            edges = self._edges
+            self._counted = False
+        key = self._intern(src) << _IDBITS
+        if dst is not None:
+            key |= self._intern(dst)
+        edges[key] = edges.get(key, 0) + n
+
+
+    def _trace(self, frame, event, arg):
+        """
+        Build a record of called functions using the trace mechanism.
+        """
+
+        # Return if this is not a function call
+        if event != 'call':
+            return
+
+        self._record(frame, self._edges)
+
+
+    def _trace_stack(self, frame, event, arg):
+        """
+        Build a record of called functions, and of the time spent in
+        each call (or of the calling context of each call), using the
+        trace mechanism. A local trace function is installed for the
+        frame of each recorded call so that the time can be determined
+        (or the call removed from the calling context) when it returns.
+        """
+
+        # Return if this is not a function call
+        if event != 'call':
+            return
+
+        if self.threads:
+            try:
+                rec = self._local.rec
+            except AttributeError:
+                if not self._active:
+                    sys.settrace(None)
+                    return
+                rec = self._new_record()
+            edges = rec[0]
+            stack = self._local.stack
+        else:
+            edges = self._edges
+            stack = self._stack
+        key = self._record(frame, edges)
+        # Calls that are not recorded, or of functions that could not
+        # be determined, are included in the time of the calling
+        # function
+        if not key or not key & _IDMASK:
+            return
+        # Line events are not required for the local trace function
+        frame.f_trace_lines = False
+        stack.push(key)
+        return stack.trace
+
+
+    def _trace_thread(self, frame, event, arg):
+        """
+        Build a record of called functions using the trace mechanism
+        when all threads are traced. Calls are recorded in a separate
+        record for each thread, so that no locking is required.
+        """
+
+        # Return if this is not a function call
+        if event != 'call':
+            return
+
+        try:
+            rec = self._local.rec
+        except AttributeError:
+            # Threads started while tracing was active continue to call
+            # this function after it has been stopped if
+            # threading.settrace_all_threads is not available
+            if not self._active:
+                sys.settrace(None)
+                return
+            rec = self._new_record()
+        self._record(frame, rec[0])
+
+
+    def _new_stack(self):
+        """
+        Construct the call stack state for the thread from which tracing
+        is started when all threads are not traced.
+        """
+
+        if self.timing:
+            return _CallTimer(self._etime, self._tincl, self._texcl)
+        else:
+            return _CallStack(self.cctdepth)
+
+
+    def _new_record(self):
+        """
+        Construct a record of called functions for the current thread.
+        """
+
+        rec = ({}, threading.current_thread().name)
+        self._local.rec = rec
+        # Appending to a list is atomic, and this only happens once for
+        # each thread, so it is not necessary to lock the list
+        self._records.append(rec)
+        if self.timing or self.cct:
+            if self.timing:
+                stack = _CallTimer({}, {}, {})
+            else:
+                stack = _CallStack(self.cctdepth)
+            self._local.stack = stack
+            self._stacks.append(stack)
+        return rec
+
+
+    def _trace_log(self, frame, event, arg):
+        """
+        Build a log of call events using the trace mechanism.
+        """
+
+        # Return if this is not a function call
+        if event != 'call':
+            return
+
+        if self.threads:
+            try:
+                buf, tid = self._local.evbuf
+            except AttributeError:
+                if not self._active:
+                    sys.settrace(None)
+                    return
+                buf, tid = self._new_evbuf()
+        else:
+            buf, tid = self._evbuf, 0
+        self._log(frame, buf, tid)
+
+
+    def _monitor_log(self, code, offset):
+        """
+        Build a log of call events using the :mod:`sys.monitoring`
+        mechanism. This is a callback for ``PY_START`` events.
+        """
+
+        if self.threads:
+            try:
+                buf, tid = self._local.evbuf
+            except AttributeError:
+                buf, tid = self._new_evbuf()
+        elif threading.get_ident() != self._tid:
+            return
+        else:
+            buf, tid = self._evbuf, 0
+        if self._log(sys._getframe(1), buf, tid) is False:
+            return sys.monitoring.DISABLE
+
+
+    def _log(self, frame, buf, tid):
+        """
+        Append the call of the function of the specified stack frame to
+        an event log buffer, writing the buffer to the event log file
+        if it is full.
+
+        Parameters
+        ----------
+        frame : stack frame
+          Stack frame of the called function
+        buf : array
+          Event log buffer of the current thread
+        tid : int
+          Serial number of the current thread
+
+        Returns
+        -------
+        key : bool or None or int
+          As for :meth:`_record`
+        """
+
+        key = self._record(frame, None)
+        if key:
+            buf.extend((key, time.perf_counter_ns(), tid))
+            if len(buf) >= 3 * self.evbuf:
+                self._flush_events(buf)
+        return key
+
+
+    def _new_evbuf(self):
+        """
+        Construct an event log buffer for the current thread, returning
+        the buffer and the serial number assigned to the thread.
+        """
+
+        buf = array('Q')
+        # Advancing the counter is atomic, so it is not necessary to
+        # lock it
+        tid = next(self._evserial)
+        self._local.evbuf = (buf, tid)
+        # The thread name is recorded here since the thread may have
+        # terminated when the buffer is written
+        self._evthrnm[tid] = threading.current_thread().name
+        # Appending to a list is atomic, so it is not necessary to lock
+        # the list
+        self._evbufs.append(buf)
+        return buf, tid
+
+
+    def _flush_events(self, buf):
+        """
+        Write the events in an event log buffer, preceded by any node
+        names and thread names that have not yet been written, to the
+        event log file, and empty the buffer.
+        """
+
+        with self._evlock:
+            fd = self._evfd
+            # A buffer filled by a thread that has not yet noticed that
+            # tracing has stopped is discarded, since the events were
+            # recorded after the end of the tracing session
+            if fd is not None:
+                # Node names are only ever appended, and all names
+                # referenced by the buffer have been assigned already
+                names = self._names[self._evnames:]
+                if names:
+                    _write_block(fd, b'S', '\0'.join(names).encode('utf-8'),
+                                 True)
+                    self._evnames += len(names)
+                # Thread names are only required for grouping by thread
+                if self.threads:
+                    tids = set(buf[2::3]) - self._evthr
+                    if tids:
+                        _write_block(fd, b'H', json.dumps(
+                            {str(tid): self._evthrnm.get(tid, str(tid))
+                             for tid in tids}).encode('utf-8'), True)
+                        self._evthr |= tids
+                if sys.byteorder != 'little':
+                    buf.byteswap()
+                _write_block(fd, b'V', buf.tobytes(), False)
+            del buf[:]
+
+
+    def _monitor(self, code, offset):
+        """
+        Build a record of called functions using the
+        :mod:`sys.monitoring` mechanism. This is a callback for
+        ``PY_START`` events.
+        """
+
+        if self.threads:
+            try:
+                rec = self._local.rec
+            except AttributeError:
+                rec = self._new_record()
+        # Ignore calls in threads other than the one in which tracing
+        # was started, for consistency with the settrace backend
+        elif threading.get_ident() != self._tid:
+            return
         else:
+            rec = (self._edges, None)
+        # Frame of the function that triggered the event
+        frame = sys._getframe(1)
+        # Disable further events for code that can never be recorded as
+        # a called function
+        if self._record(frame, rec[0]) is False:
+            return sys.monitoring.DISABLE
+
+
+    def _trace_async(self, frame, event, arg):
+        """
+        Build a record of called functions using the trace mechanism
+        in asyncio mode.
+        """
+
+        # Return if this is not a function call
+        if event != 'call':
+            return
+
+        self._record_async(frame, None)
+
+
+    def _monitor_async(self, code, offset):
+        """
+        Build a record of called functions using the
+        :mod:`sys.monitoring` mechanism in asyncio mode. This is a
+        callback for ``PY_START`` events.
+        """
+
+        if threading.get_ident() != self._tid:
+            return
+        if self._record_async(sys._getframe(1), False) is False:
+            return sys.monitoring.DISABLE
+
+
+    def _monitor_resume(self, code, offset):
+        """
+        Count resumptions of coroutines using the :mod:`sys.monitoring`
+        mechanism in asyncio mode. This is a callback for ``PY_RESUME``
+        events.
+        """
+
+        if threading.get_ident() != self._tid:
+            return
+        if self._record_async(sys._getframe(1), True) is False:
+            return sys.monitoring.DISABLE
+
+
+    def _record_async(self, frame, resumed):
+        """
+        Record the call of the function of the specified stack frame in
+        asyncio mode.
+
+        Parameters
+        ----------
+        frame : stack frame
+          Stack frame of the called function
+        resumed : None or bool
+          Flag indicating whether the event is a resumption of a
+          generator or coroutine. If None, it is determined from the
+          stack frame.
+
+        Returns
+        -------
+        relevant : bool or None or int
+          False if calls of the function of the frame can never be
+          recorded, irrespective of the calling function, otherwise a
+          value other than False
+        """
+
+        code = frame.f_code
+        # Creation of a task: record the creator of the task coroutine
+        if code is self._crtcode:
+            self._record_creator(frame)
             return True
 
+        src_frame = None
+        if code.co_flags & _CO_ASYNC:
+            if resumed is None:
+                resumed = _resumed(frame)
+            if resumed:
+                return self._record_resume(frame)
+            # The parent frame of the coroutine of a task is the event
+            # loop, so the call is attributed to the creator of the task
+            if frame.f_back is not None and _asyncio_internal(frame.f_back):
+                entry = self._creator.pop(id(frame), None)
+                if entry is None:
+                    return True
+                src_frame = entry[1]
 
-    def calltracer(self):
+        if self.grptsk:
+            edges = self._task_record()
+        else:
+            edges = self._edges
+        return self._record(frame, edges, src_frame)
+
+
+    def _record_creator(self, frame):
         """
-        Return the call tracer object associated with this ContextCallTracer
-        instance.
+        Record the frame of the function, outside of :mod:`asyncio`,
+        that is responsible for the creation of a task, the creation
+        method of which is running in the specified stack frame.
         """
 
-        return self.ct
+        cr_frame = getattr(frame.f_locals.get('coro'), 'cr_frame', None)
+        if cr_frame is None:
+            return
+        src_frame = frame.f_back
+        while src_frame is not None and _asyncio_internal(src_frame):
+            src_frame = src_frame.f_back
+        if src_frame is not None:
+            # The coroutine frame is referenced so that its id can not
+            # be reused before the entry is removed
+            self._creator[id(cr_frame)] = (cr_frame, src_frame)
+
+
+    def _record_resume(self, frame):
+        """
+        Count the resumption of the coroutine of the specified stack
+        frame.
+        """
+
+        code = frame.f_code
+        try:
+            entry = self._rsmcache[id(code)]
+        except KeyError:
+            relevant = self._relevant(frame)
+            name = None
+            if relevant:
+                fnc = current_function(frame, self._fnccache)
+                if fnc is not None and \
+                   self.dstqnmflt.match(function_qname(fnc)):
+                    name = function_fqname(fnc)
+                    if self.fnmsub is not None:
+                        name = re.sub(self.fnmsub[0], self.fnmsub[1], name)
+            entry = (code, relevant, name)
+            self._rsmcache[id(code)] = entry
+        if entry[2] is not None:
+            if entry[2] in self.resume:
+                self.resume[entry[2]] += 1
+            else:
+                self.resume[entry[2]] = 1
+        return entry[1]
+
+
+    def _task_record(self):
+        """
+        Get the edge table of the record of called functions for the
+        current asyncio task, constructing it if necessary.
+        """
+
+        try:
+            task = self._curtask()
+        except RuntimeError:
+            # There is no running event loop
+            return self._edges
+        if task is None:
+            return self._edges
+        rec = self._tskrecs.get(task)
+        if rec is None:
+            rec = ({}, task.get_name())
+            self._tskrecs[task] = rec
+            task.add_done_callback(self._task_done)
+        return rec[0]
+
+
+    def _task_done(self, task):
+        """
+        Merge the record of called functions for an asyncio task that is
+        done into the main record, so that records are not retained for
+        all tasks.
+        """
+
+        rec = self._tskrecs.pop(task, None)
+        if rec is not None:
+            self._merge_record(rec)
+
+
+    def _record(self, frame, edges, src_frame=None):
+        """
+        Record the call of the function of the specified stack frame by
+        the function of its parent stack frame (or of the specified
+        calling stack frame).
+
+        Parameters
+        ----------
+        frame : stack frame
+          Stack frame of the called function
+        edges : dict
+          Edge table dict of caller/called pair counts to be updated
+        src_frame : stack frame or None, optional (default None)
+          Stack frame of the calling function. If None, the parent
+          stack frame is used.
+
+        Returns
+        -------
+        key : bool or None or int
+          False if calls of the function of the frame can never be
+          recorded, irrespective of the calling function, None if this
+          call is not recorded, otherwise the edge table key of the call
+        """
+
+        # Whether a function can be recorded as a called function
+        # depends only on its code object, and is determined, and cached,
+        # before the parent frame is accessed since construction of the
+        # parent frame object is expensive. The outcome of filtering and
+        # renaming depends only on the calling and called functions,
+        # which are determined by their code objects unless they have
+        # free variables other than the __class__ variable of methods
+        # calling super, so it is computed once for each pair of such
+        # code objects and cached. The code objects are referenced by
+        # the cache entries so that their ids can not be reused while
+        # they exist.
+        dst_code = frame.f_code
+        try:
+            entry = self._fltcache[id(dst_code)]
+        except KeyError:
+            entry = (dst_code, self._relevant(frame), {})
+            self._fltcache[id(dst_code)] = entry
+        if not entry[1]:
+            return False
+        if src_frame is None:
+            src_frame = frame.f_back
+        src_code = None if src_frame is None else src_frame.f_code
+        if dst_code.co_freevars not in _UNSHARED_FREEVARS or \
+           (src_code is not None and
+            src_code.co_freevars not in _UNSHARED_FREEVARS):
+            # Functions with free variables, such as the wrapper
+            # functions constructed by a decorator, may share a code
+            # object and are only distinguished by their closures
+            key = self._filter(frame, src_frame)
+            if key is not None:
+                self._fltcode[id(dst_code)] = dst_code
+                if src_code is not None:
+                    self._fltcode[id(src_code)] = src_code
+        else:
+            try:
+                key = entry[2][id(src_code)][1]
+            except KeyError:
+                key = self._filter(frame, src_frame)
+                entry[2][id(src_code)] = (src_code, key)
+        if key is None:
+            return None
+
+        # Calls are not counted in event log mode
+        if edges is None:
+            return key
+
+        # Update caller/calling pair count
+        try:
+            edges[key] += 1
+        except KeyError:
+            edges[key] = 1
+        return key
+
+
+    def _relevant(self, frame):
+        """
+        Determine whether calls of the function of the specified stack
+        frame could ever be recorded, which depends only on its module.
+        """
+
+        dst_mod = current_module_name(frame)
+        return dst_mod != __modulename__ and \
+            self.dstmodflt.match(dst_mod) is not None
+
+
+    def _filter(self, frame, src_frame):
+        """
+        Apply the module and qname filters and the name substitution to
+        the functions of the specified called and calling stack frames.
+
+        Parameters
+        ----------
+        frame : stack frame
+          Stack frame of the called function
+        src_frame : stack frame or None
+          Stack frame of the calling function
+
+        Returns
+        -------
+        key : None or int
+          None if the call should not be recorded, otherwise the edge
+          table key consisting of the calling and called function node
+          ids, the latter of which is 0 if the called function could not
+          be determined
+        """
+
+        if src_frame is None:
+            return None
+
+        # Filter calling and called functions by module names
+        src_mod = current_module_name(src_frame)
+        dst_mod = current_module_name(frame)
+
+        # Avoid tracing the tracer (specifically, call from
+        # ContextCallTracer.__exit__ to CallTracer.stop)
+        if src_mod == __modulename__ or dst_mod == __modulename__:
+            return None
+
+        # Apply source and destination module filters
+        if not self.srcmodflt.match(src_mod):
+            return None
+        if not self.dstmodflt.match(dst_mod):
+            return None
+
+        # Get calling and called functions
+        src_func = current_function(src_frame, self._fnccache)
+        dst_func = current_function(frame, self._fnccache)
+
+        # Filter calling and called functions by qnames
+        if not self.srcqnmflt.match(function_qname(src_func)):
+            return None
+        if not self.dstqnmflt.match(function_qname(dst_func)):
+            return None
+
+        # Calls are not recorded if the calling function could not be
+        # determined
+        if src_func is None:
+            return None
+
+        # Get calling and called function full names
+        src_name = function_fqname(src_func)
+        dst_name = function_fqname(dst_func)
+
+        # Modify full function names if necessary
+        if self.fnmsub is not None:
+            src_name = re.sub(self.fnmsub[0], self.fnmsub[1], src_name)
+            dst_name = re.sub(self.fnmsub[0], self.fnmsub[1], dst_name)
+
+        key = self._intern(src_name) << _IDBITS
+        if dst_func is not None:
+            key |= self._intern(dst_name)
+        return key
+
+
+    def start(self):
+        """Start tracing."""
+
+        self._tracing = True
+        self._counted = False
+
+        # Arrange for child processes to be traced if required
+        if self.shrdir is not None:
+            self._start_shards()
+
+        # Open the event log file, which remains open until tracing is
+        # stopped to avoid the cost of opening it for each buffer
+        # written, and write the file header, unless the event log of a
+        # previous tracing session since the last reset is continued
+        if self.evlog is not None:
+            if not self._evhdr:
+                self._evfd = open(self.evlog, 'wb')
+                self._evfd.write(_TRACE_MAGIC + struct.pack('<I',
+                                                            _TRACE_VERSION))
+                self._evhdr = True
+            else:
+                self._evfd = open(self.evlog, 'ab')
+            self._evbuf = array('Q')
+
+        # Any existing trace functions, such as that of a coverage tool
+        # or a debugger, are suspended while tracing and restored when
+        # tracing is stopped
+        self._prvtrace = sys.gettrace()
+        self._prvthrtrace = getattr(threading, 'gettrace', lambda: None)()
+
+        if self.backend == 'monitoring':
+            mon = sys.monitoring
+            # Use the profiler tool identifier or an identifier that is
+            # not assigned to another kind of tool if one is available,
+            # otherwise any free identifier, preferring identifiers
+            # that have not been used in a previous tracing session
+            free = [tid for tid in (mon.PROFILER_ID, 3, 4, mon.DEBUGGER_ID,
+                                    mon.COVERAGE_ID, mon.OPTIMIZER_ID)
+                    if mon.get_tool(tid) is None]
+            if not free:
+                raise RuntimeError('No free sys.monitoring tool identifier')
+            free = [tid for tid in free if tid in (mon.PROFILER_ID, 3, 4)] \
+                or free
+            unused = [tid for tid in free if tid not in _mon_used]
+            if unused:
+                tid = unused[0]
+            else:
+                tid = free[0]
+                # Events disabled during a previous tracing session,
+                # which may have used different filters, remain disabled
+                # for the identifier even after it is freed, and can only
+                # be re-enabled for all tools at once
+                mon.restart_events()
+            _mon_used.add(tid)
+            mon.use_tool_id(tid, 'jonga')
+            self._toolid = tid
+            self._tid = threading.get_ident()
+            if self.aio:
+                self._crtcode, self._curtask = _asyncio_hooks()
+                mon.register_callback(tid, mon.events.PY_START,
+                                      self._monitor_async)
+                mon.register_callback(tid, mon.events.PY_RESUME,
+                                      self._monitor_resume)
+                events = mon.events.PY_START | mon.events.PY_RESUME
+            else:
+                if self.evlog is not None:
+                    monitor = self._monitor_log
+                else:
+                    monitor = self._monitor
+                mon.register_callback(tid, mon.events.PY_START, monitor)
+                events = mon.events.PY_START
+            mon.set_events(tid, events)
+        elif self.aio:
+            self._crtcode, self._curtask = _asyncio_hooks()
+            sys.settrace(self._trace_async)
+        elif self.threads:
+            self._active = True
+            if self.timing or self.cct:
+                trace = self._trace_stack
+            elif self.evlog is not None:
+                trace = self._trace_log
+            else:
+                trace = self._trace_thread
+            if hasattr(threading, 'settrace_all_threads'):
+                threading.settrace_all_threads(trace)
+            else:
+                threading.settrace(trace)
+                sys.settrace(trace)
+        elif self.timing or self.cct:
+            self._stack = self._new_stack()
+            sys.settrace(self._trace_stack)
+        elif self.evlog is not None:
+            sys.settrace(self._trace_log)
+        else:
+            sys.settrace(self._trace)
+
+
+    def stop(self):
+        """Stop tracing."""
+
+        # Stop tracing
+        if self.backend == 'monitoring':
+            mon = sys.monitoring
+            mon.set_events(self._toolid, 0)
+            mon.register_callback(self._toolid, mon.events.PY_START, None)
+            if self.aio:
+                mon.register_callback(self._toolid, mon.events.PY_RESUME,
+                                      None)
+            mon.free_tool_id(self._toolid)
+        elif self.threads:
+            self._active = False
+            if hasattr(threading, 'settrace_all_threads'):
+                threading.settrace_all_threads(None)
+            threading.settrace(self._prvthrtrace)
+            sys.settrace(self._prvtrace)
+        else:
+            sys.settrace(self._prvtrace)
+
+        self._tracing = False
+        self._counted = False
+
+        # Child processes started after this point are not traced
+        if self.shrdir is not None:
+            self._stop_shards()
+
+        # Write any events remaining in the event log buffers
+        if self.evlog is not None:
+            self._local = threading.local()
+            evbufs = self._evbufs
+            self._evbufs = []
+            for buf in [self._evbuf] + evbufs:
+                if buf:
+                    self._flush_events(buf)
+            self._evbuf = None
+            with self._evlock:
+                self._evfd.close()
+                self._evfd = None
+
+        # Merge per-thread or per-task records if required
+        if self.threads or (self.aio and self.grptsk):
+            self._merge_records()
+        # Calls that have not returned are not timed, but are included
+        # in the calling context tree
+        if self.cct and self._stack is not None:
+            self._cctree.merge(self._stack)
+        self._stack = None
+        # References to frames of coroutines that were never started
+        # are no longer required
+        self._creator = {}
+
+        self._build_group()
+
+
+    def _build_group(self):
+        """
+        Construct the group structure from the recorded functions.
+        """
+
+        self.group = {}
+        # Build group structure by thread or task names if required,
+        # otherwise build it from the group filter if one is defined
+        if (self.threads and self.grpthr) or (self.aio and self.grptsk):
+            self._group_threads()
+        elif self.grpflt is not None:
+            # Iterate over graph nodes (functions)
+            for k in self.fncts:
+                # Construct group identity string
+                m = self.grpflt.search(k)
+                # If group identity string found, append current node
+                # to that group
+                if m is not None:
+                    ms = m.group(0)
+                    if ms in self.group:
+                        self.group[ms].append(k)
+                    else:
+                        self.group[ms] = [k, ]
+
+
+
+    def _merge_records(self):
+        """
+        Merge the per-thread records of called functions into the
+        main record.
+        """
+
+        recs = self._records + list(self._tskrecs.values())
+        self._records = []
+        # Replace the thread local storage and the dict of task records
+        # so that any further calls are recorded in new records
+        self._local = threading.local()
+        self._tskrecs = weakref.WeakKeyDictionary()
+        for rec in recs:
+            self._merge_record(rec)
+        stacks = self._stacks
+        self._stacks = []
+        for stack in stacks:
+            if self.cct:
+                self._cctree.merge(stack)
+                continue
+            for dst, src in ((self._etime, stack.etime),
+                             (self._tincl, stack.tincl),
+                             (self._texcl, stack.texcl)):
+                for k, t in list(src.items()):
+                    dst[k] = dst.get(k, 0) + t
+
+
+    def _merge_record(self, rec):
+        """
+        Merge a per-thread (or per-task) record of called functions,
+        consisting of a tuple of an edge table dict and the thread name,
+        into the main record.
+        """
+
+        edges, thrnm = rec
+        names = self._names
+        thrcts = self._thrcts.setdefault(thrnm, {})
+        # Other threads may still be recording calls in the record, so
+        # a snapshot of the edge table is merged since a dict can not be
+        # iterated while it changes size. Construction of the snapshot
+        # is atomic.
+        for k, c in list(edges.items()):
+            self._edges[k] = self._edges.get(k, 0) + c
+            thrcts[k] = thrcts.get(k, 0) + c
+            if k & _IDMASK:
+                key = (names[k >> _IDBITS], names[k & _IDMASK])
+                if key in self.thread:
+                    if thrnm not in self.thread[key]:
+                        self.thread[key].append(thrnm)
+                else:
+                    self.thread[key] = [thrnm, ]
+        self._counted = False
+
+
+    def _group_threads(self):
+        """
+        Construct groups by assigning each function to the thread in
+        which it has the highest total count of calls in both caller
+        and called roles.
+        """
+
+        names = self._names
+        best = {}
+        for thrnm, edges in self._thrcts.items():
+            # Total counts in both roles for each function in this thread
+            cts = {}
+            for k, c in edges.items():
+                for i in (k >> _IDBITS, k & _IDMASK):
+                    if i:
+                        cts[i] = cts.get(i, 0) + c
+            for i, n in cts.items():
+                k = names[i]
+                if k not in best or n > best[k][0]:
+                    best[k] = (n, thrnm)
+        for k in self.fncts:
+            # Functions merged from shard files have no thread record
+            if k not in best:
+                continue
+            thrnm = best[k][1]
+            if thrnm in self.group:
+                self.group[thrnm].append(k)
+            else:
+                self.group[thrnm] = [k, ]
+
+
+
+    def _config(self):
+        """
+        Get a dict of initialiser keyword arguments that construct a
+        call tracer with the same configuration as this one.
+        """
+
+        return {'srcmodflt': self.srcmodflt.pattern,
+                'dstmodflt': self.dstmodflt.pattern,
+                'srcqnmflt': self.srcqnmflt.pattern,
+                'dstqnmflt': self.dstqnmflt.pattern,
+                'fnmsub': self.fnmsub,
+                'grpflt': None if self.grpflt is None else self.grpflt.pattern,
+                'lnksub': self.lnksub, 'backend': self.backend,
+                'threads': self.threads, 'grpthr': self.grpthr,
+                'shrdir': self.shrdir, 'aio': self.aio,
+                'grptsk': self.grptsk, 'timing': self.timing,
+                'cct': self.cct, 'cctdepth': self.cctdepth}
+
+
+    def _start_shards(self):
+        """
+        Arrange for child processes to be traced with the same
+        configuration as this call tracer.
+        """
+
+        global _shard_tracer, _fork_handler, _spawn_handler
+
+        os.makedirs(self.shrdir, exist_ok=True)
+        # Child processes that call process_startup start a call tracer
+        # if this environment variable is set
+        os.environ[_SHARD_ENV] = json.dumps(self._config())
+        # Forked child processes continue tracing with their copy of
+        # this call tracer
+        _shard_tracer = self
+        if not _fork_handler and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_fork_child)
+            _fork_handler = True
+        # Processes started by multiprocessing with the 'spawn' or
+        # 'forkserver' methods start a call tracer when the data passed
+        # to them by their parent process is unpickled. The function
+        # constructing that data is only replaced while child processes
+        # are traced.
+        if _spawn_handler is None:
+            from multiprocessing import spawn
+            _spawn_handler = spawn.get_preparation_data
+            spawn.get_preparation_data = _preparation_data(_spawn_handler)
+
+
+    def _stop_shards(self):
+        """
+        Stop child processes from being traced.
+        """
+
+        global _shard_tracer, _spawn_handler
+
+        os.environ.pop(_SHARD_ENV, None)
+        if _shard_tracer is self:
+            _shard_tracer = None
+            if _spawn_handler is not None:
+                from multiprocessing import spawn
+                spawn.get_preparation_data = _spawn_handler
+                _spawn_handler = None
+
+
+    def _register_shard(self):
+        """
+        Arrange for the records of a call tracer in a child process to
+        be written to a shard file on exit.
+        """
+
+        self._shrdone = False
+        atexit.register(self._write_shard)
+        # Processes started by multiprocessing exit without running
+        # atexit handlers, and clear the registry of multiprocessing
+        # finalizers at startup, so a finalizer is registered after
+        # that, via the multiprocessing after-fork mechanism
+        if 'multiprocessing' in sys.modules:
+            from multiprocessing import util
+            util.register_after_fork(self, CallTracer._finalize_shard)
+
+
+    @staticmethod
+    def _finalize_shard(ct):
+        """
+        Register a multiprocessing finalizer that writes a shard file.
+        """
+
+        from multiprocessing import util
+        util.Finalize(ct, ct._write_shard, exitpriority=0)
+
+
+    def _write_shard(self):
+        """
+        Stop tracing and write the records of this call tracer to a
+        shard file named according to the current process id.
+        """
+
+        if self._shrdone:
+            return
+        self._shrdone = True
+        self.stop()
+        self._dump_shard(self.shrdir)
+
+
+    def _dump_shard(self, shrdir):
+        """
+        Write the records of this call tracer to a shard file, named
+        according to the current process id, in the specified directory.
+        """
+
+        pth = os.path.join(shrdir, 'jonga-%d.shard' % os.getpid())
+        # Write to a temporary file that is renamed on completion so
+        # that a partial shard file is never merged
+        with open(pth + '.tmp', 'w') as fd:
+            fd.write(json.dumps(['h', __version__, os.getpid()]) + '\n')
+            names = self._names
+            for k, c in self._edges.items():
+                src = names[k >> _IDBITS]
+                dst = names[k & _IDMASK]
+                fd.write(json.dumps(['c', src, dst, c,
+                                     self.thread.get((src, dst), [])]) +
+                         '\n')
+        os.replace(pth + '.tmp', pth)
+
+
+    def merge(self, pth):
+        """
+        Merge records from shard files written by traced child
+        processes into the records of this call tracer. Shard files are
+        read one record at a time so that memory usage does not depend
+        on the number of shard files.
+
+        Parameters
+        ----------
+        pth : string or list of strings
+          Path of a shard file or of a directory containing shard files,
+          or a list of such paths
+        """
+
+        if isinstance(pth, str):
+            pth = [pth, ]
+        for p in pth:
+            if os.path.isdir(p):
+                fnms = sorted(glob(os.path.join(p, 'jonga-*.shard')))
+            else:
+                fnms = [p, ]
+            for fnm in fnms:
+                with open(fnm) as fd:
+                    for line in fd:
+                        rec = json.loads(line)
+                        if rec[0] == 'c':
+                            self._addcall(rec[1], rec[2], rec[3])
+                            k = (rec[1], rec[2])
+                            for thrnm in rec[4]:
+                                if k not in self.thread:
+                                    self.thread[k] = []
+                                if thrnm not in self.thread[k]:
+                                    self.thread[k].append(thrnm)
+
+        self._build_group()
+
+
+    def save(self, pth, append=False, compress=True):
+        """
+        Save the record of called functions to a compact binary trace
+        file, which can be read via :meth:`load`. The file consists of
+        a header followed by a sequence of blocks, each of which is
+        either a table of function names, an edge table (or table of
+        call times) consisting of pairs of little-endian 64 bit
+        unsigned integers, each a key and the corresponding count (or
+        time in ns), or the group structure. Uncompressed blocks may be
+        used directly via a memory map of the file.
+
+        Parameters
+        ----------
+        pth : string
+          Path of the trace file
+        append : bool, optional (default False)
+          If True, and the file was last written by this method of the
+          same call tracer, append blocks containing only the function
+          names, calls, and call times recorded since it was written,
+          so that a long-running trace can be checkpointed at low cost.
+          Otherwise the file is overwritten.
+        compress : bool, optional (default True)
+          If True, compress the blocks using zlib.
+        """
+
+        apth = os.path.abspath(pth)
+        if append and os.path.exists(pth):
+            if self._ckpt is None or self._ckpt[0] != apth:
+                raise ValueError('File %s was not last written by this call '
+                                 'tracer' % pth)
+            nname, prev = self._ckpt[1], self._ckpt[2]
+            mode = 'ab'
+        else:
+            nname, prev = 1, ({}, {}, {}, {})
+            mode = 'wb'
+        # Copies are taken so that records modified by active tracing
+        # are not iterated over
+        names = self._names[:]
+        cur = [dict(d) for d in (self._edges, self._etime, self._tincl,
+                                 self._texcl)]
+
+        with open(pth, mode) as fd:
+            if mode == 'wb':
+                fd.write(_TRACE_MAGIC + struct.pack('<I', _TRACE_VERSION))
+            if len(names) > nname:
+                _write_block(fd, b'S', '\0'.join(names[nname:]).encode(
+                    'utf-8'), compress)
+            # Blocks of counts of calls, call times, and inclusive and
+            # exclusive function times, containing the differences with
+            # respect to the previously written records
+            for kind, crnt, prvs in zip((b'E', b'T', b'I', b'X'), cur, prev):
+                a = array('Q')
+                for k, v in crnt.items():
+                    d = v - prvs.get(k, 0)
+                    if d:
+                        a.append(k)
+                        a.append(d)
+                if a:
+                    if sys.byteorder != 'little':
+                        a.byteswap()
+                    _write_block(fd, kind, a.tobytes(), compress)
+            _write_block(fd, b'G', json.dumps(self.group).encode('utf-8'),
+                         compress)
+        self._ckpt = (apth, len(names), cur)
+
+
+    def load(self, pth):
+        """
+        Load records of called functions from a trace file written by
+        :meth:`save`, or from an event log file written in event log
+        mode (see the `evlog` parameter of :class:`CallTracer`), adding
+        them to the records of this call tracer. Event logs are
+        aggregated one block at a time, so that memory usage does not
+        depend on the length of the log. An incomplete block at the end
+        of the file, as may result from interruption of the writing of a
+        checkpoint, is ignored.
+
+        Parameters
+        ----------
+        pth : string
+          Path of the trace file
+        """
+
+        names = [None, ]
+        recs = {b'E': {}, b'T': {}, b'I': {}, b'X': {}}
+        group = None
+        # Dict associating thread identifiers in an event log with
+        # thread names, and dict associating thread identifiers with
+        # edge tables of the events in the corresponding thread
+        thrnms = {}
+        thrrecs = {}
+        for kind, data in _read_blocks(pth):
+            if kind == b'S':
+                names.extend(data.decode('utf-8').split('\0'))
+            elif kind == b'G':
+                group = json.loads(data.decode('utf-8'))
+            elif kind == b'H':
+                thrnms.update({int(k): v for k, v in
+                               json.loads(data.decode('utf-8')).items()})
+            elif kind == b'V':
+                a = _uint64(data)
+                rec = recs[b'E']
+                for k, c in Counter(a[0::3]).items():
+                    rec[k] = rec.get(k, 0) + c
+                # Events are only attributed to threads if thread names
+                # were recorded
+                if thrnms:
+                    for (tid, k), c in Counter(zip(a[2::3],
+                                                   a[0::3])).items():
+                        rec = thrrecs.setdefault(tid, {})
+                        rec[k] = rec.get(k, 0) + c
+            elif kind in recs:
+                a = _uint64(data)
+                rec = recs[kind]
+                for i in range(0, len(a), 2):
+                    rec[a[i]] = rec.get(a[i], 0) + a[i + 1]
+
+        # Map node ids in the file to node ids of this call tracer
+        idmap = [0, ] + [self._intern(nm) for nm in names[1:]]
+        for kind, dst in ((b'E', self._edges), (b'T', self._etime)):
+            for k, v in recs[kind].items():
+                k = (idmap[k >> _IDBITS] << _IDBITS) | idmap[k & _IDMASK]
+                dst[k] = dst.get(k, 0) + v
+        for kind, dst in ((b'I', self._tincl), (b'X', self._texcl)):
+            for k, v in recs[kind].items():
+                dst[idmap[k]] = dst.get(idmap[k], 0) + v
+        self._counted = False
+        # Construct per-thread records from an event log if required
+        names = self._names
+        for tid, rec in thrrecs.items():
+            thrnm = thrnms.get(tid, str(tid))
+            thrcts = self._thrcts.setdefault(thrnm, {})
+            for k, c in rec.items():
+                k = (idmap[k >> _IDBITS] << _IDBITS) | idmap[k & _IDMASK]
+                thrcts[k] = thrcts.get(k, 0) + c
+                if k & _IDMASK:
+                    key = (names[k >> _IDBITS], names[k & _IDMASK])
+                    if key in self.thread:
+                        if thrnm not in self.thread[key]:
+                            self.thread[key].append(thrnm)
+                    else:
+                        self.thread[key] = [thrnm, ]
+
+        if group is None:
+            self._build_group()
+        else:
+            for k in group:
+                if k not in self.group:
+                    self.group[k] = []
+                for l in group[k]:
+                    if l not in self.group[k]:
+                        self.group[k].append(l)
+
+
+    def prune(self, roots=None, depth=None, mincount=None, topk=None,
+              key='count', collapse=False):
+        """
+        Construct a call tracer with a reduced record of called
+        functions, so that the call graph of a large trace can be laid
+        out in reasonable time and is readable. The reductions are
+        applied in the order of the parameters below, and operate
+        directly on the edge table, so that they remain fast for very
+        large records.
+
+        Parameters
+        ----------
+        roots : None or list of strings, optional (default None)
+          Names of functions from which the retained calls must be
+          reachable. If None, and `depth` is not None, the functions
+          that are not called by any other recorded function are used.
+        depth : None or int, optional (default None)
+          Maximum number of calls on the path from one of the functions
+          in `roots` to a retained call. If None, and `roots` is not
+          None, the depth is not limited.
+        mincount : None or int, optional (default None)
+          If not None, calls of or by functions with a total count of
+          occurrences in caller and called roles less than this value
+          are removed.
+        topk : None or int, optional (default None)
+          If not None, only retain this number of calls with the
+          largest count or total time.
+        key : string, optional (default 'count')
+          Ranking of calls for `topk`, either 'count' for the number of
+          calls or 'time' for the total time of calls (only applicable
+          if call times were recorded).
+        collapse : bool, optional (default False)
+          If True, replace each chain of two or more functions, each of
+          which is called by a single function and calls a single
+          function, by a single node, named by the first and last
+          functions of the chain.
+
+        Returns
+        -------
+        ct : :class:`CallTracer` object
+          Call tracer with the reduced record of called functions
+        """
+
+        if key not in ('count', 'time'):
+            raise ValueError('Unrecognized ranking key %s' % key)
+        nsrc, ndst = self._counts()
+        # Calls of functions that could not be determined are not graph
+        # edges, and are not retained. Their keys are removed by node id
+        # since this is much faster than a test of every key.
+        edges = dict(self._edges)
+        for i in range(1, len(self._names)):
+            edges.pop(i << _IDBITS, None)
+
+        # Retain only calls reachable from the root functions, by a
+        # breadth first search of the call graph
+        if roots is not None or depth is not None:
+            if roots is None:
+                level = {i for i in range(1, len(nsrc)) if nsrc[i] and
+                         not ndst[i]}
+            else:
+                level = {self._nodeid[r] for r in roots if r in
+                         self._nodeid}
+            succ = {}
+            for k in edges:
+                succ.setdefault(k >> _IDBITS, []).append(k)
+            seen = set(level)
+            keep = set()
+            d = 0
+            while level and (depth is None or d < depth):
+                nxt = set()
+                for i in level:
+                    for k in succ.get(i, ()):
+                        keep.add(k)
+                        j = k & _IDMASK
+                        if j not in seen:
+                            seen.add(j)
+                            nxt.add(j)
+                level = nxt
+                d += 1
+            edges = {k: edges[k] for k in keep}
+
+        # Remove calls of or by infrequently occurring functions
+        if mincount is not None:
+            ok = bytes([nsrc[i] + ndst[i] >= mincount for i in
+                        range(len(nsrc))])
+            edges = {k: c for k, c in edges.items() if ok[k >> _IDBITS] and
+                     ok[k & _IDMASK]}
+
+        # Retain the highest ranked calls
+        if topk is not None:
+            # Ranking (value, key) pairs avoids a key function call for
+            # every call, which is the dominant cost for large records
+            if key == 'count':
+                rank = zip(edges.values(), edges.keys())
+            else:
+                etime = self._etime
+                rank = [(etime.get(k, 0), k) for k in edges]
+            edges = {k: edges[k] for t, k in heapq.nlargest(topk, rank)}
+
+        # Dict associating node ids of functions in collapsed chains
+        # with the name of the corresponding chain node
+        chain = {}
+        # Dict associating chain node names with the node ids of the
+        # functions in the chain
+        chains = {}
+        if collapse:
+            indeg = Counter([k & _IDMASK for k in edges])
+            outdeg = Counter([k >> _IDBITS for k in edges])
+            # Single calling and called function of each function in a
+            # chain
+            pred = {}
+            succ = {}
+            for k in edges:
+                i, j = k >> _IDBITS, k & _IDMASK
+                if i != j:
+                    succ[i] = j
+                    pred[j] = i
+            link = {i for i in succ if indeg[i] == 1 and outdeg[i] == 1
+                    and i in pred}
+            # Each chain starts at a function with a calling function
+            # that is not in a chain, so chains that are cycles are not
+            # collapsed
+            for i in link:
+                if pred[i] in link:
+                    continue
+                lst = [i, ]
+                while succ[lst[-1]] in link:
+                    lst.append(succ[lst[-1]])
+                if len(lst) > 1:
+                    nm = '%s ... %s' % (self._names[lst[0]],
+                                        self._names[lst[-1]])
+                    chains[nm] = lst
+                    for j in lst:
+                        chain[j] = nm
+
+        # Construct the reduced record
+        ct = CallTracer(**self._config())
+        names = self._names
+        for k, c in edges.items():
+            i, j = k >> _IDBITS, k & _IDMASK
+            src = chain.get(i, names[i])
+            dst = chain.get(j, names[j])
+            # Calls within a chain are not retained
+            if i in chain and j in chain and src == dst:
+                continue
+            nk = (ct._intern(src) << _IDBITS) | ct._intern(dst)
+            ct._edges[nk] = ct._edges.get(nk, 0) + c
+            if k in self._etime:
+                ct._etime[nk] = ct._etime.get(nk, 0) + self._etime[k]
+            if (names[i], names[j]) in self.thread:
+                thrnms = ct.thread.setdefault((src, dst), [])
+                for thrnm in self.thread[(names[i], names[j])]:
+                    if thrnm not in thrnms:
+                        thrnms.append(thrnm)
+        ct._counted = False
+        # The inclusive time of a chain node is that of the first
+        # function, and the exclusive time is the total of those of all
+        # of the functions of the chain
+        for i in range(1, len(names)):
+            if names[i] in ct._nodeid and i in self._texcl:
+                ci = ct._nodeid[names[i]]
+                ct._tincl[ci] = self._tincl.get(i, 0)
+                ct._texcl[ci] = self._texcl[i]
+        for nm, lst in chains.items():
+            if nm in ct._nodeid and lst[0] in self._texcl:
+                ci = ct._nodeid[nm]
+                ct._tincl[ci] = self._tincl.get(lst[0], 0)
+                ct._texcl[ci] = sum([self._texcl.get(j, 0) for j in lst])
+        for k, n in self.resume.items():
+            if k in ct._nodeid:
+                ct.resume[k] = n
+
+        # Retain the groups of the retained functions, with chain nodes
+        # in the group of the first function of the chain
+        fngrp = {}
+        for k in self.group:
+            for l in self.group[k]:
+                fngrp[l] = k
+        for nm, lst in chains.items():
+            if names[lst[0]] in fngrp:
+                fngrp[nm] = fngrp[names[lst[0]]]
+        for k in self.group:
+            ct.group[k] = []
+        for k in ct.fncts:
+            if k in fngrp:
+                ct.group[fngrp[k]].append(k)
+        ct.group = {k: v for k, v in ct.group.items() if v}
+
+        return ct
+
+
+
+    def _grpids(self, grpflt):
+        """
+        Get a list, indexed by node id, of the group names of the
+        corresponding functions, or None for functions that are not in
+        a group. If `grpflt` is None, the groups are those of the group
+        structure, otherwise they are determined by applying the regex
+        to the function names, with the group name being the first
+        capture group of the regex if it has one, or otherwise the whole
+        match.
+        """
+
+        names = self._names
+        if grpflt is None:
+            fngrp = {}
+            for k in self.group:
+                for l in self.group[k]:
+                    fngrp[l] = k
+            return [None, ] + [fngrp.get(nm) for nm in names[1:]]
+        cp = re.compile(grpflt)
+        gids = [None, ]
+        for nm in names[1:]:
+            m = cp.search(nm)
+            if m is None:
+                gids.append(None)
+            else:
+                gids.append(m.group(1) if cp.groups else m.group(0))
+        return gids
+
+
+    def _subrecord(self, keys, nmap, group):
+        """
+        Construct a call tracer with the calls in the edge table with
+        the specified keys, with functions renamed, and counts and
+        times of calls and exclusive times of functions summed
+        accordingly.
+
+        Parameters
+        ----------
+        keys : iterable of int
+          Edge table keys of the calls to be included
+        nmap : list of strings
+          Names of functions in the constructed record, indexed by node
+          id in this record
+        group : dict
+          Group structure of the constructed record
+
+        Returns
+        -------
+        ct : :class:`CallTracer` object
+          Call tracer with the constructed record
+        """
+
+        ct = CallTracer(**self._config())
+        nodes = set()
+        for k in keys:
+            i, j = k >> _IDBITS, k & _IDMASK
+            nodes.add(i)
+            nodes.add(j)
+            nk = (ct._intern(nmap[i]) << _IDBITS) | ct._intern(nmap[j])
+            ct._edges[nk] = ct._edges.get(nk, 0) + self._edges[k]
+            if k in self._etime:
+                ct._etime[nk] = ct._etime.get(nk, 0) + self._etime[k]
+        # Inclusive times are not defined for renamed functions that
+        # correspond to more than one function
+        cnt = Counter([nmap[i] for i in nodes])
+        for i in nodes:
+            if i in self._texcl:
+                ci = ct._nodeid[nmap[i]]
+                ct._texcl[ci] = ct._texcl.get(ci, 0) + self._texcl[i]
+                if cnt[nmap[i]] == 1:
+                    ct._tincl[ci] = self._tincl.get(i, 0)
+        ct._counted = False
+        ct.group = {k: [l for l in v if l in ct._nodeid] for k, v in
+                    group.items()}
+        ct.group = {k: v for k, v in ct.group.items() if v}
+        return ct
+
+
+    def condense(self, grpflt=None):
+        """
+        Construct a call tracer in which all of the functions in each
+        group are represented by a single node, named by the group name,
+        with the counts of calls between groups summed. Calls between
+        functions in the same group are not included. Functions that
+        are not in a group are retained as individual nodes. This
+        provides an overview of the call graph of a large record that
+        can be laid out quickly.
+
+        Parameters
+        ----------
+        grpflt : None or regex string, optional (default None)
+          A regex for extracting a group name from each function name,
+          which is the first capture group of the regex if it has one,
+          otherwise the whole match. If None, the groups of the group
+          structure of this call tracer are used.
+
+        Returns
+        -------
+        ct : :class:`CallTracer` object
+          Call tracer with the condensed record
+        """
+
+        gids = self._grpids(grpflt)
+        nmap = [g if g is not None else nm for g, nm in zip(gids,
+                                                            self._names)]
+        keys = [k for k in self._edges if k & _IDMASK and
+                (gids[k >> _IDBITS] is None or
+                 gids[k >> _IDBITS] != gids[k & _IDMASK])]
+        return self._subrecord(keys, nmap, {})
+
+
+    def expand(self, grp, grpflt=None):
+        """
+        Construct a call tracer with the calls by and of the functions
+        in the specified group, in which all of the functions in each
+        other group are represented by a single node, as in
+        :meth:`condense`.
+
+        Parameters
+        ----------
+        grp : string
+          Group name
+        grpflt : None or regex string, optional (default None)
+          A regex for extracting a group name from each function name,
+          as for :meth:`condense`.
+
+        Returns
+        -------
+        ct : :class:`CallTracer` object
+          Call tracer with the record of calls of the group
+        """
+
+        gids = self._grpids(grpflt)
+        keys = [k for k in self._edges if k & _IDMASK and
+                grp in (gids[k >> _IDBITS], gids[k & _IDMASK])]
+        return self._expand(grp, gids, keys)
+
+
+    def _expand(self, grp, gids, keys):
+        """
+        Construct the call tracer of :meth:`expand` from the group
+        names of each node id and the edge table keys of the calls by
+        and of the functions in the group.
+        """
+
+        names = self._names
+        nmap = [nm if g is None or g == grp else g for g, nm in
+                zip(gids, names)]
+        members = [names[i] for i in range(1, len(names)) if gids[i] == grp]
+        return self._subrecord(keys, nmap, {grp: members})
+
+
+    def hierarchy(self, pth, ext='.svg', grpflt=None, **kwargs):
+        """
+        Write an overview call graph, constructed by :meth:`condense`,
+        and a detail call graph for each group, constructed by
+        :meth:`expand`, to files in the specified directory. Each group
+        node has an href attribute linking to the file of the detail
+        call graph of that group, so that a large call graph can be
+        navigated as a set of small graphs. The files are written via
+        :meth:`dot`, so pygraphviz is not required.
+
+        Parameters
+        ----------
+        pth : string
+          Path of the directory in which the files are written, which
+          is created if it does not exist. The overview call graph is
+          written to file ``index`` and the detail call graph of each
+          group to a file named by the group name, with characters
+          other than letters, digits, ``.``, ``-``, and ``_`` replaced
+          by ``_``, and with a numeric suffix if required to avoid a
+          name clash, each with the specified extension.
+        ext : string, optional (default '.svg')
+          File extension determining the file type
+        grpflt : None or regex string, optional (default None)
+          A regex for extracting a group name from each function name,
+          as for :meth:`condense`.
+        **kwargs
+          Keyword arguments for :meth:`dot`
+
+        Returns
+        -------
+        fnms : dict
+          Dict associating group names with the paths of the
+          corresponding detail call graph files, and None with the path
+          of the overview call graph file
+        """
+
+        os.makedirs(pth, exist_ok=True)
+        gids = self._grpids(grpflt)
+        # Distribute the calls between the groups of the calling and
+        # called functions in a single pass over the edge table
+        grpkeys = {g: [] for g in gids if g is not None}
+        for k in self._edges:
+            if not k & _IDMASK:
+                continue
+            gs, gd = gids[k >> _IDBITS], gids[k & _IDMASK]
+            if gs is not None:
+                grpkeys[gs].append(k)
+            if gd is not None and gd != gs:
+                grpkeys[gd].append(k)
+        # Group names are converted to file names by replacing
+        # characters other than letters, digits, '.', '-', and '_',
+        # which could otherwise construct a path outside of the
+        # directory or an invalid link, and file names that are
+        # already taken, including that of the overview call graph,
+        # are made distinct by appending a number
+        href = {}
+        used = {'index'}
+        for g in sorted(grpkeys):
+            base = re.sub(r'[^\w.-]+', '_', g)
+            name, n = base, 1
+            while name in used:
+                name = '%s_%d' % (base, n)
+                n += 1
+            used.add(name)
+            href[g] = name + ext
+        fnms = {None: os.path.join(pth, 'index' + ext)}
+        ct = self.condense(grpflt)
+        ct.href = href
+        ct.dot(fnms[None], **kwargs)
+        for g in sorted(grpkeys):
+            ct = self._expand(g, gids, grpkeys[g])
+            ct.href = {h: l for h, l in href.items() if h != g}
+            fnms[g] = os.path.join(pth, href[g])
+            ct.dot(fnms[g], **kwargs)
+        return fnms
+
+
+
+    @staticmethod
+    def _clrgen(n, h0, hr):
+        """Default colour generating function.
+
+        Parameters
+        ----------
+
+        n : int
+          Number of colours to generate
+        h0 : float
+          Initial H value in HSV colour specification
+        hr : float
+          Size of H value range to use for colour generation
+          (final H value is h0 + hr)
+
+        Returns
+        -------
+        clst : list of strings
+          List of HSV format colour specification strings
+        """
+
+        n0 = n if n == 1 else n-1
+        clst = ['%f,%f,%f' % (h0 + hr*hi/n0, 0.35, 0.85) for
+                hi in range(n)]
+        return clst
+
+
+    def graph(self, fnm=None, size=None, fntsz=None, fntfm=None, clrgen=None,
+              rmsz=False, prog='dot', timesc=None, pos=False, cache=None):
+        """
+        Construct call graph.
+
+        Parameters
+        ----------
+        fnm : None or string, optional (default None)
+          Filename of graph file to be written. File type is determined
+          by the file extensions (e.g. dot for 'graph.dot' and SVG for
+          'graph.svg'). If None, a file is not written.
+        size : string or None, optional (default None)
+          Graph image size specification string.
+        fntsz : int or None, optional (default None)
+          Font size for text.
+        fntnm : string or None, optional (default None)
+          Font family specification string.
+        clrgen : function or None, optional (default None)
+          Function to call to generate the group colours. This function
+          should take an integer specifying the number of groups as an
+          argument and return a list of graphviz-compatible colour
+          specification strings.
+        rmsz : bool, optional (default False)
+          If True, remove the width and height specifications from an
+          SVG format output file so that the size scales properly when
+          viewed in a web browser
+        prog : string, optional (default 'dot')
+          Name of graphviz layout program to use.
+        timesc : None or string, optional (default None)
+          If 'edge', the width of each edge is scaled by the total time
+          of the corresponding calls, if 'node', the fill colour of each
+          node indicates the exclusive time of the corresponding
+          function, overriding the group colour, and if 'both', both
+          are applied. Only applicable if call times were recorded (see
+          the `timing` parameter of :class:`CallTracer`).
+        pos : bool, optional (default False)
+          If True, run the layout program so that node and edge
+          positions are included in the returned graph and in a DOT
+          format output file. Layout is always performed, irrespective
+          of this option, when an image file is written.
+        cache : None or :class:`RenderCache` object, optional (default None)
+          If not None, a cache of previously written graph files. If
+          the cache contains a file written from an identical graph
+          with the same options, it is copied instead of constructing
+          the graph, performing layout, and writing the file, and
+          otherwise the written file is added to the cache.
+
+        Returns
+        -------
+        pgr : pygraphviz.AGraph or None
+          Call graph of traced function calls, or None if a graph file
+          was copied from `cache` and `pos` is False
+        """
+
+        # Import of pygraphviz is deferred until it is required since it
+        # is slow, and is not available on hosts without Graphviz
+        try:
+            import pygraphviz as pgv
+        except ImportError:
+            raise ImportError('Method graph requires pygraphviz; method dot '
+                              'constructs a DOT format graph without it')
+
+        # Construct DOT format graph description, which is parsed by
+        # pygraphviz in a single call rather than constructing the graph
+        # node by node via the pygraphviz interface
+        src = self.dot(size=size, fntsz=fntsz, fntfm=fntfm, clrgen=clrgen,
+                       timesc=timesc)
+
+        # If a cached copy of the graph file exists, use it, and only
+        # construct the graph, and call the layout program, if
+        # positions are requested, since parsing of a large graph is
+        # also expensive
+        ext = None if fnm is None else os.path.splitext(fnm)[1]
+        if cache is not None and fnm is not None:
+            key = cache.key(src, ext, rmsz, prog, pos)
+            if cache.get(key, fnm):
+                if not pos:
+                    return None
+                g = pgv.AGraph(string=src)
+                g.layout(prog=prog)
+                return g
+
+        g = pgv.AGraph(string=src)
+
+        # Call layout program if positions are requested or an image
+        # file is to be written, since layout of a large graph is very
+        # expensive
+        if pos or (ext is not None and ext != '.dot'):
+            g.layout(prog=prog)
+
+        # Write graph file if filename provided
+        if fnm is not None:
+            if ext == '.dot':
+                if pos:
+                    g.write(fnm)
+                else:
+                    with open(fnm, 'w') as fd:
+                        fd.write(src)
+            else:
+                if ext == '.svg' and rmsz:
+                    img = _svg_rmsize(g.draw(format='svg').decode('utf-8'))
+                    with open(fnm, 'w') as fd:
+                        fd.write(img)
+                else:
+                    g.draw(fnm)
+            if cache is not None:
+                cache.put(key, fnm)
+
+        # Return graph object
+        return g
+
+
+    def dot(self, fnm=None, size=None, fntsz=None, fntfm=None, clrgen=None,
+            rmsz=False, prog='dot', timesc=None, pos=False):
+        """
+        Construct DOT format description of call graph without the use
+        of pygraphviz. A DOT format file is written directly, and the
+        Graphviz layout program is only run if an image file is to be
+        written.
+
+        Parameters
+        ----------
+        fnm : None or string, optional (default None)
+          Filename of graph file to be written. File type is determined
+          by the file extensions (e.g. dot for 'graph.dot' and SVG for
+          'graph.svg'). If None, a file is not written.
+        size : string or None, optional (default None)
+          Graph image size specification string.
+        fntsz : int or None, optional (default None)
+          Font size for text.
+        fntnm : string or None, optional (default None)
+          Font family specification string.
+        clrgen : function or None, optional (default None)
+          Function to call to generate the group colours, as for
+          :meth:`graph`.
+        rmsz : bool, optional (default False)
+          If True, remove the width and height specifications from an
+          SVG format output file.
+        prog : string, optional (default 'dot')
+          Name of graphviz layout program executable to use.
+        timesc : None or string, optional (default None)
+          Time scaling of edges and nodes, as for :meth:`graph`.
+        pos : bool, optional (default False)
+          If True, run the layout program so that node and edge
+          positions are included in the returned description and in a
+          DOT format output file.
+
+        Returns
+        -------
+        src : string
+          DOT format description of call graph of traced function calls
+        """
+
+        # Default colour generation function
+        if clrgen is None:
+            clrgen = lambda n: self._clrgen(n, 0.330, 0.825)
+
+        # Generate color list
+        clrlst = clrgen(len(self.group))
+
+        # Maximum edge and function exclusive times for scaling of edge
+        # widths and node colours
+        if timesc is not None:
+            if timesc not in ('edge', 'node', 'both'):
+                raise ValueError('Unrecognized time scaling %s' % timesc)
+            ctime = self.ctime
+            ctmax = max(ctime.values(), default=0.0) or 1.0
+            ftime = self.ftime
+            ftmax = max([t[1] for t in ftime.values()], default=0.0) or 1.0
+
+        # Graph and default node attributes
+        lines = ['digraph {',
+                 '\tgraph %s;' % _dot_attr(
+                     dict(landscape=False, rankdir='LR', newrank=True,
+                          fontsize=fntsz, fontname=fntfm, size=size,
+                          ratio='compress', color='black',
+                          bgcolor='#ffffff00')),
+                 '\tnode %s;' % _dot_attr(
+                     dict(penwidth=0.25, shape='box',
+                          style='rounded,filled'))]
+
+        # Record of group number of each function in a group
+        fngrpnm = {}
+        grpnms = sorted(self.group)
+        for n, k in enumerate(grpnms):
+            for l in self.group[k]:
+                fngrpnm[l] = n
+
+        # Iterate over functions adding them as graph nodes
+        fncts = self.fncts
+        for k in fncts:
+            attr = dict(fontsize=fntsz, fontname=fntfm)
+            # If an href is defined for the node, or if lnksub regex pair
+            # is provided, compute an href link target from the node name
+            # and add it as an attribute to the node
+            if k in self.href:
+                attr['href'] = self.href[k]
+                attr['target'] = '_top'
+            elif self.lnksub is not None:
+                attr['href'] = re.sub(self.lnksub[0], self.lnksub[1], k)
+                attr['target'] = '_top'
+            # If function has no calls to it, set its rank to "source"
+            if fncts[k][1] == 0:
+                attr['rank'] = 'source'
+            # If function is in a group, set common group colour
+            if k in fngrpnm:
+                attr['fillcolor'] = clrlst[fngrpnm[k]]
+            # If node colour time scaling is selected, set node colour
+            # saturation proportional to exclusive time
+            if timesc in ('node', 'both'):
+                ft = ftime.get(k, (0.0, 0.0))
+                attr['fillcolor'] = '%f,%f,%f' % (0.0, 0.8 * ft[1] / ftmax,
+                                                  0.95)
+                attr['tooltip'] = '%s\n%.3e s inclusive\n' \
+                    '%.3e s exclusive' % ((k,) + ft)
+            lines.append('\t%s %s;' % (_dot_id(k), _dot_attr(attr)))
+
+        # If groups defined, construct a subgraph for each containing
+        # the nodes in the group
+        for n, k in enumerate(grpnms):
+            lines.append('\tsubgraph %s {' % _dot_id('cluster_' + k))
+            lines.append('\t\tgraph %s;' % _dot_attr(
+                dict(label=k, penwidth=2, style='dotted',
+                     pencolor=clrlst[n])))
+            lines.extend(['\t\t%s;' % _dot_id(l) for l in self.group[k]])
+            lines.append('\t}')
+
+        # Iterate over function calls, adding each as an edge
+        for k in self.calls:
+            # If calling function is in a group, set edge colour
+            # according to its group, otherwise set a standard colour
+            if k[0] in fngrpnm:
+                attr = dict(penwidth=2, color=clrlst[fngrpnm[k[0]]])
+            else:
+                attr = dict(color='grey')
+            # If edge time scaling is selected, set edge width according
+            # to total call time
+            if timesc in ('edge', 'both'):
+                attr['penwidth'] = 0.5 + 7.5 * ctime.get(k, 0.0) / ctmax
+                attr['tooltip'] = '%.3e s' % ctime.get(k, 0.0)
+            lines.append('\t%s -> %s %s;' % (_dot_id(k[0]), _dot_id(k[1]),
+                                             _dot_attr(attr)))
+        lines.append('}\n')
+        src = '\n'.join(lines)
+
+        # Run the layout program if positions are requested
+        if pos:
+            src = _run_layout(prog, 'dot', src).decode('utf-8')
+
+        # Write graph file if filename provided, running the layout
+        # program if an image format is requested
+        if fnm is not None:
+            ext = os.path.splitext(fnm)[1]
+            if ext == '.dot':
+                with open(fnm, 'w') as fd:
+                    fd.write(src)
+            else:
+                img = _run_layout(prog, ext[1:], src)
+                if ext == '.svg' and rmsz:
+                    img = _svg_rmsize(img.decode('utf-8')).encode('utf-8')
+                with open(fnm, 'wb') as fd:
+                    fd.write(img)
+
+        return src
+
+
+    def __str__(self):
+        """Get string representation."""
+
+        s = ''
+        fncts = self.fncts
+        for k in fncts:
+            s += '%-40s   %2d  %2d\n' % (k, fncts[k][0], fncts[k][1])
+        calls = self.calls
+        for k in calls:
+            s += '%-35s  ->  %-35s  %2d\n' % (k[0], k[1], calls[k])
+        for k in self.group:
+            s += '%s\n    ' % k
+            for l in self.group[k]:
+                s += '%s  ' % l
+            s += '\n'
+        return s
+
+
+
+
+class SamplingCallTracer(CallTracer):
+    """
+    Manage construction of a call graph by periodically sampling the
+    call stacks of running threads instead of tracing every call. The
+    overhead is bounded by the sampling interval, but the recorded
+    counts are the number of samples in which each call was observed
+    rather than the number of calls.
+    """
+
+    def __init__(self, srcmodflt=None, dstmodflt=None, srcqnmflt=None,
+                 dstqnmflt=None, fnmsub=None, grpflt=None, lnksub=None,
+                 interval=0.005, threads=True, grpthr=False):
+        """
+        Parameters
+        ----------
+        srcmodflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        dstmodflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        srcqnmflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        dstqnmflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        fnmsub : None or tuple of two regex strings, optional (default None)
+          As for :class:`CallTracer`.
+        grpflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        lnksub : None or tuple of two regex strings, optional (default None)
+          As for :class:`CallTracer`.
+        interval : float, optional (default 0.005)
+          Sampling interval in seconds.
+        threads : bool, optional (default True)
+          If True, sample the call stacks of all threads, otherwise only
+          that of the thread from which sampling is started.
+        grpthr : bool, optional (default False)
+          As for :class:`CallTracer`.
+        """
+
+        super(SamplingCallTracer, self).__init__(
+            srcmodflt=srcmodflt, dstmodflt=dstmodflt, srcqnmflt=srcqnmflt,
+            dstqnmflt=dstqnmflt, fnmsub=fnmsub, grpflt=grpflt,
+            lnksub=lnksub, threads=threads, grpthr=grpthr)
+        # Sampling interval
+        self.interval = interval
+
+
+    def reset(self):
+        """
+        Reset record of called functions, deleting all accumulated call
+        information and sampling statistics.
+        """
+
+        super(SamplingCallTracer, self).reset()
+        # Number of samples taken
+        self.nsample = 0
+        # CPU time used by the sampling thread
+        self.cputime = 0.0
+        # Elapsed time while sampling
+        self.walltime = 0.0
+
+
+    def _sample(self):
+        """
+        Sample the call stacks of running threads until sampling is
+        stopped. This is the body of the sampling thread.
+        """
+
+        own = threading.get_ident()
+        cpu0 = time.thread_time()
+        wall0 = time.perf_counter()
+        while not self._stopevt.wait(self.interval):
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid == own or (not self.threads and tid != self._tid):
+                    continue
+                # Record the call of each function on the stack by the
+                # function of its parent frame
+                if self.threads:
+                    rec = self._thread_record(tid)
+                else:
+                    rec = (self._edges, None)
+                while frame is not None:
+                    self._record(frame, rec[0])
+                    frame = frame.f_back
+            # Avoid keeping references to the frames while waiting
+            frames = frame = None
+            self.nsample += 1
+        self.cputime += time.thread_time() - cpu0
+        self.walltime += time.perf_counter() - wall0
+
+
+    def _thread_record(self, tid):
+        """
+        Get the record of called functions for the thread with the
+        specified identifier, constructing it if necessary.
+        """
+
+        rec = self._thrrecs.get(tid)
+        if rec is None:
+            thrnm = str(tid)
+            for thread in threading.enumerate():
+                if thread.ident == tid:
+                    thrnm = thread.name
+            rec = ({}, thrnm)
+            self._thrrecs[tid] = rec
+            self._records.append(rec)
+        return rec
+
+
+    def start(self):
+        """Start sampling."""
+
+        self._tracing = True
+        self._counted = False
+        self._tid = threading.get_ident()
+        self._thrrecs = {}
+        self._stopevt = threading.Event()
+        self._thread = threading.Thread(target=self._sample,
+                                        name='jonga-sampler', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """Stop sampling."""
+
+        self._stopevt.set()
+        self._thread.join()
+        self._tracing = False
+        self._counted = False
+        if self.threads:
+            self._merge_records()
+        self._build_group()
+
+
+    def overhead(self):
+        """
+        Get the CPU time used by sampling as a fraction of the elapsed
+        sampling time.
+        """
+
+        if self.walltime == 0.0:
+            return 0.0
+        else:
+            return self.cputime / self.walltime
+
+
+
+
+class StaticCallTracer(CallTracer):
+    """
+    Manage construction of a call graph by static analysis of the
+    source of modules instead of tracing the execution of code. Calls
+    of methods via ``self`` and ``super()`` are resolved through the
+    method resolution order of the class of the instance on which the
+    method is called, so that the call graph of the methods of a class
+    hierarchy is the same as that obtained by tracing, without the
+    code having to be run. Calls that can not be resolved statically,
+    such as those of methods of other objects, are not recorded.
+    """
+
+    def __init__(self, srcmodflt=None, dstmodflt=None, srcqnmflt=None,
+                 dstqnmflt=None, fnmsub=None, grpflt=None, lnksub=None,
+                 cache=None, nproc=None):
+        """
+        Parameters
+        ----------
+        srcmodflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        dstmodflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        srcqnmflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        dstqnmflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        fnmsub : None or tuple of two regex strings, optional (default None)
+          As for :class:`CallTracer`.
+        grpflt : None or regex string, optional (default None)
+          As for :class:`CallTracer`.
+        lnksub : None or tuple of two regex strings, optional (default None)
+          As for :class:`CallTracer`.
+        cache : None or string, optional (default None)
+          Path of a directory in which the results of parsing each
+          source file are cached, keyed by the path, size, and
+          modification time of the file. If None, results are not
+          cached.
+        nproc : None or int, optional (default None)
+          Number of processes used for parsing source files. If None,
+          the number of processors is used, and if 1, files are parsed
+          in this process.
+        """
+
+        super(StaticCallTracer, self).__init__(
+            srcmodflt=srcmodflt, dstmodflt=dstmodflt, srcqnmflt=srcqnmflt,
+            dstqnmflt=dstqnmflt, fnmsub=fnmsub, grpflt=grpflt,
+            lnksub=lnksub)
+        # Directory of cached parsing results
+        self.cache = cache
+        # Number of parsing processes
+        self.nproc = nproc
+        # Number of source files parsed and loaded from the cache
+        self.nparsed = 0
+        self.ncached = 0
+
+
+    def _parse(self, files):
+        """
+        Get the parsing results for a list of source files, each
+        specified as a tuple of path and module name, parsing them in
+        parallel if required, and using and updating the cache.
+        """
+
+        results = [None] * len(files)
+        keys = [None] * len(files)
+        todo = []
+        for n, (pth, modname) in enumerate(files):
+            if self.cache is not None:
+                st = os.stat(pth)
+                keys[n] = RenderCache.key(os.path.abspath(pth), modname,
+                                          st.st_size, st.st_mtime_ns,
+                                          __version__)
+                try:
+                    with open(os.path.join(self.cache, keys[n] + '.json'))\
+                         as fd:
+                        results[n] = json.load(fd)
+                    self.ncached += 1
+                    continue
+                except (FileNotFoundError, ValueError):
+                    pass
+            todo.append(n)
+
+        if len(todo) > 1 and self.nproc != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.nproc) as pool:
+                parsed = pool.map(_parse_module, *zip(*[files[n] for n in
+                                                        todo]))
+                for n, res in zip(todo, parsed):
+                    results[n] = res
+        else:
+            for n in todo:
+                results[n] = _parse_module(*files[n])
+        self.nparsed += len(todo)
+
+        if self.cache is not None and todo:
+            os.makedirs(self.cache, exist_ok=True)
+            for n in todo:
+                pth = os.path.join(self.cache, keys[n] + '.json')
+                # Written via a temporary file so that concurrent users
+                # of the cache never see a partial file
+                with open(pth + '.%d.tmp' % os.getpid(), 'w') as fd:
+                    json.dump(results[n], fd)
+                os.replace(pth + '.%d.tmp' % os.getpid(), pth)
+        return results
+
+
+    def analyse(self, pths, entry=None):
+        """
+        Construct a record of called functions by static analysis of
+        the specified source files, adding it to the records of this
+        call tracer.
+
+        Parameters
+        ----------
+        pths : string or list of strings
+          Path of a source file or of a directory that is searched
+          recursively for source files, or a list of such paths. The
+          module name of each file is determined from its path within
+          its package, if any.
+        entry : None or list of strings, optional (default None)
+          Fully qualified names of the functions, methods, or classes
+          from which the calls to be recorded are reached, where the
+          entry point for a class is construction of an instance, and
+          a method may be specified via a class that inherits it. If
+          None, the calls of all functions, and of all methods on
+          instances of the class in which they are defined, are
+          recorded.
+        """
+
+        if isinstance(pths, str):
+            pths = [pths, ]
+        files = []
+        for p in pths:
+            if os.path.isdir(p):
+                for fnm in sorted(glob(os.path.join(p, '**', '*.py'),
+                                       recursive=True)):
+                    files.append((fnm, _module_name(fnm)))
+            else:
+                files.append((p, _module_name(p)))
+        mods = {res['module']: res for res in self._parse(files)}
+        for res in mods.values():
+            res['toplevel'] = set(res['toplevel'])
+
+        # Dicts associating function fqnames with a tuple of module
+        # name, qname, and parsing results, and class fqnames with the
+        # fqnames of their base classes
+        funcs = {}
+        classes = {}
+        for mod, res in mods.items():
+            for qn, info in res['functions'].items():
+                funcs[mod + '.' + qn] = (mod, qn, info)
+        for mod, res in mods.items():
+            for qn, bases in res['classes'].items():
+                classes[mod + '.' + qn] = [b for b in [_resolve(mods, mod, b)
+                                                       for b in bases]
+                                           if b is not None]
+
+        mros = {}
+
+        def mro(cls):
+            # C3 linearization, restricted to the analysed classes
+            if cls not in mros:
+                mros[cls] = [cls, ]
+                bases = [b for b in classes.get(cls, []) if b in classes]
+                seqs = [mro(b)[:] for b in bases] + [bases]
+                lin = [cls, ]
+                while True:
+                    seqs = [q for q in seqs if q]
+                    if not seqs:
+                        break
+                    for q in seqs:
+                        if not any([q[0] in r[1:] for r in seqs]):
+                            head = q[0]
+                            break
+                    else:
+                        # Inconsistent hierarchy
+                        head = seqs[0][0]
+                    lin.append(head)
+                    seqs = [r[1:] if r[0] == head else r for r in seqs]
+                mros[cls] = lin
+            return mros[cls]
+
+        def lookup(cls, name, after=None):
+            lin = mro(cls)
+            if after is not None:
+                lin = lin[lin.index(after) + 1:] if after in lin else []
+            for c in lin:
+                if c + '.' + name in funcs:
+                    return c + '.' + name
+            return None
+
+        def resolve(fq, inst, call):
+            # Get the called function, and the class of the instance on
+            # which it is called, for a call in function fq called on an
+            # instance of class inst
+            mod, qn, info = funcs[fq]
+            kind, name, cls = call
+            if kind == 'self':
+                if inst is None and info['cls'] is not None:
+                    inst = mod + '.' + info['cls']
+                if inst is None:
+                    return None, None
+                return lookup(inst, name), inst
+            elif kind == 'super':
+                cls = _resolve(mods, mod, cls)
+                if cls is None:
+                    return None, None
+                if inst is None:
+                    inst = cls
+                return lookup(inst, name, after=cls), inst
+            elif kind == 'new':
+                cls = _resolve(mods, mod, cls)
+                if cls not in classes:
+                    return None, None
+                return lookup(cls, name), cls
+            else:
+                tgt = _resolve(mods, mod, name)
+                if tgt in funcs:
+                    return tgt, inst if funcs[tgt][2]['cls'] else None
+                if tgt in classes:
+                    return lookup(tgt, '__init__'), tgt
+                return None, None
+
+        # Entry points, each a tuple of function fqname and instance
+        # class fqname
+        if entry is None:
+            todo = [(fq, None if info['cls'] is None else mod + '.' +
+                     info['cls']) for fq, (mod, qn, info) in funcs.items()]
+        else:
+            todo = []
+            for e in entry:
+                if e in classes:
+                    todo.append((lookup(e, '__init__'), e))
+                elif e in funcs:
+                    mod, qn, info = funcs[e]
+                    todo.append((e, None if info['cls'] is None else
+                                 mod + '.' + info['cls']))
+                else:
+                    cls, _, name = e.rpartition('.')
+                    if cls in classes:
+                        todo.append((lookup(cls, name), cls))
+            todo = [t for t in todo if t[0] is not None]
+
+        # Traverse the functions reachable from the entry points, each
+        # in the context of the class of the instance on which it is
+        # called, recording each resolved call site once
+        seen = set(todo)
+        sites = set()
+        while todo:
+            fq, inst = todo.pop()
+            for n, call in enumerate(funcs[fq][2]['calls']):
+                tgt, tinst = resolve(fq, inst, call)
+                if tgt is None:
+                    continue
+                if (fq, n, tgt) not in sites:
+                    sites.add((fq, n, tgt))
+                    self._static_call(funcs[fq], funcs[tgt])
+                if (tgt, tinst) not in seen:
+                    seen.add((tgt, tinst))
+                    todo.append((tgt, tinst))
+
+        self._build_group()
+
+
+    def _static_call(self, src, dst):
+        """
+        Apply the module and qname filters and the name substitution to
+        a call determined by static analysis, and record it if it is
+        not filtered out. The calling and called functions are each
+        specified by a tuple of module name and qname.
+        """
+
+        if not self.srcmodflt.match(src[0]) or \
+           not self.dstmodflt.match(dst[0]):
+            return
+        if not self.srcqnmflt.match(src[1]) or \
+           not self.dstqnmflt.match(dst[1]):
+            return
+        src_name = src[0] + '.' + src[1]
+        dst_name = dst[0] + '.' + dst[1]
+        if self.fnmsub is not None:
+            src_name = re.sub(self.fnmsub[0], self.fnmsub[1], src_name)
+            dst_name = re.sub(self.fnmsub[0], self.fnmsub[1], dst_name)
+        self._addcall(src_name, dst_name, 1)
+
+
+
+
+class ContextCallTracer(object):
+    """
+    A wrapper class for :class:`CallTracer` that enables its use as a
+    context manager. At the end of the context a call graph image is
+    generated and written to a path specified in the initialiser.
+    """
+
+    def __init__(self, ct, pth=None, **kwargs):
+        """
+        Parameters
+        ----------
+        ct : class:`CallTracer` object
+          Specify the call tracer object to be used as a context manager.
+        pth : string or None, optional (default None)
+          Specify the path of the graph image file to be written by
+          :meth:`CallTracer.graph` at the end of the context. A graph is
+          not generated if it is ``None``.
+        **kwargs
+          Keyword arguments for :meth:`CallTracer.graph`
+        """
+
+        self.ct = ct
+        self.pth = pth
+        self.kwargs = kwargs
+
+
+    def __enter__(self):
+        """
+        Reset and start call tracer and return this ContextCallTracer
+        instance.
+        """
+
+        self.ct.reset()
+        self.ct.start()
+        return self
+
+
+    def __exit__(self, extype, value, traceback):
+        """
+        Stop the call tracer and return True if no exception was raised
+        within the 'with' block, otherwise return False.
+        """
+
+        self.ct.stop()
+        if self.pth is not None:
+            self.ct.graph(self.pth, **self.kwargs)
+        if extype:
+            return False
+        else:
+            return True
+
+
+    def calltracer(self):
+        """
+        Return the call tracer object associated with this ContextCallTracer
+        instance.
+        """
+
+        return self.ct
+
+
+
+class RenderCache(object):
+    """
+    Cache of graph files written by :meth:`CallTracer.graph`, stored
+    in a directory on disk. Files are identified by a hash of the DOT
+    format description of the graph, which is determined by the
+    recorded calls as well as the filtering, naming, and grouping
+    options of the call tracer, and of the options that determine how
+    the file is written. When the total size of the cached files
+    exceeds the specified limit, the least recently used files are
+    removed.
+    """
+
+    def __init__(self, pth, maxsize=64 * 2**20):
+        """
+        Parameters
+        ----------
+        pth : string
+          Path of the cache directory, which is created if it does not
+          exist.
+        maxsize : int, optional (default 64 MB)
+          Maximum total size in bytes of the cached files.
+        """
+
+        self.pth = pth
+        self.maxsize = maxsize
+        os.makedirs(pth, exist_ok=True)
+        # Number of cache hits, misses, and removed files
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    @staticmethod
+    def key(src, *args):
+        """
+        Compute the cache key of a graph file from the DOT format
+        description of the graph and any additional options that
+        determine how the file is written.
+        """
+
+        h = hashlib.sha256(src.encode('utf-8'))
+        h.update(repr(args).encode('utf-8'))
+        return h.hexdigest()
+
+
+    def _path(self, key, fnm):
+        """Get the path of the cached copy of a file."""
+
+        return os.path.join(self.pth, key + os.path.splitext(fnm)[1])
+
+
+    def get(self, key, fnm):
+        """
+        Copy the cached file with the specified key, if it exists, to
+        the specified path.
+
+        Parameters
+        ----------
+        key : string
+          Cache key
+        fnm : string
+          Path of the file to be written
+
+        Returns
+        -------
+        hit : bool
+          True if the file was in the cache, otherwise False
+        """
+
+        cpth = self._path(key, fnm)
+        try:
+            with open(cpth, 'rb') as fd:
+                data = fd.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        with open(fnm, 'wb') as fd:
+            fd.write(data)
+        # The modification time of a cached file records its most
+        # recent use
+        try:
+            os.utime(cpth)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return True
+
+
+    def put(self, key, fnm):
+        """
+        Add a copy of the specified file to the cache under the
+        specified key, removing the least recently used files if the
+        total size of the cached files exceeds the limit.
+
+        Parameters
+        ----------
+        key : string
+          Cache key
+        fnm : string
+          Path of the file to be cached
+        """
+
+        cpth = self._path(key, fnm)
+        with open(fnm, 'rb') as fd:
+            data = fd.read()
+        # The file is written under a temporary name and then renamed
+        # so that other processes sharing the cache never see a
+        # partially written file
+        tmp = cpth + '.%d.tmp' % os.getpid()
+        with open(tmp, 'wb') as fd:
+            fd.write(data)
+        os.replace(tmp, cpth)
+        self._evict()
+
+
+    def _evict(self):
+        """
+        Remove the least recently used files until the total size of
+        the cached files does not exceed the limit.
+        """
+
+        entries = []
+        for e in os.scandir(self.pth):
+            if e.is_file() and not e.name.endswith('.tmp'):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        size = sum([e[1] for e in entries])
+        for mtime, fsize, path in sorted(entries):
+            if size <= self.maxsize:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= fsize
+
+
+    def size(self):
+        """Get the total size in bytes of the cached files."""
+
+        return sum([e.stat().st_size for e in os.scandir(self.pth)
+                    if e.is_file()])
+
+
+    def stats(self):
+        """
+        Get a dict of cache statistics consisting of the numbers of
+        hits, misses, and removed files, and the number and total size
+        of cached files.
+        """
+
+        nfile = len([e for e in os.scandir(self.pth) if e.is_file()])
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'files': nfile,
+                'size': self.size()}
+
+
+
+
+class _CallTimer(object):
+    """
+    Call timing state for a single thread, consisting of a stack of
+    entries for recorded calls that have not yet returned, and dicts in
+    which the resulting times are accumulated.
+    """
+
+    __slots__ = ('stack', 'active', 'etime', 'tincl', 'texcl')
+
+    def __init__(self, etime, tincl, texcl):
+        # Stack of lists containing the edge table key, the start time,
+        # and the total time of nested recorded calls, for each call
+        # that has not yet returned
+        self.stack = []
+        # Dict associating node ids with the number of calls of the
+        # corresponding function that have not yet returned
+        self.active = {}
+        # Dicts in which edge, inclusive, and exclusive times are
+        # accumulated
+        self.etime = etime
+        self.tincl = tincl
+        self.texcl = texcl
+
+
+    def push(self, key):
+        """
+        Start timing a recorded call with the specified edge table key.
+        """
+
+        did = key & _IDMASK
+        self.active[did] = self.active.get(did, 0) + 1
+        self.stack.append([key, time.perf_counter_ns(), 0])
+
+
+    def trace(self, frame, event, arg):
+        """
+        Local trace function for the frame of a recorded call, which
+        updates the times of the call when it returns.
+        """
+
+        if event == 'return':
+            t = time.perf_counter_ns()
+            key, t0, nested = self.stack.pop()
+            dt = t - t0
+            self.etime[key] = self.etime.get(key, 0) + dt
+            did = key & _IDMASK
+            self.texcl[did] = self.texcl.get(did, 0) + dt - nested
+            # Only the outermost of nested calls of the same function
+            # contributes to its inclusive time
+            self.active[did] -= 1
+            if self.active[did] == 0:
+                self.tincl[did] = self.tincl.get(did, 0) + dt
+            if self.stack:
+                self.stack[-1][2] += dt
+        return self.trace
+
+
+
+
+class _CallStack(object):
+    """
+    Calling context state for a single thread, consisting of a calling
+    context tree of recorded calls, and a stack of the tree nodes of
+    recorded calls that have not yet returned.
+    """
+
+    __slots__ = ('stack', 'maxdepth', 'child', 'parent', 'fid', 'depth',
+                 'count')
+
+    def __init__(self, maxdepth):
+        # Stack of tree node ids of calls that have not yet returned
+        self.stack = []
+        # Maximum depth of the tree
+        self.maxdepth = maxdepth
+        # Dict associating tuples of parent tree node id and function
+        # node id with the corresponding child tree node id
+        self.child = {}
+        # Lists of parent tree node id, function node id, depth, and
+        # count of calls, indexed by tree node id, with tree node id 0
+        # reserved for the root of the tree
+        self.parent = [0]
+        self.fid = [0]
+        self.depth = [0]
+        self.count = [0]
+
+
+    def node(self, parent, fid):
+        """
+        Get the id of the child of the specified tree node for the
+        function with the specified node id, constructing it if
+        necessary.
+        """
+
+        n = self.child.get((parent, fid))
+        if n is None:
+            n = len(self.fid)
+            self.child[(parent, fid)] = n
+            self.parent.append(parent)
+            self.fid.append(fid)
+            self.depth.append(self.depth[parent] + 1)
+            self.count.append(0)
+        return n
+
+
+    def push(self, key):
+        """
+        Add a recorded call with the specified edge table key to the
+        calling context.
+        """
+
+        stack = self.stack
+        top = stack[-1] if stack else 0
+        # If the calling function is not the function of the most
+        # recent call that has not returned, as for the first recorded
+        # call or the call of a recorded function by a function that
+        # is not recorded, it is inserted in the path
+        src = key >> _IDBITS
+        if self.fid[top] != src and self.depth[top] < self.maxdepth:
+            top = self.node(top, src)
+        if self.depth[top] < self.maxdepth:
+            n = self.node(top, key & _IDMASK)
+            self.count[n] += 1
+            stack.append(n)
+        else:
+            stack.append(top)
+
+
+    def trace(self, frame, event, arg):
+        """
+        Local trace function for the frame of a recorded call, which
+        removes the call from the calling context when it returns.
+        """
+
+        if event == 'return' and self.stack:
+            self.stack.pop()
+        return self.trace
+
+
+    def merge(self, other):
+        """
+        Merge the calling context tree of another calling context state
+        into this one.
+        """
+
+        # Parent tree nodes always have lower ids than their children
+        nmap = [0]
+        for n in range(1, len(other.fid)):
+            m = self.node(nmap[other.parent[n]], other.fid[n])
+            self.count[m] += other.count[n]
+            nmap.append(m)
+
+
+
+
+class _FunctionCounts(Mapping):
+    """
+    Read-only view of the counts of occurrences of each function in
+    caller and called roles in the record of a :class:`CallTracer`.
+    """
+
+    def __init__(self, ct):
+        self._ct = ct
+        self._nsrc, self._ndst = ct._counts()
+
+
+    def __getitem__(self, name):
+        i = self._ct._nodeid.get(name)
+        if i is None or i >= len(self._nsrc) or \
+           (self._nsrc[i] == 0 and self._ndst[i] == 0):
+            raise KeyError(name)
+        return (self._nsrc[i], self._ndst[i])
+
+
+    def __iter__(self):
+        names = self._ct._names
+        for i in range(1, len(self._nsrc)):
+            if self._nsrc[i] or self._ndst[i]:
+                yield names[i]
+
+
+    def __len__(self):
+        return sum(1 for k in self)
+
+
+
+
+class _CallCounts(Mapping):
+    """
+    Read-only view of the counts of calls of each pair of calling and
+    called functions in the record of a :class:`CallTracer`.
+    """
+
+    def __init__(self, ct):
+        self._ct = ct
+
+
+    def __getitem__(self, key):
+        nodeid = self._ct._nodeid
+        if key[0] not in nodeid or key[1] not in nodeid:
+            raise KeyError(key)
+        return self._ct._edges[(nodeid[key[0]] << _IDBITS) | nodeid[key[1]]]
+
+
+    def __iter__(self):
+        names = self._ct._names
+        for k in self._ct._edges:
+            if k & _IDMASK:
+                yield (names[k >> _IDBITS], names[k & _IDMASK])
+
+
+    def __len__(self):
+        return sum(1 for k in self._ct._edges if k & _IDMASK)
+
+
+
+
+def _module_name(pth):
+    """
+    Get the name of the module of a source file, including the names of
+    the packages in which it is contained.
+    """
+
+    pth = os.path.abspath(pth)
+    parts = [os.path.splitext(os.path.basename(pth))[0], ]
+    if parts[0] == '__init__':
+        parts = []
+    dnm = os.path.dirname(pth)
+    while os.path.exists(os.path.join(dnm, '__init__.py')):
+        parts.insert(0, os.path.basename(dnm))
+        dnm = os.path.dirname(dnm)
+    return '.'.join(parts)
+
+
+
+def _parse_module(pth, modname):
+    """
+    Parse a source file, returning a dict of its module name, the
+    names defined at the top level of the module, the names bound by
+    imports, the classes and names of their base classes, and the
+    functions and the calls within each of them that may be resolvable
+    by static analysis. This function is run in worker processes by
+    :class:`StaticCallTracer`, and its result is JSON serializable so
+    that it can be cached.
+    """
+
+    # Module ast is only imported when required since it is only used
+    # for static analysis
+    import ast
+
+    with open(pth, 'rb') as fd:
+        tree = ast.parse(fd.read(), filename=pth)
+    if os.path.basename(pth) == '__init__.py':
+        pkg = modname
+    else:
+        pkg = modname.rpartition('.')[0]
+    res = {'module': modname, 'toplevel': [], 'imports': {},
+           'classes': {}, 'functions': {}}
+
+    def dotted(node):
+        # Get the dotted name of a chain of attributes of a name
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        parts.append(node.id)
+        return '.'.join(reversed(parts))
+
+    def calls(fnode, slf, cls):
+        # Get the calls in the body of a function, excluding those in
+        # nested function and class definitions
+        lst = []
+        todo = list(reversed(fnode.body))
+        while todo:
+            node = todo.pop()
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                 ast.ClassDef, ast.Lambda)):
+                continue
+            if isinstance(node, ast.Call):
+                f = node.func
+                if isinstance(f, ast.Attribute) and \
+                   isinstance(f.value, ast.Call) and \
+                   dotted(f.value.func) == 'super':
+                    args = f.value.args
+                    sup = dotted(args[0]) if args else cls
+                    if sup is not None:
+                        lst.append(['super', f.attr, sup])
+                elif isinstance(f, ast.Attribute) and \
+                     isinstance(f.value, ast.Call) and \
+                     dotted(f.value.func) is not None:
+                    # Call of a method of a newly constructed instance
+                    lst.append(['new', f.attr, dotted(f.value.func)])
+                elif isinstance(f, ast.Attribute) and \
+                     isinstance(f.value, ast.Name) and \
+                     f.value.id == slf:
+                    lst.append(['self', f.attr, None])
+                else:
+                    nm = dotted(f)
+                    if nm is not None:
+                        lst.append(['name', nm, None])
+            todo.extend(reversed(list(ast.iter_child_nodes(node))))
+        return lst
+
+    def visit(nodes, prefix, cls):
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                qn = prefix + node.name
+                if not prefix:
+                    res['toplevel'].append(node.name)
+                res['classes'][qn] = [b for b in [dotted(b) for b in
+                                                  node.bases] if b]
+                visit(node.body, qn + '.', qn)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qn = prefix + node.name
+                if not prefix:
+                    res['toplevel'].append(node.name)
+                # The first argument of a method refers to the instance
+                # (or class), except for static methods
+                slf = None
+                if cls is not None and node.args.args and \
+                   'staticmethod' not in [dotted(d) for d in
+                                          node.decorator_list]:
+                    slf = node.args.args[0].arg
+                res['functions'][qn] = {'cls': cls,
+                                        'calls': calls(node, slf, cls)}
+                visit(node.body, qn + '.<locals>.', None)
+            elif isinstance(node, ast.Import):
+                for a in node.names:
+                    if a.asname is None:
+                        nm = a.name.partition('.')[0]
+                        res['imports'][nm] = nm
+                    else:
+                        res['imports'][a.asname] = a.name
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ''
+                if node.level:
+                    up = pkg.split('.') if pkg else []
+                    up = up[:len(up) - node.level + 1]
+                    base = '.'.join(up + ([base] if base else []))
+                for a in node.names:
+                    res['imports'][a.asname or a.name] = base + '.' + a.name
+            elif isinstance(node, ast.stmt):
+                # Definitions within compound statements such as if and
+                # try blocks
+                visit([n for n in ast.iter_child_nodes(node) if
+                       isinstance(n, ast.stmt)], prefix, cls)
+
+    visit(tree.body, '', None)
+    return res
+
+
+
+def _resolve(mods, mod, name):
+    """
+    Get the fully qualified name corresponding to a dotted name in the
+    namespace of a module parsed by :func:`_parse_module`, or None if
+    it is not defined in the module or bound by an import.
+    """
+
+    res = mods[mod]
+    head, sep, tail = name.partition('.')
+    if head in res['imports']:
+        return res['imports'][head] + sep + tail
+    if head in res['toplevel']:
+        return mod + '.' + name
+    return None
+
+
+
+def _snippet_graph(code, cfg, imgdir, deps=None, ext='.svg'):
+    """
+    Construct the call graph of a code snippet, by tracing its
+    execution or by static analysis, and write it to a file in the
+    specified directory, unless an up to date file already exists. The
+    file name is determined by the snippet, the configuration, and the
+    modification times of the source files on which the graph depends,
+    so that the graph is only constructed again when one of them
+    changes. This is the implementation of the ``jonga-graph``
+    directive of the Sphinx extension (see :func:`setup`).
+
+    Parameters
+    ----------
+    code : string
+      Code snippet to be traced
+    cfg : dict
+      Configuration consisting of dicts of :class:`CallTracer` and
+      :meth:`CallTracer.dot` keyword arguments (keys 'tracer' and
+      'graph'), and, for static analysis, lists of source paths and
+      entry points for :meth:`StaticCallTracer.analyse` (keys 'static'
+      and 'entry'), in which case the snippet is not run.
+    imgdir : string
+      Path of the directory in which the graph file is written
+    deps : None or list of strings, optional (default None)
+      Paths of the source files on which the graph depended when it was
+      last constructed, if known
+    ext : string, optional (default '.svg')
+      File extension determining the file type
+
+    Returns
+    -------
+    fnm : string
+      Name of the graph file within `imgdir`
+    deps : list of strings
+      Paths of the source files on which the graph depends
+    """
+
+    def path(deps):
+        mtimes = [(f, os.stat(f).st_mtime_ns) for f in sorted(deps) if
+                  os.path.exists(f)]
+        key = RenderCache.key(code, json.dumps(cfg, sort_keys=True), mtimes)
+        return 'jonga-%s%s' % (key[0:20], ext)
+
+    # The snippet is not run if the graph file exists for the source
+    # files on which it depended when it was last constructed
+    if deps is not None and os.path.exists(os.path.join(imgdir,
+                                                        path(deps))):
+        return path(deps), deps
+
+    if cfg.get('static'):
+        ct = StaticCallTracer(**cfg['tracer'])
+        ct.analyse(cfg['static'], entry=cfg.get('entry'))
+        deps = []
+        for p in cfg['static']:
+            if os.path.isdir(p):
+                deps.extend(glob(os.path.join(p, '**', '*.py'),
+                                 recursive=True))
+            else:
+                deps.append(p)
+    else:
+        ct = CallTracer(**cfg['tracer'])
+        ct.start()
+        try:
+            exec(compile(code, '<jonga-graph>', 'exec'),
+                 {'__name__': '__jonga__'})
+        finally:
+            ct.stop()
+        deps = [f for f in ct.sources() if os.path.exists(f)]
+
+    fnm = path(deps)
+    if not os.path.exists(os.path.join(imgdir, fnm)):
+        os.makedirs(imgdir, exist_ok=True)
+        # Written via a temporary file since parallel Sphinx processes
+        # may construct the same graph
+        tmp = os.path.join(imgdir, '%d.tmp%s' % (os.getpid(), ext))
+        ct.dot(tmp, **cfg.get('graph', {}))
+        os.replace(tmp, os.path.join(imgdir, fnm))
+    return fnm, deps
+
+
+
+def setup(app):
+    """
+    Set up the Sphinx extension, enabled by including ``'jonga'`` in the
+    ``extensions`` list of the Sphinx configuration. The extension
+    provides the ``jonga-graph`` directive, which embeds the call graph
+    of the code snippet in its content in HTML output, as in ::
+
+      .. jonga-graph::
+         :srcmodflt: ^xmpl
+         :fnmsub: ^xmpl\\. ''
+
+         import xmpl
+         xmpl.C()
+
+    Options ``srcmodflt``, ``dstmodflt``, ``srcqnmflt``, ``dstqnmflt``,
+    and ``grpflt`` are regexes, and ``fnmsub`` and ``lnksub`` are
+    pairs of whitespace separated regexes, with ``''`` denoting an
+    empty string, all as for :class:`CallTracer`. Option ``static``
+    is a whitespace separated list of source paths, relative to the
+    document, which are analysed via :class:`StaticCallTracer`,
+    with entry points specified by option ``entry``, instead of running
+    the snippet. Options ``rmsz`` and ``prog`` are as for
+    :meth:`CallTracer.dot`. The extension is safe for parallel builds
+    (``sphinx-build -j N``), in which graphs are constructed in the
+    Sphinx worker processes. A document is read again when the source
+    files of the functions in its graphs change, and a graph is only
+    constructed again when its snippet, options, or those source
+    files change.
+    """
+
+    from docutils import nodes
+    from docutils.parsers.rst import Directive, directives
+    from sphinx.util.osutil import relative_uri
+
+    def pair(arg):
+        pr = tuple(['' if a == "''" else a for a in arg.split()])
+        if len(pr) != 2:
+            raise ValueError('Expected two whitespace separated regexes')
+        return pr
+
+    class CallGraphDirective(Directive):
+        has_content = True
+        option_spec = {'srcmodflt': directives.unchanged,
+                       'dstmodflt': directives.unchanged,
+                       'srcqnmflt': directives.unchanged,
+                       'dstqnmflt': directives.unchanged,
+                       'grpflt': directives.unchanged,
+                       'fnmsub': pair, 'lnksub': pair,
+                       'static': directives.unchanged,
+                       'entry': directives.unchanged,
+                       'rmsz': directives.flag,
+                       'prog': directives.unchanged}
+
+        def run(self):
+            env = self.state.document.settings.env
+            opts = self.options
+            cfg = {'tracer': {k: opts[k] for k in
+                              ('srcmodflt', 'dstmodflt', 'srcqnmflt',
+                               'dstqnmflt', 'grpflt', 'fnmsub', 'lnksub')
+                              if k in opts},
+                   'graph': {'rmsz': 'rmsz' in opts,
+                             'prog': opts.get('prog', 'dot')}}
+            if 'static' in opts:
+                cfg['static'] = [env.relfn2path(p)[1] for p in
+                                 opts['static'].split()]
+                cfg['entry'] = opts['entry'].split() if 'entry' in opts \
+                    else None
+            code = '\n'.join(self.content)
+            skey = RenderCache.key(code, json.dumps(cfg, sort_keys=True))
+            imgdir = os.path.join(app.outdir, '_images', 'jonga')
+            try:
+                fnm, deps = _snippet_graph(code, cfg, imgdir,
+                                           env.jonga_deps.get(skey))
+            except Exception as exc:
+                # A failure of the snippet or of the construction of its
+                # graph is reported as a build error in the document,
+                # rather than terminating the build
+                return [self.state_machine.reporter.error(
+                    'jonga-graph: could not construct call graph: %s: %s' %
+                    (type(exc).__name__, exc), line=self.lineno)]
+            env.jonga_deps[skey] = deps
+            env.jonga_docs.setdefault(env.docname, set()).add(skey)
+            for f in deps:
+                env.note_dependency(f)
+            # The link is relative to the output file of the document,
+            # the location of which depends on the builder
+            uri = relative_uri(app.builder.get_target_uri(env.docname),
+                               '_images/jonga/' + fnm)
+            return [nodes.raw('', '<object data="%s" type="image/svg+xml">'
+                              '</object>' % uri, format='html')]
+
+    def init_deps(app):
+        # Dict associating snippet keys with the source files on which
+        # the corresponding graph depends, and dict associating document
+        # names with the set of keys of the snippets in the document,
+        # which persist in the pickled build environment
+        if not hasattr(app.env, 'jonga_deps'):
+            app.env.jonga_deps = {}
+        if not hasattr(app.env, 'jonga_docs'):
+            app.env.jonga_docs = {}
+
+    def purge_doc(app, env, docname):
+        # The dependencies of the snippets of a document that is read
+        # again are retained until all documents have been read, so
+        # that their graphs need not be constructed again
+        env.jonga_docs.pop(docname, None)
+
+    def merge_deps(app, env, docnames, other):
+        env.jonga_deps.update(other.jonga_deps)
+        for docname in docnames:
+            if docname in other.jonga_docs:
+                env.jonga_docs[docname] = other.jonga_docs[docname]
+
+    def prune_deps(app, env):
+        # Dependencies of snippets that are no longer in any document,
+        # as for a document that has been changed or removed, are
+        # discarded
+        used = set().union(*env.jonga_docs.values())
+        for skey in list(env.jonga_deps):
+            if skey not in used:
+                del env.jonga_deps[skey]
+
+    app.add_directive('jonga-graph', CallGraphDirective)
+    app.connect('builder-inited', init_deps)
+    app.connect('env-purge-doc', purge_doc)
+    app.connect('env-merge-info', merge_deps)
+    app.connect('env-updated', prune_deps)
+    return {'version': __version__, 'parallel_read_safe': True,
+            'parallel_write_safe': True}
+
+
+
+def pytest_addoption(parser):
+    """
+    Add the options of the pytest plugin, which is registered via the
+    ``pytest11`` entry point of the package, or via ``-p jonga``. If
+    option ``--jonga`` is selected, the test function of each test is
+    run with call tracing, and its call graph is written to the
+    directory specified by option ``--jonga-dir``, together with a
+    graph, and trace file, of the calls in all tests. Option
+    ``--jonga-filter`` is a regex for filtering calls based on the
+    called function module, as for parameter `dstmodflt` of
+    :class:`CallTracer`. When tests are distributed by
+    ``pytest-xdist``, each worker process writes its records to a
+    shard file, and these are merged at the end of the session. The
+    duration, number of recorded calls, and estimated tracing overhead
+    of each test are written to file ``overhead.json`` in the same
+    directory, and those of the tests with the largest overhead are
+    included in the terminal summary. The overhead estimate is a lower
+    bound, since it is calibrated on calls of a plain function, which
+    are cheaper to trace than those of functions with closures.
+    """
+
+    group = parser.getgroup('jonga', 'call graphs of tests')
+    group.addoption('--jonga', action='store_true',
+                    help='trace each test and write its call graph')
+    group.addoption('--jonga-filter', metavar='REGEX',
+                    help='only record calls of functions in modules with '
+                    'names matching REGEX')
+    group.addoption('--jonga-dir', metavar='DIR', default='jonga',
+                    help='directory in which call graphs are written '
+                    '(default jonga)')
+    group.addoption('--jonga-format', metavar='EXT', default='svg',
+                    help='file type of call graphs (default svg)')
+
+
+
+def pytest_configure(config):
+    """
+    Register the pytest plugin if option ``--jonga`` is selected.
+    """
+
+    if config.getoption('jonga'):
+        config.pluginmanager.register(_pytest_plugin(config),
+                                      'jonga-tracer')
+
+
+
+def _pytest_plugin(config):
+    """
+    Construct the pytest plugin object that traces each test.
+    """
+
+    # Module pytest is only imported when required since it is only
+    # used by the pytest plugin, and is then already imported
+    import pytest
+
+    class CallTracerPlugin(object):
+
+        def __init__(self):
+            self.dir = os.path.abspath(config.getoption('jonga_dir'))
+            self.ext = '.' + config.getoption('jonga_format')
+            self.shrdir = os.path.join(self.dir, 'shards')
+            # Worker processes of pytest-xdist have this attribute
+            self.worker = hasattr(config, 'workerinput')
+            flt = config.getoption('jonga_filter')
+            self.ct = _CountingCallTracer(dstmodflt=flt)
+            self.suite = CallTracer(dstmodflt=flt)
+            self.cost = _call_cost(self.ct._config())
+            self.stats = []
+            os.makedirs(self.dir, exist_ok=True)
+            if not self.worker:
+                for fnm in glob(os.path.join(self.shrdir, 'jonga-*.shard')):
+                    os.remove(fnm)
+
+        @pytest.hookimpl(hookwrapper=True)
+        def pytest_runtest_call(self, item):
+            ct = self.ct
+            t0 = time.perf_counter()
+            with ContextCallTracer(ct):
+                yield
+            dt = time.perf_counter() - t0
+            ncall = sum(ct._edges.values())
+            # Calls that are not recorded also incur an overhead, which
+            # is usually smaller than that of recorded calls
+            ovh = ncall * self.cost[0] + (ct.nevent - ncall) * self.cost[1]
+            fnm = re.sub(r'[^\w.-]+', '_', item.nodeid) + self.ext
+            if ct._edges:
+                ct.dot(os.path.join(self.dir, fnm))
+            names = ct._names
+            for k, n in ct._edges.items():
+                self.suite._addcall(names[k >> _IDBITS], names[k & _IDMASK],
+                                    n)
+            # User properties are included in the test report, which
+            # pytest-xdist passes from worker processes to the controller
+            item.user_properties.append(
+                ('jonga', {'duration': dt, 'calls': ncall,
+                           'overhead': ovh,
+                           'graph': fnm if ct._edges else None}))
+
+        def pytest_runtest_logreport(self, report):
+            if report.when == 'call':
+                for k, v in report.user_properties:
+                    if k == 'jonga':
+                        self.stats.append((report.nodeid, v))
+
+        def pytest_sessionfinish(self, session):
+            if self.worker:
+                os.makedirs(self.shrdir, exist_ok=True)
+                self.suite._dump_shard(self.shrdir)
+                return
+            if os.path.isdir(self.shrdir):
+                self.suite.merge(self.shrdir)
+            else:
+                self.suite._build_group()
+            self.suite.dot(os.path.join(self.dir, 'suite' + self.ext))
+            self.suite.save(os.path.join(self.dir, 'suite.jtr'))
+            with open(os.path.join(self.dir, 'overhead.json'), 'w') as fd:
+                json.dump(dict(self.stats), fd, indent=1)
+
+        def pytest_terminal_summary(self, terminalreporter):
+            if self.worker:
+                return
+            tr = terminalreporter
+            tr.write_sep('=', 'jonga estimated tracing overhead (lower '
+                         'bound)')
+            tr.write_line('%12s %12s %10s  %s' % ('duration', 'overhead',
+                                                  'calls', 'test'))
+            for nodeid, v in sorted(self.stats, key=lambda s:
+                                    -s[1]['overhead'])[0:10]:
+                tr.write_line('%10.3fms %10.3fms %10d  %s' % (
+                    1e3 * v['duration'], 1e3 * v['overhead'], v['calls'],
+                    nodeid))
+            tr.write_line('Call graphs written to %s' % self.dir)
+
+    return CallTracerPlugin()
+
+
+
+class _CountingCallTracer(CallTracer):
+    """
+    A call tracer that also counts the call events that it processes,
+    whether or not the calls are recorded, for estimation of the
+    tracing overhead by the pytest plugin.
+    """
+
+    def reset(self):
+        """
+        Reset record of called functions, deleting all accumulated call
+        information and the count of call events.
+        """
+
+        super(_CountingCallTracer, self).reset()
+        # Number of call events processed
+        self.nevent = 0
+
+
+    def _record(self, frame, edges, src_frame=None):
+        """
+        Count the call event and record the call as for
+        :meth:`CallTracer._record`.
+        """
+
+        self.nevent += 1
+        return super(_CountingCallTracer, self)._record(frame, edges,
+                                                        src_frame)
+
+
+
+def _call_cost(cfg, n=20000):
+    """
+    Estimate the tracing overhead, in seconds, of each recorded call,
+    and of each call that is not recorded since the called function is
+    rejected by the filters, by a :class:`_CountingCallTracer` with the
+    specified configuration, by comparing the time of a sequence of
+    calls with and without tracing. The filters of the configuration
+    are replaced by filters that accept or reject all of the calls.
+    The calls are of a plain function, so the estimate is a lower bound
+    for calls of functions with closures, for which the outcome of
+    filtering is not cached.
+
+    Returns
+    -------
+    cost : tuple of float
+      Estimated overhead of each recorded call and of each call that is
+      not recorded
+    """
+
+    glbs = {'__name__': '_jonga_cost'}
+    exec(compile('def f():\n    pass\n\ndef run(n):\n    for _ in range(n):'
+                 '\n        f()\n', '<jonga>', 'exec'), glbs)
+    run = glbs['run']
+    t0 = time.perf_counter()
+    run(n)
+    t = time.perf_counter() - t0
+    cost = []
+    for dstmodflt in (None, '^(?!_jonga_cost$)'):
+        ct = _CountingCallTracer(**dict(cfg, srcmodflt=None,
+                                        dstmodflt=dstmodflt, srcqnmflt=None,
+                                        dstqnmflt=None, shrdir=None))
+        t0 = time.perf_counter()
+        ct.start()
+        run(n)
+        ct.stop()
+        cost.append(max(time.perf_counter() - t0 - t, 0.0) / n)
+    return tuple(cost)
+
+
+
+def main(argv=None):
+    """
+    Command line interface, run via ``python -m jonga``, which runs a
+    script, or a module if option ``-m`` is selected, with call tracing
+    and writes the call graph, or a trace file if the output file has
+    extension ``.jtr``, when the script exits. The filter options
+    correspond to the :class:`CallTracer` initialiser parameters. If
+    option ``--signal`` is selected, tracing is instead started and
+    stopped by each receipt of signal ``SIGUSR1``, and if options
+    ``--delay`` or ``--duration`` are selected, tracing is only
+    active within that time window after the start of the script.
+    The output file is written each time that tracing is stopped, so
+    that a slice of a long-running process can be captured without
+    restarting it.
+
+    Parameters
+    ----------
+    argv : None or list of strings, optional (default None)
+      Command line arguments. If None, :data:`sys.argv` is used.
+
+    Returns
+    -------
+    status : int
+      Exit status
+    """
+
+    # Module argparse is only imported when required since it is only
+    # used by the command line interface
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(
+        prog='python -m jonga', description='Run a Python script or '
+        'module with call tracing and write its call graph.')
+    parser.add_argument('-o', '--outfile', default='jonga.svg',
+                        help='output file: a graph file with type '
+                        'determined by its extension, or a trace file '
+                        'if the extension is .jtr (default jonga.svg)')
+    parser.add_argument('-m', '--module', action='store_true',
+                        help='run progname as a module')
+    for flt in ('srcmodflt', 'dstmodflt', 'srcqnmflt', 'dstqnmflt',
+                'grpflt'):
+        parser.add_argument('--' + flt, metavar='REGEX')
+    for sub in ('fnmsub', 'lnksub'):
+        parser.add_argument('--' + sub, nargs=2, metavar=('MATCH', 'REPL'))
+    parser.add_argument('--backend', choices=('settrace', 'monitoring'),
+                        default='settrace')
+    parser.add_argument('--threads', action='store_true',
+                        help='trace calls in all threads')
+    parser.add_argument('--timing', action='store_true',
+                        help='record the time spent in each call')
+    parser.add_argument('--signal', action='store_true',
+                        help='start and stop tracing on receipt of '
+                        'SIGUSR1 instead of at the start of the script')
+    parser.add_argument('--delay', type=float, metavar='SECONDS',
+                        help='start tracing after this time')
+    parser.add_argument('--duration', type=float, metavar='SECONDS',
+                        help='stop tracing after this time')
+    parser.add_argument('progname', help='script or module to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER,
+                        help='arguments passed to the script or module')
+    args = parser.parse_args(argv)
+    if (args.signal or args.delay or args.duration) and \
+       not hasattr(signal, 'SIGUSR1'):
+        parser.error('options --signal, --delay, and --duration are not '
+                     'supported on this platform')
+    if args.signal and (args.delay or args.duration):
+        parser.error('option --signal can not be combined with --delay '
+                     'or --duration')
+
+    ct = CallTracer(srcmodflt=args.srcmodflt, dstmodflt=args.dstmodflt,
+                    srcqnmflt=args.srcqnmflt, dstqnmflt=args.dstqnmflt,
+                    fnmsub=args.fnmsub, grpflt=args.grpflt,
+                    lnksub=args.lnksub, backend=args.backend,
+                    threads=args.threads, timing=args.timing)
+    outfile = os.path.abspath(args.outfile)
+    failed = False
+
+    # Tracing is started and stopped in signal handlers, which are
+    # always run in the main thread, so that the trace function is set
+    # for the thread that runs the script
+    def start(*_):
+        ct.start()
+
+    def stop(*_):
+        nonlocal failed
+        ct.stop()
+        # An error in writing the output file is reported rather than
+        # raised, since an exception raised in a signal handler would
+        # be raised in the script at an arbitrary point
+        try:
+            if outfile.endswith('.jtr'):
+                ct.save(outfile)
+            else:
+                ct.dot(outfile)
+        except Exception as exc:
+            failed = True
+            print('jonga: could not write %s: %s' % (outfile, exc),
+                  file=sys.stderr)
+
+    def toggle(*_):
+        if ct._tracing:
+            stop()
+        else:
+            start()
+
+    def window(*_):
+        if ct._tracing:
+            stop()
+        else:
+            start()
+            if args.duration:
+                signal.setitimer(signal.ITIMER_REAL, args.duration)
+
+    if args.module:
+        # Module runpy is only imported when required since it is only
+        # used to run a module
+        import runpy
+        sys.argv[:] = [args.progname] + args.args
+        code = compile('_run_module(_modname, run_name="__main__", '
+                       'alter_sys=True)', '<string>', 'exec')
+        globs = {'_run_module': runpy.run_module,
+                 '_modname': args.progname}
+    else:
+        sys.argv[:] = [args.progname] + args.args
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.progname)))
+        with open(args.progname, 'rb') as fd:
+            code = compile(fd.read(), args.progname, 'exec')
+        globs = {'__file__': args.progname, '__name__': '__main__',
+                 '__package__': None, '__cached__': None}
+
+    if args.signal:
+        signal.signal(signal.SIGUSR1, toggle)
+    elif args.delay or args.duration:
+        signal.signal(signal.SIGALRM, window)
+        if args.delay:
+            signal.setitimer(signal.ITIMER_REAL, args.delay)
+        else:
+            window()
+    else:
+        start()
+    status = 0
+    try:
+        exec(code, globs)
+    except SystemExit as e:
+        status = e.code
+    finally:
+        if args.delay or args.duration:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if ct._tracing:
+            stop()
+    # A failure to write the output file is indicated by the exit
+    # status unless the script exited with an error status
+    if failed and not status:
+        status = 1
+    return status
+
+
+
+def _fork_child():
+    """
+    Reset the call tracer, if any, inherited by a forked child process,
+    and arrange for its records to be written to a shard file on exit.
+    """
+
+    ct = _shard_tracer
+    if ct is not None:
+        ct.reset()
+        ct._register_shard()
+
+
+
+def _preparation_data(get_preparation_data):
+    """
+    Wrap :func:`multiprocessing.spawn.get_preparation_data` so that the
+    data passed to a spawned process includes the configuration of the
+    call tracer of its parent process, if it is tracing child processes.
+    """
+
+    def wrapper(name):
+        data = get_preparation_data(name)
+        cfg = os.environ.get(_SHARD_ENV)
+        if cfg is not None:
+            data['jonga'] = _SpawnConfig(cfg)
+        return data
+
+    return wrapper
+
+
+
+class _SpawnConfig(object):
+    """
+    Call tracer configuration included in the data passed to a process
+    spawned by :mod:`multiprocessing`, which starts a call tracer in
+    that process when it is unpickled there.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+
+    def __reduce__(self):
+        # The data is unpickled before the module search path of the
+        # parent process is restored, so this module must be importable
+        # via the initial module search path of the spawned process
+        return (_start_shard_tracer, (self.cfg, ))
+
+
+
+def _start_shard_tracer(cfg):
+    """
+    Start a call tracer in a child process with the configuration
+    passed by its parent process, unless one has already been started.
+    """
+
+    global _child_tracer
+
+    if _child_tracer is None:
+        ct = CallTracer(**json.loads(cfg))
+        _child_tracer = ct
+        ct.start()
+        ct._register_shard()
+
+
+
+def process_startup():
+    """
+    Start a call tracer if the configuration of a call tracer that
+    traces child processes (see parameter `shrdir` of
+    :class:`CallTracer`) has been passed by the parent process via the
+    environment. This is only necessary for child processes other than
+    those started by :func:`os.fork` or by :mod:`multiprocessing`,
+    such as Python processes started via :mod:`subprocess`, which can
+    be arranged by calling it from a ``sitecustomize`` module or a
+    ``.pth`` file, as in ::
+
+      import jonga; jonga.process_startup()
+
+    """
+
+    cfg = os.environ.get(_SHARD_ENV)
+    if cfg is not None:
+        _start_shard_tracer(cfg)
+
+
+
+if __name__ == '__main__':
+    # Run the command line interface via this module imported under its
+    # own name, so that the functions of the traced script, which is run
+    # as module __main__, are not excluded as functions of this module
+    import jonga
+    sys.exit(jonga.main())
@@ -44,11 +44,13 @@ setup(
     author           = 'Brendt Wohlberg',
     author_email     = 'brendt@ieee.org',
     data_files       = data,
+    entry_points     = {'pytest11': ['jonga = jonga']},
     python_requires  = '>= 3.3',
     setup_requires   = [],
     tests_require    = ['pytest', 'pytest-runner'],
-    install_requires = ['pygraphviz'],
+    install_requires = [],
     extras_require   = {
+        'graph': ['pygraphviz'],
         'tests': ['pytest', 'pytest-runner'],
         'docs': [ 'sphinx', 'numpydoc', 'sphinx_bootstrap_theme']},
     classifiers = [
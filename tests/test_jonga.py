@@ -1,10 +1,107 @@
 import os
+import sys
 import tempfile
 import re
 import pytest
+import multiprocessing
+import subprocess
+import asyncio
+import time
+import json
+import functools
+import gc
+import weakref
+import threading
+import shutil
+import io
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import jonga
 
 
+def compile_regex(n):
+    re.purge()
+    return re.compile(r'^[^\.]*.[^\.]%d' % n).pattern
+
+
+def spin(t):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < t:
+        pass
+
+
+def busy(t):
+    spin(t)
+
+
+def chain1():
+    chain2()
+
+
+def chain2():
+    chain3()
+
+
+def chain3():
+    spin(0.0)
+
+
+def recurse(n):
+    if n > 0:
+        recurse(n - 1)
+    else:
+        spin(0.0)
+
+
+def deco(fnc):
+    @functools.wraps(fnc)
+    def wrapper(*args, **kwargs):
+        return fnc(*args, **kwargs)
+    return wrapper
+
+
+@deco
+def foo():
+    pass
+
+
+@deco
+def bar():
+    pass
+
+
+def decorated():
+    foo()
+    bar()
+    bar()
+
+
+class Base(object):
+
+    def step(self):
+        spin(0.0)
+
+
+class Derived(Base):
+
+    def step(self):
+        super().step()
+
+
+async def inner():
+    await asyncio.sleep(0)
+
+
+async def outer():
+    await inner()
+    await asyncio.sleep(0)
+
+
+async def main():
+    await asyncio.create_task(outer(), name='task1')
+    await asyncio.gather(outer(), inner())
+
+
+
 class TestSet01(object):
 
     def test_01(self):
@@ -46,3 +143,807 @@ class TestSet01(object):
             rec = re.compile(r'^[^\.]*.[^\.]*')
         assert os.path.getsize(pth) > 0
         os.remove(pth)
+
+
+    def test_05(self):
+        def mkfnc(n):
+            def fnc():
+                return n, sys._getframe()
+            return fnc
+        fncs = [mkfnc(n) for n in range(3)]
+        cache = {}
+        for n in (0, 1, 2, 1):
+            frame = fncs[n]()[1]
+            assert jonga.current_function(frame) is fncs[n]
+            assert jonga.current_function(frame, cache) is fncs[n]
+        assert len(cache) == 1
+
+
+    @pytest.mark.skipif(sys.version_info < (3, 12),
+                        reason='sys.monitoring requires Python 3.12')
+    def test_06(self):
+        calls = []
+        for backend in ('settrace', 'monitoring'):
+            ct = jonga.CallTracer(dstmodflt='^(re.|sre_)', backend=backend)
+            re.purge()
+            ct.start()
+            rec = re.compile(r'^[^\.]*.[^\.]*')
+            ct.stop()
+            calls.append(set(ct.calls))
+        assert calls[0] == calls[1]
+        with pytest.raises(ValueError):
+            jonga.CallTracer(backend='setprofile')
+
+
+    def test_07(self):
+        ct = jonga.CallTracer(srcmodflt='^xmpl')
+        re.purge()
+        ct.start()
+        rec = re.compile(r'^[^\.]*.[^\.]*')
+        ct.stop()
+        assert ct.calls == {}
+        # Results are unchanged when calls are filtered using the
+        # outcomes of earlier filtering
+        ct = jonga.CallTracer(dstmodflt='^(re.|sre_)')
+        calls = []
+        for n in range(2):
+            re.purge()
+            ct.start()
+            rec = re.compile(r'^[^\.]*.[^\.]*')
+            ct.stop()
+            calls.append(dict(ct.calls))
+        assert calls[0]
+        assert set(calls[1]) == set(calls[0])
+        assert all(calls[1][k] == 2 * calls[0][k] for k in calls[0])
+        assert all(k[1].startswith(('re.', 'sre_')) for k in calls[0])
+
+
+    def test_08(self):
+        ct = jonga.CallTracer(dstmodflt='^(re.|sre_)', threads=True,
+                              grpthr=True)
+        re.purge()
+        ct.start()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.map(lambda n: re.compile(r'^[^\.]*.[^\.]%d' % n), range(4))
+        ct.stop()
+        thrnms = set(sum(ct.thread.values(), []))
+        assert any(nm.startswith('ThreadPoolExecutor') for nm in thrnms)
+        assert set(ct.group) <= thrnms
+        assert sum(len(v) for v in ct.group.values()) == len(ct.fncts)
+
+
+    def test_09(self):
+        import multiprocessing.spawn
+        prep = multiprocessing.spawn.get_preparation_data
+        for method in multiprocessing.get_all_start_methods():
+            with tempfile.TemporaryDirectory() as pth:
+                ct = jonga.CallTracer(dstmodflt='^(re.|sre_)',
+                                      grpflt=r'^[^\.]*', shrdir=pth)
+                ct.start()
+                ctx = multiprocessing.get_context(method)
+                with ProcessPoolExecutor(max_workers=2,
+                                         mp_context=ctx) as pool:
+                    list(pool.map(compile_regex, range(4)))
+                ct.stop()
+                assert multiprocessing.spawn.get_preparation_data is prep
+                assert ct.calls == {}
+                assert os.listdir(pth)
+                ct.merge(pth)
+                assert ct.calls != {}
+                assert 're' in ct.group
+        # Other child processes are only traced if they call
+        # process_startup
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(jonga.__file__)
+        with tempfile.TemporaryDirectory() as pth:
+            ct = jonga.CallTracer(dstmodflt='^(re.|sre_)', shrdir=pth)
+            ct.start()
+            env[jonga._SHARD_ENV] = os.environ[jonga._SHARD_ENV]
+            ct.stop()
+            code = 'import re, jonga; re.purge(); re.compile("a+b")'
+            subprocess.run([sys.executable, '-c', code], env=env,
+                           check=True)
+            assert os.listdir(pth) == []
+            code = 'import jonga; jonga.process_startup(); ' + code
+            subprocess.run([sys.executable, '-c', code], env=env,
+                           check=True)
+            ct.merge(pth)
+            assert ct.calls != {}
+
+
+    def test_10(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, aio=True, grptsk=True)
+        ct.start()
+        asyncio.run(main())
+        ct.stop()
+        nm = __name__ + '.'
+        assert ct.calls[(nm + 'main', nm + 'outer')] == 2
+        assert ct.calls[(nm + 'main', nm + 'inner')] == 1
+        assert ct.calls[(nm + 'outer', nm + 'inner')] == 2
+        assert ct.resume[nm + 'outer'] >= 2
+        assert nm + 'outer' in ct.group['task1']
+        with pytest.raises(ValueError):
+            jonga.CallTracer(threads=True, aio=True)
+
+
+    def test_11(self):
+        ct = jonga.SamplingCallTracer(srcmodflt=__name__, interval=0.001,
+                                      grpflt=r'^[^\.]*')
+        ct.start()
+        busy(0.2)
+        ct.stop()
+        nm = __name__ + '.'
+        assert ct.calls[(nm + 'busy', nm + 'spin')] > 0
+        assert ct.nsample > 0
+        assert 0.0 <= ct.overhead()
+        assert __name__ in ct.group
+        assert ct.graph() is not None
+
+
+    def test_12(self):
+        ct = jonga.CallTracer(srcmodflt=__name__)
+        ct.start()
+        busy(0.01)
+        ct.stop()
+        nm = __name__ + '.'
+        n = ct.calls[(nm + 'busy', nm + 'spin')]
+        assert n > 0
+        assert ct.fncts[nm + 'spin'][1] == n
+        assert sum([c[0] for c in ct.fncts.values()]) >= \
+            sum(ct.calls.values())
+        assert len(ct.fncts) == len(list(ct.fncts))
+        with pytest.raises(TypeError):
+            ct.calls[(nm + 'busy', nm + 'spin')] = 0
+        with pytest.raises(KeyError):
+            ct.fncts['nonexistent']
+
+
+    def test_13(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, timing=True)
+        ct.start()
+        busy(0.05)
+        ct.stop()
+        nm = __name__ + '.'
+        tbusy = ct.ftime[nm + 'busy']
+        assert tbusy[0] >= 0.05
+        assert tbusy[1] <= tbusy[0]
+        assert ct.ctime[(nm + 'busy', nm + 'spin')] <= tbusy[0]
+        assert ct.graph(timesc='both') is not None
+        ct = jonga.CallTracer(srcmodflt=__name__, timing=True, threads=True)
+        ct.start()
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            list(ex.map(busy, [0.02, 0.02]))
+        ct.stop()
+        assert ct.ftime[nm + 'spin'][0] >= 0.04
+        with pytest.raises(ValueError):
+            jonga.CallTracer(timing=True, aio=True)
+
+
+    def test_14(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, grpflt=r'^[^\.]*',
+                              lnksub=(r'^(.*)$', r'\1.html'))
+        ct.start()
+        busy(0.01)
+        ct.stop()
+        fd, pth = tempfile.mkstemp(suffix='.dot')
+        os.close(fd)
+        src = ct.dot(pth)
+        with open(pth) as fd:
+            assert fd.read() == src
+        os.remove(pth)
+        assert jonga._dot_id('a\\"b\\') == r'"a\\\"b\\"'
+        g = ct.graph()
+        nm = __name__ + '.'
+        assert set(g.nodes()) == set(ct.fncts)
+        assert g.has_edge(nm + 'busy', nm + 'spin')
+        assert g.get_node(nm + 'busy').attr['href'] == nm + 'busy.html'
+        assert g.get_subgraph('cluster_' + __name__) is not None
+
+
+    def test_15(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(jonga.__file__)
+        out = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                              'import jonga'], env=env, check=True,
+                             stderr=subprocess.PIPE).stderr.decode()
+        mods = {}
+        for line in out.splitlines()[1:]:
+            fld = line.split('|')
+            mods[fld[2].strip()] = int(fld[1])
+        assert 'pygraphviz' not in mods
+        assert 'asyncio' not in mods
+        # Cumulative import time in microseconds
+        assert mods['jonga'] < 1000000
+        # Tracing is possible without pygraphviz
+        subprocess.run([sys.executable, '-c', 'import sys; '
+                        'sys.modules["pygraphviz"] = None; import jonga; '
+                        'ct = jonga.CallTracer(); ct.start(); ct.stop(); '
+                        'ct.dot()'], env=env, check=True)
+
+
+    def test_16(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, grpflt=r'^[^\.]*')
+        ct.start()
+        busy(0.01)
+        ct.stop()
+        fd, pth = tempfile.mkstemp(suffix='.dot')
+        os.close(fd)
+        g = ct.graph(pth)
+        assert not g.has_layout
+        with open(pth) as fd:
+            assert 'pos=' not in fd.read()
+        g = ct.graph(pth, pos=True)
+        assert g.has_layout
+        with open(pth) as fd:
+            assert 'pos=' in fd.read()
+        os.remove(pth)
+
+
+    def test_17(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, grpflt=r'^[^\.]*')
+        ct.start()
+        busy(0.01)
+        ct.stop()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = jonga.RenderCache(os.path.join(tmp, 'cache'))
+            pth0 = os.path.join(tmp, 'g0.svg')
+            pth1 = os.path.join(tmp, 'g1.svg')
+            assert ct.graph(pth0, cache=cache) is not None
+            # The graph is not constructed if a cached file is used
+            assert ct.graph(pth1, cache=cache) is None
+            assert cache.hits == 1 and cache.misses == 1
+            with open(pth0) as fd0, open(pth1) as fd1:
+                assert fd0.read() == fd1.read()
+            ct.graph(pth1, cache=cache, rmsz=True)
+            assert cache.misses == 2
+            assert cache.stats()['files'] == 2
+            cache.maxsize = cache.size() - 1
+            ct.graph(os.path.join(tmp, 'g.dot'), cache=cache)
+            assert cache.evictions >= 1
+            assert cache.size() <= cache.maxsize
+
+
+    def test_18(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, grpflt=r'^[^\.]*',
+                              timing=True)
+        ct.start()
+        busy(0.01)
+        ct.stop()
+        nm = __name__ + '.'
+        with tempfile.TemporaryDirectory() as tmp:
+            pth = os.path.join(tmp, 'trace.jtr')
+            ct.save(pth)
+            ld = jonga.CallTracer()
+            ld.load(pth)
+            assert dict(ld.calls) == dict(ct.calls)
+            assert dict(ld.fncts) == dict(ct.fncts)
+            assert ld.group == ct.group
+            assert ld.ctime == ct.ctime
+            n = ct.calls[(nm + 'busy', nm + 'spin')]
+            ct.start()
+            busy(0.01)
+            ct.stop()
+            ct.save(pth, append=True, compress=False)
+            ld = jonga.CallTracer()
+            ld.load(pth)
+            assert ld.calls[(nm + 'busy', nm + 'spin')] == 2 * n
+            assert dict(ld.calls) == dict(ct.calls)
+            with pytest.raises(ValueError):
+                jonga.CallTracer().save(pth, append=True)
+
+
+    def test_19(self):
+        ref = jonga.CallTracer(srcmodflt=__name__)
+        ref.start()
+        for n in range(100):
+            busy(0.0)
+        ref.stop()
+        nm = __name__ + '.'
+        with tempfile.TemporaryDirectory() as tmp:
+            pth = os.path.join(tmp, 'events.jtr')
+            ct = jonga.CallTracer(srcmodflt=__name__, evlog=pth, evbuf=64)
+            ct.start()
+            for n in range(100):
+                busy(0.0)
+            ct.stop()
+            assert ct.calls == {}
+            ld = jonga.CallTracer()
+            ld.load(pth)
+            assert dict(ld.calls) == dict(ref.calls)
+            assert ld.calls[(nm + 'busy', nm + 'spin')] == 100
+            pth = os.path.join(tmp, 'thread.jtr')
+            ct = jonga.CallTracer(srcmodflt=__name__, evlog=pth, evbuf=64,
+                                  threads=True)
+            ct.start()
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                list(ex.map(busy, [0.01, 0.01]))
+            ct.stop()
+            ld = jonga.CallTracer(threads=True, grpthr=True)
+            ld.load(pth)
+            thrnms = ld.thread[(nm + 'busy', nm + 'spin')]
+            assert any(t.startswith('ThreadPoolExecutor') for t in thrnms)
+            assert set(ld.group) <= set(thrnms)
+        with pytest.raises(ValueError):
+            jonga.CallTracer(evlog='events.jtr', timing=True)
+
+
+    def test_20(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, grpflt=r'^[^\.]*')
+        ct.start()
+        chain1()
+        for n in range(3):
+            busy(0.0)
+        ct.stop()
+        nm = __name__ + '.'
+        root = nm + 'TestSet01.test_20'
+        pr = ct.prune(topk=2)
+        assert set(pr.calls) == {(root, nm + 'busy'),
+                                 (nm + 'busy', nm + 'spin')}
+        assert set(sum(pr.group.values(), [])) == set(pr.fncts)
+        pr = ct.prune(mincount=4)
+        assert set(pr.calls) == {(root, nm + 'busy'),
+                                 (nm + 'busy', nm + 'spin')}
+        pr = ct.prune(roots=[nm + 'chain2'], depth=1)
+        assert dict(pr.calls) == {(nm + 'chain2', nm + 'chain3'): 1}
+        pr = ct.prune(depth=2)
+        assert (nm + 'chain1', nm + 'chain2') in pr.calls
+        assert (nm + 'chain2', nm + 'chain3') not in pr.calls
+        pr = ct.prune(collapse=True)
+        cnm = nm + 'chain1 ... ' + nm + 'chain3'
+        assert pr.calls[(root, cnm)] == 1
+        assert pr.calls[(cnm, nm + 'spin')] == 1
+        assert pr.calls[(root, nm + 'busy')] == 3
+        assert cnm in pr.group[__name__]
+        assert pr.dot() != ''
+
+
+    def test_21(self):
+        ct = jonga.CallTracer(srcmodflt=__name__,
+                              lnksub=(r'^(.*)$', r'\1.html'))
+        ct.start()
+        chain1()
+        for n in range(3):
+            busy(0.0)
+        ct.stop()
+        nm = __name__ + '.'
+        root = nm + 'TestSet01.test_21'
+        grpflt = r'^[^\.]*\.(chain|busy|spin)'
+        ov = ct.condense(grpflt)
+        assert dict(ov.calls) == {(root, 'chain'): 1, ('chain', 'spin'): 1,
+                                  (root, 'busy'): 3, ('busy', 'spin'): 3}
+        dt = ct.expand('chain', grpflt)
+        assert dict(dt.calls) == {(root, nm + 'chain1'): 1,
+                                  (nm + 'chain1', nm + 'chain2'): 1,
+                                  (nm + 'chain2', nm + 'chain3'): 1,
+                                  (nm + 'chain3', 'spin'): 1}
+        assert set(dt.group['chain']) == {nm + 'chain1', nm + 'chain2',
+                                          nm + 'chain3'}
+        with tempfile.TemporaryDirectory() as tmp:
+            fnms = ct.hierarchy(tmp, ext='.dot', grpflt=grpflt)
+            assert set(fnms) == {None, 'chain', 'busy', 'spin'}
+            with open(fnms[None]) as fd:
+                src = fd.read()
+            assert 'href="chain.dot"' in src
+            assert 'href="%s.html"' % root in src
+            with open(fnms['chain']) as fd:
+                src = fd.read()
+            assert 'href="spin.dot"' in src
+            assert 'href="%schain1.html"' % nm in src
+        ct.group = {'index': [nm + 'chain1', nm + 'chain2', nm + 'chain3'],
+                    '../busy': [nm + 'busy'], 'spin#1': [nm + 'spin']}
+        with tempfile.TemporaryDirectory() as tmp:
+            fnms = ct.hierarchy(tmp, ext='.dot')
+            assert {k: os.path.relpath(v, tmp) for k, v in fnms.items()} == \
+                {None: 'index.dot', 'index': 'index_1.dot',
+                 '../busy': '.._busy.dot', 'spin#1': 'spin_1.dot'}
+            with open(fnms[None]) as fd:
+                src = fd.read()
+            assert 'href="index_1.dot"' in src
+            assert 'href=".._busy.dot"' in src
+
+
+    def test_22(self):
+        ct = jonga.CallTracer(srcmodflt=__name__, cct=True)
+        ct.start()
+        recurse(3)
+        busy(0.0)
+        busy(0.0)
+        ct.stop()
+        nm = __name__ + '.'
+        root = nm + 'TestSet01.test_22'
+        cct = ct.contexts()
+        rec = (root,) + (nm + 'recurse',) * 4
+        assert cct[rec] == 1
+        assert cct[rec + (nm + 'spin',)] == 1
+        assert cct[(root, nm + 'busy', nm + 'spin')] == 2
+        assert ct.calls[(nm + 'recurse', nm + 'recurse')] == 3
+        src = ct.collapsed()
+        assert '%s;%s;%s 2\n' % (root, nm + 'busy', nm + 'spin') in src
+        ct = jonga.CallTracer(srcmodflt=__name__, cct=True, cctdepth=3)
+        ct.start()
+        recurse(3)
+        ct.stop()
+        assert max([len(p) for p in ct.contexts()]) == 3
+        with pytest.raises(ValueError):
+            jonga.CallTracer(cct=True, timing=True)
+
+
+    def test_23(self):
+        nm = __name__ + '.'
+        root = nm + 'TestSet01.test_23'
+        ct = jonga.CallTracer(srcmodflt=__name__, cct=True)
+        ct.start()
+        recurse(2)
+        busy(0.0)
+        ct.stop()
+        with tempfile.TemporaryDirectory() as tmp:
+            pth = os.path.join(tmp, 'prof.speedscope.json')
+            ct.speedscope(pth)
+            with open(pth) as fd:
+                prf = json.load(fd)
+            frames = [f['name'] for f in prf['shared']['frames']]
+            smp = prf['profiles'][0]['samples']
+            wgt = prf['profiles'][0]['weights']
+            assert len(smp) == len(wgt) == len(ct.contexts())
+            assert [frames[i] for i in smp[-1]] == [root, nm + 'busy',
+                                                    nm + 'spin']
+            assert prf['profiles'][0]['endValue'] == sum(wgt)
+            pth = os.path.join(tmp, 'chart.json')
+            ct.chrome(pth)
+            with open(pth) as fd:
+                evs = json.load(fd)['traceEvents']
+            top = [e for e in evs if e['name'] == root][0]
+            assert top['dur'] == sum(ct.contexts().values())
+            assert all(e['ph'] == 'X' for e in evs)
+            pth = os.path.join(tmp, 'events.jtr')
+            ct = jonga.CallTracer(srcmodflt=__name__, evlog=pth, evbuf=4,
+                                  threads=True)
+            ct.start()
+            busy(0.0)
+            busy(0.0)
+            ct.stop()
+            ct.chrome(os.path.join(tmp, 'trace.json'))
+            with open(os.path.join(tmp, 'trace.json')) as fd:
+                evs = json.load(fd)['traceEvents']
+            assert len([e for e in evs if e['ph'] == 'i']) == 4
+            assert any(e['ph'] == 'M' for e in evs)
+            # Events of a thread with a buffer written after that of
+            # another thread with later events
+            pth = os.path.join(tmp, 'threads.jtr')
+            ct = jonga.CallTracer(srcmodflt=__name__, evlog=pth, evbuf=16,
+                                  threads=True)
+            ct.start()
+            thr = threading.Thread(target=busy, args=(0.0,))
+            thr.start()
+            thr.join()
+            for n in range(100):
+                busy(0.0)
+            ct.stop()
+            ct.chrome(os.path.join(tmp, 'trace.json'))
+            with open(os.path.join(tmp, 'trace.json')) as fd:
+                evs = json.load(fd)['traceEvents']
+            assert min(e['ts'] for e in evs if e['ph'] == 'i') == 0
+
+
+    def test_24(self):
+        xpth = os.path.join(os.path.dirname(__file__), '..', 'examples')
+        sys.path.insert(0, xpth)
+        try:
+            import xmpl
+        finally:
+            sys.path.remove(xpth)
+        ct = jonga.CallTracer(srcmodflt='^xmpl')
+        ct.start()
+        c = xmpl.C()
+        ct.stop()
+        ctr = jonga.CallTracer(srcmodflt='^xmpl')
+        ctr.start()
+        c.run()
+        ctr.stop()
+        with tempfile.TemporaryDirectory() as tmp:
+            sct = jonga.StaticCallTracer(srcmodflt='^xmpl', nproc=1,
+                                         cache=os.path.join(tmp, 'cache'))
+            sct.analyse(os.path.join(xpth, 'xmpl.py'), entry=['xmpl.C'])
+            assert dict(sct.calls) == dict(ct.calls)
+            assert sct.nparsed == 1
+            sct.reset()
+            sct.analyse(os.path.join(xpth, 'xmpl.py'), entry=['xmpl.C.run'])
+            assert dict(sct.calls) == dict(ctr.calls)
+            assert sct.ncached == 1
+            pkg = os.path.join(tmp, 'spkg')
+            os.mkdir(pkg)
+            with open(os.path.join(pkg, '__init__.py'), 'w') as fd:
+                fd.write('')
+            with open(os.path.join(pkg, 'base.py'), 'w') as fd:
+                fd.write('class Base:\n    def f(self):\n        self.g()\n'
+                         '    def g(self):\n        pass\n')
+            with open(os.path.join(pkg, 'derived.py'), 'w') as fd:
+                fd.write('from .base import Base\n\nclass D(Base):\n'
+                         '    def g(self):\n        super().g()\n\n'
+                         'def main():\n    D().f()\n    helper()\n\n'
+                         'def helper():\n    pass\n')
+            sct = jonga.StaticCallTracer(nproc=2)
+            sct.analyse(pkg, entry=['spkg.derived.main'])
+            assert sct.nparsed == 3
+            assert set(sct.calls) == {
+                ('spkg.derived.main', 'spkg.derived.helper'),
+                ('spkg.derived.main', 'spkg.base.Base.f'),
+                ('spkg.base.Base.f', 'spkg.derived.D.g'),
+                ('spkg.derived.D.g', 'spkg.base.Base.g')}
+
+
+    def test_25(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            mod = os.path.join(tmp, 'snpmod.py')
+            with open(mod, 'w') as fd:
+                fd.write('def f():\n    g()\n\ndef g():\n    pass\n')
+            sys.path.insert(0, tmp)
+            try:
+                code = 'import snpmod\nsnpmod.f()'
+                cfg = {'tracer': {'srcmodflt': '^snpmod'}}
+                imgdir = os.path.join(tmp, 'img')
+                fnm, deps = jonga._snippet_graph(code, cfg, imgdir,
+                                                 ext='.dot')
+                assert deps == [mod]
+                with open(os.path.join(imgdir, fnm)) as fd:
+                    assert '"snpmod.f" -> "snpmod.g"' in fd.read()
+                assert jonga._snippet_graph(code, cfg, imgdir, deps,
+                                            ext='.dot')[0] == fnm
+                st = os.stat(mod)
+                os.utime(mod, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+                assert jonga._snippet_graph(code, cfg, imgdir, deps,
+                                            ext='.dot')[0] != fnm
+                cfg = {'tracer': {}, 'static': [mod],
+                       'entry': ['snpmod.f']}
+                fnm, deps = jonga._snippet_graph('', cfg, imgdir,
+                                                 ext='.dot')
+                with open(os.path.join(imgdir, fnm)) as fd:
+                    assert '"snpmod.f" -> "snpmod.g"' in fd.read()
+            finally:
+                sys.path.remove(tmp)
+                sys.modules.pop('snpmod', None)
+
+
+    def test_26(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(jonga.__file__)
+        with tempfile.TemporaryDirectory() as tmp:
+            scr = os.path.join(tmp, 'scr.py')
+            with open(scr, 'w') as fd:
+                fd.write('import os, signal, sys\n'
+                         'def f():\n    g()\n\ndef g():\n    pass\n\n'
+                         'def h():\n    pass\n\n'
+                         'f()\n'
+                         'if sys.argv[1:] == ["sig"]:\n'
+                         '    os.kill(os.getpid(), signal.SIGUSR1)\n'
+                         '    h()\n'
+                         '    os.kill(os.getpid(), signal.SIGUSR1)\n'
+                         '    f()\n')
+            cmd = [sys.executable, '-m', 'jonga', '--srcmodflt',
+                   '^__main__']
+            pth = os.path.join(tmp, 'scr.dot')
+            subprocess.run(cmd + ['-o', pth, scr], env=env, check=True)
+            with open(pth) as fd:
+                src = fd.read()
+            assert '"__main__.f" -> "__main__.g"' in src
+            assert '"__main__.h"' not in src
+            pth = os.path.join(tmp, 'scr.jtr')
+            subprocess.run(cmd + ['-o', pth, '--signal', scr, 'sig'],
+                           env=env, check=True)
+            ct = jonga.CallTracer()
+            ct.load(pth)
+            # The name of the module level code of the script differs
+            # between Python versions
+            ((src, dst), ) = ct.calls
+            assert src.endswith('<module>') and dst == '__main__.h'
+            pth = os.path.join(tmp, 'nodir', 'scr.jtr')
+            prc = subprocess.run(cmd + ['-o', pth, '--signal', scr, 'sig'],
+                                 env=env, stderr=subprocess.PIPE)
+            assert prc.returncode == 1
+            assert b'jonga: could not write' in prc.stderr
+
+
+    def test_27(self):
+        env = dict(os.environ)
+        with tempfile.TemporaryDirectory() as tmp:
+            # The existing path is retained since pytest may only be
+            # importable via it
+            env['PYTHONPATH'] = os.pathsep.join(
+                [os.path.dirname(jonga.__file__), tmp] +
+                ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+            with open(os.path.join(tmp, 'ptmod.py'), 'w') as fd:
+                fd.write('def f():\n    g()\n\ndef g():\n    pass\n')
+            with open(os.path.join(tmp, 'test_ptmod.py'), 'w') as fd:
+                fd.write('import ptmod\n\ndef test_a():\n    ptmod.f()\n\n'
+                         'def test_b():\n    ptmod.g()\n')
+            out = os.path.join(tmp, 'out')
+            res = subprocess.run([sys.executable, '-m', 'pytest', '-p',
+                                  'jonga', '--jonga', '--jonga-filter',
+                                  '^ptmod', '--jonga-format', 'dot',
+                                  '--jonga-dir', out, '-p',
+                                  'no:cacheprovider',
+                                  os.path.join(tmp, 'test_ptmod.py')],
+                                 env=env, cwd=tmp, stdout=subprocess.PIPE)
+            assert res.returncode == 0
+            assert b'estimated tracing overhead' in res.stdout
+            with open(os.path.join(out, 'test_ptmod.py_test_a.dot')) as fd:
+                src = fd.read()
+            assert '"test_ptmod.test_a" -> "ptmod.f"' in src
+            assert '"ptmod.g"' in src and 'test_b' not in src
+            ct = jonga.CallTracer()
+            ct.load(os.path.join(out, 'suite.jtr'))
+            assert set(ct.calls) == {('test_ptmod.test_a', 'ptmod.f'),
+                                     ('ptmod.f', 'ptmod.g'),
+                                     ('test_ptmod.test_b', 'ptmod.g')}
+            with open(os.path.join(out, 'overhead.json')) as fd:
+                ovh = json.load(fd)
+            assert ovh['test_ptmod.py::test_a']['calls'] == 2
+            assert ovh['test_ptmod.py::test_a']['overhead'] > 0
+
+
+    def test_28(self):
+        for backend in ('settrace', 'monitoring'):
+            ct = jonga.CallTracer(srcmodflt=__name__, backend=backend)
+            ct.start()
+            decorated()
+            decorated()
+            ct.stop()
+            nm = __name__ + '.'
+            assert ct.calls[(nm + 'decorated', nm + 'foo')] == 2
+            assert ct.calls[(nm + 'decorated', nm + 'bar')] == 4
+            ct = jonga.CallTracer(srcmodflt=__name__, dstqnmflt='^bar',
+                                  backend=backend)
+            ct.start()
+            decorated()
+            ct.stop()
+            assert (nm + 'decorated', nm + 'foo') not in ct.calls
+            assert ct.calls[(nm + 'decorated', nm + 'bar')] == 2
+            assert [os.path.realpath(p) for p in ct.sources()] == \
+                [os.path.realpath(__file__)]
+
+
+    def test_29(self):
+        refs = []
+
+        def track(task):
+            refs.append(weakref.ref(task))
+            return task
+
+        async def run():
+            # Tasks are not bound to local variables, which may be
+            # retained by frame local variable snapshots before Python
+            # 3.13
+            for n in range(3):
+                await track(asyncio.create_task(outer(), name='task%d' % n))
+            # Allow the done callbacks of the last task to run
+            await asyncio.sleep(0)
+            gc.collect()
+            return [ref() for ref in refs]
+
+        ct = jonga.CallTracer(srcmodflt=__name__, aio=True, grptsk=True)
+        ct.start()
+        alive = asyncio.run(run())
+        ct.stop()
+        # Tasks that are done are not retained while tracing
+        assert alive == [None, None, None]
+        nm = __name__ + '.'
+        assert ct.calls[(nm + 'outer', nm + 'inner')] == 3
+        assert nm + 'inner' in sum(ct.group.values(), [])
+
+
+    def test_30(self):
+        nm = __name__ + '.'
+        with tempfile.TemporaryDirectory() as tmp:
+            pth = os.path.join(tmp, 'events.jtr')
+            ct = jonga.CallTracer(srcmodflt=__name__, evlog=pth, evbuf=4,
+                                  threads=True)
+            ct.start()
+            # Threads run one after another, so that thread identifiers
+            # are typically reused
+            for n in range(3):
+                thr = threading.Thread(target=busy, args=(0.0,),
+                                       name='worker%d' % n)
+                thr.start()
+                thr.join()
+            ct.stop()
+            ld = jonga.CallTracer(threads=True)
+            ld.load(pth)
+            thrnms = ld.thread[(nm + 'busy', nm + 'spin')]
+            assert sorted(thrnms) == ['worker0', 'worker1', 'worker2']
+
+
+    def test_31(self):
+        for backend in ('settrace', 'monitoring'):
+            ct = jonga.CallTracer(srcmodflt=__name__, backend=backend)
+            ct.start()
+            for n in range(3):
+                Derived().step()
+            ct.stop()
+            nm = __name__ + '.'
+            assert ct.calls[(nm + 'Derived.step', nm + 'Base.step')] == 3
+            # Methods calling super have a __class__ free variable, but
+            # the filtering outcome of their calls is cached
+            code = Derived.step.__code__
+            assert code.co_freevars == ('__class__',)
+            assert ct._fltcache[id(Base.step.__code__)][2][id(code)][1]
+
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                        reason='fork start method not available')
+    def test_32(self):
+        ctx = multiprocessing.get_context('fork')
+        for opts in ({'timing': True}, {'cct': True}):
+            with tempfile.TemporaryDirectory() as pth:
+                ct = jonga.CallTracer(dstmodflt='^(re.|sre_)', shrdir=pth,
+                                      **opts)
+                ct.start()
+                # The pool is closed rather than terminated so that the
+                # worker processes write their shard files on exit
+                pool = ctx.Pool(2)
+                pool.map(compile_regex, range(4))
+                pool.close()
+                pool.join()
+                ct.stop()
+                assert os.listdir(pth)
+                ct.merge(pth)
+                assert ct.calls != {}
+
+
+    def test_33(self):
+        def tracer(frame, event, arg):
+            return None
+
+        prev = sys.gettrace()
+        sys.settrace(tracer)
+        try:
+            for opts in ({}, {'threads': True}, {'timing': True}):
+                ct = jonga.CallTracer(srcmodflt=__name__, **opts)
+                ct.start()
+                busy(0.0)
+                ct.stop()
+                # An existing trace function is restored
+                assert sys.gettrace() is tracer
+                assert ct.calls != {}
+        finally:
+            sys.settrace(prev)
+
+
+    @pytest.mark.skipif(shutil.which('dot') is None,
+                        reason='Graphviz dot not available')
+    def test_34(self):
+        sphinx_app = pytest.importorskip('sphinx.application')
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'src')
+            os.makedirs(src)
+            with open(os.path.join(src, 'conf.py'), 'w') as fd:
+                fd.write("extensions = ['jonga']\n")
+            with open(os.path.join(src, 'index.rst'), 'w') as fd:
+                fd.write('Index\n=====\n')
+            with open(os.path.join(src, 'graph.rst'), 'w') as fd:
+                fd.write(':orphan:\n\nGraph\n=====\n\n'
+                         '.. jonga-graph::\n   :dstmodflt: ^json\n\n'
+                         '   import json\n   json.dumps([1])\n')
+
+            def build(warning=None):
+                app = sphinx_app.Sphinx(src, src, os.path.join(tmp, 'out'),
+                                        os.path.join(tmp, 'doctrees'),
+                                        'html', status=None, warning=warning)
+                app.build()
+                return app
+
+            env = build().env
+            assert list(env.jonga_docs) == ['graph']
+            assert set(env.jonga_deps) == env.jonga_docs['graph']
+            with open(os.path.join(tmp, 'out', 'graph.html')) as fd:
+                assert 'data="_images/jonga/jonga-' in fd.read()
+            # Dependencies of removed documents are discarded
+            os.remove(os.path.join(src, 'graph.rst'))
+            env = build().env
+            assert env.jonga_docs == {} and env.jonga_deps == {}
+            # An error in a snippet is reported in the document
+            with open(os.path.join(src, 'graph.rst'), 'w') as fd:
+                fd.write(':orphan:\n\nGraph\n=====\n\n'
+                         '.. jonga-graph::\n\n   1 / 0\n')
+            warning = io.StringIO()
+            build(warning)
+            assert 'ZeroDivisionError' in warning.getvalue()